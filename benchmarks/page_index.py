@@ -0,0 +1,99 @@
+"""Memory taken by the page index of a large hierarchy.
+
+The index is compared to the previous layout: pages without slots, and (space, title) keys per page.
+
+Usage: python -m benchmarks.page_index [PAGE_COUNT]
+"""
+import dataclasses as dc
+import gc
+import json
+import sys
+import tracemalloc
+import typing as tp
+
+from confluence_sync import context
+
+
+@dc.dataclass
+class DictPage:
+	src_id: str
+	src_space: str
+	src_title: str
+	dst_id: str | None = None
+	src_parent_id: str | None = None
+
+
+class TupleKeyPageIndex:
+	def __init__(self) -> None:
+		self._page_id_map = {}
+		self._page_title_map = {}
+
+	def add_page(self, page_context: DictPage) -> None:
+		self._page_id_map[page_context.src_id] = page_context
+		self._page_title_map[(page_context.src_space, page_context.src_title)] = page_context
+
+
+def get_pages(count: int) -> list[dict[str, str]]:
+	"""Pages parsed from separate responses, like the ones of Confluence."""
+	spaces = ('DOCS', 'ENG', 'OPS')
+
+	return [
+		json.loads(json.dumps({
+			'id': str(100_000_000 + i),
+			'space': spaces[i % len(spaces)],
+			'title': f'Page {i} of the documentation',
+			'parent_id': str(100_000_000 + i // 10),
+		}))
+		for i in range(count)
+	]
+
+
+def measure(build_index: tp.Callable[[list[dict[str, str]]], tp.Any], count: int) -> int:
+	"""Bytes taken by the index, excluding the responses the pages are parsed from."""
+	pages = get_pages(count)
+	gc.collect()
+
+	tracemalloc.start()
+	index = build_index(pages)
+	del pages
+	gc.collect()
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	del index
+
+	return size
+
+
+def build_tuple_key_index(pages: list[dict[str, str]]) -> TupleKeyPageIndex:
+	index = TupleKeyPageIndex()
+
+	for page in pages:
+		index.add_page(DictPage(page['id'], page['space'], page['title'], src_parent_id=page['parent_id']))
+
+	return index
+
+
+def build_page_index(pages: list[dict[str, str]]) -> context.PageIndex:
+	index = context.PageIndex()
+
+	for page in pages:
+		index.add_page(context.Page(page['id'], page['space'], page['title'], src_parent_id=page['parent_id']))
+
+	return index
+
+
+def main() -> None:
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+	old_size = measure(build_tuple_key_index, count)
+	new_size = measure(build_page_index, count)
+
+	print(f'Pages: {count}')
+	print(f'Previous index: {old_size / 2 ** 20:.1f} MiB, {old_size / count:.0f} B per page')
+	print(f'Page index: {new_size / 2 ** 20:.1f} MiB, {new_size / count:.0f} B per page')
+	print(f'Reduction: {1 - new_size / old_size:.0%}')
+
+
+if __name__ == '__main__':
+	main()
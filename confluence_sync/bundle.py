@@ -0,0 +1,513 @@
+import collections
+import collections.abc
+import gzip
+import itertools as it
+import json
+import logging
+import pathlib
+import threading
+import typing as tp
+import zlib
+from concurrent import futures
+
+import requests
+from atlassian import errors
+
+from confluence_sync import context, document, events, fmt, observer
+from confluence_sync.confluence import CustomConfluence, StrDict
+
+_logger = logging.getLogger('confluence-sync')
+
+_MANIFEST_NAME = 'manifest.json'
+_VERSION = 1
+
+# Child pages requested at once, they are read as the queue of pages to export has room
+_CHILD_PAGE_BATCH_SIZE = 25
+
+
+class BundleWriter:
+	"""Thread-safe writer of a bundle directory.
+
+	Pages are written as compressed JSON lines, and attachment contents are compressed one by one
+	and appended to binary files. A new file is started once the current one exceeds the chunk size,
+	so a bundle can be copied or resumed by files.
+	"""
+
+	def __init__(self, path: str | pathlib.Path, chunk_size: int = 64 * 1024 ** 2) -> None:
+		self._path = pathlib.Path(path)
+		self._path.mkdir(parents=True, exist_ok=True)
+		self._chunk_size = chunk_size
+		self._lock = threading.Lock()
+
+		self._page_chunks: list[str] = []
+		self._page_file: tp.TextIO | None = None
+		self._page_chunk_size = 0
+
+		self._attachment_chunks: list[str] = []
+		self._attachment_file: tp.BinaryIO | None = None
+
+		self.page_count = 0
+		self.attachment_count = 0
+		self.attachment_size = 0
+
+	def add_attachment(self, attachment: StrDict, content: bytes) -> None:
+		"""Write the content of the attachment, its location is added to the attachment."""
+		packed_content = zlib.compress(content)
+
+		with self._lock:
+			if self._attachment_file is None or self._attachment_file.tell() >= self._chunk_size:
+				self._attachment_file = self._start_chunk(self._attachment_file, self._attachment_chunks, 'attachments', 'bin')
+
+			attachment['bundle'] = {
+				'chunk': self._attachment_chunks[-1],
+				'offset': self._attachment_file.tell(),
+				'size': len(packed_content),
+			}
+
+			self._attachment_file.write(packed_content)
+
+			self.attachment_count += 1
+			self.attachment_size += len(content)
+
+	def add_page(self, page: StrDict, space: str, child_ids: list[str] | None, attachments: list[StrDict]) -> None:
+		"""Write the page with its attachments.
+
+		:param child_ids: IDs of the child pages in the hierarchy, None for pages outside the hierarchy
+		"""
+		line = json.dumps(
+			{'page': page, 'space': space, 'child_ids': child_ids, 'attachments': attachments},
+			ensure_ascii=False,
+		)
+
+		with self._lock:
+			if self._page_file is None or self._page_chunk_size >= self._chunk_size:
+				self._page_file = self._start_chunk(self._page_file, self._page_chunks, 'pages', 'jsonl.gz')
+				self._page_chunk_size = 0
+
+			self._page_file.write(line + '\n')
+			self._page_chunk_size += len(line) + 1
+			self.page_count += 1
+
+	def close(self, manifest: StrDict) -> None:
+		"""Finish the files and write the manifest, a bundle without the manifest is incomplete."""
+		with self._lock:
+			for f in (self._page_file, self._attachment_file):
+				if f is not None:
+					f.close()
+
+			manifest = {
+				**manifest,
+				'version': _VERSION,
+				'page_chunks': self._page_chunks,
+				'attachment_chunks': self._attachment_chunks,
+			}
+
+			with (self._path / _MANIFEST_NAME).open('w', encoding='utf-8') as f:
+				json.dump(manifest, f, ensure_ascii=False)
+
+	def _start_chunk(self, cur_file: tp.IO | None, chunks: list[str], prefix: str, suffix: str) -> tp.IO:
+		if cur_file is not None:
+			cur_file.close()
+
+		name = f'{prefix}-{len(chunks):05d}.{suffix}'
+		chunks.append(name)
+
+		if suffix.endswith('.gz'):
+			return gzip.open(self._path / name, 'wt', encoding='utf-8')
+
+		return (self._path / name).open('wb')
+
+
+class BundleExporter(observer.Observable):
+	"""Export of a page hierarchy from the source to a bundle.
+
+	The bundle contains everything a session reads from the source: the pages of the hierarchy with their attachments,
+	pages outside the hierarchy if they are copied, and the pages referenced by included draw.io diagrams
+	with the attachments of the diagrams.
+	"""
+
+	def __init__(
+		self,
+		*,
+		executor: futures.Executor,
+		src_cli: CustomConfluence,
+		path: str | pathlib.Path,
+		src_space: str | None = None,
+		src_title: str | None = None,
+		src_id: str | None = None,
+		sync_out_hierarchy: bool = False,
+		chunk_size: int = 64 * 1024 ** 2,
+		max_tasks: int = 64,
+	) -> None:
+		super().__init__()
+
+		self._executor = executor
+		# Tasks submitted to the executor at once, the rest wait in a queue
+		self._max_tasks = max_tasks
+		self._src_cli = src_cli
+		self._writer = BundleWriter(path, chunk_size)
+		self._sync_out_hierarchy = sync_out_hierarchy
+		self._lock = threading.Lock()
+
+		if src_id is None:
+			self._src_page = self._src_cli.get_page_by_title_or_homepage(src_space, src_title, expand='body.storage,ancestors')
+			self._src_space = src_space
+		else:
+			self._src_page = self._src_cli.get_page_by_id(src_id, expand='body.storage,ancestors,space')
+			self._src_space = self._src_page['space']['key']
+
+		self._page_index = context.PageIndex()
+		# Links to other pages as (space, title)
+		self._links: set[tuple[str, str]] = set()
+		# Included draw.io diagrams as (ref_page_id, ref_diagram_name)
+		self._ref_diagrams: set[tuple[str, str]] = set()
+
+		self._total_page_count = 0
+		self._exported_page_count = 0
+
+	def run(self) -> None:
+		self._inc_total_page_count(1)
+
+		self._export_tree(self._export_hierarchy_page, ((self._src_page,),))
+
+		if self._sync_out_hierarchy:
+			self._export_out_hierarchy_pages()
+
+		self._export_ref_pages()
+
+		self._writer.close({
+			'root_page_id': self._src_page['id'],
+			'space': self._src_space,
+			'sync_out_hierarchy': self._sync_out_hierarchy,
+		})
+
+		_logger.info(
+			'Bundle exported, page count: %d, attachment count: %d, attachment size: %d',
+			self._writer.page_count,
+			self._writer.attachment_count,
+			self._writer.attachment_size,
+		)
+
+	def _export_tree(self, task: tp.Callable[..., tp.Iterable[tuple]], tasks_args: tp.Iterable[tuple]) -> None:
+		"""Run a task for every page, the task returns the arguments of the next tasks.
+
+		Only a few tasks are submitted to the executor at once, the rest wait in a queue.
+		If the task returns an iterator, e.g. of child pages requested lazily, it is read in batches
+		only while the queue has room, so the memory doesn't depend on the number of child pages.
+		"""
+		pending_tasks = collections.deque(tasks_args)
+		task_futures = set()
+
+		# Iterators of the next tasks arguments that aren't read till the end
+		iterators = collections.deque()
+		# future: iterator read by the future
+		batch_futures = {}
+
+		def _read_batch(_iterator: tp.Iterator[tuple]) -> list[tuple]:
+			return list(it.islice(_iterator, _CHILD_PAGE_BATCH_SIZE))
+
+		while True:
+			while pending_tasks and len(task_futures) < self._max_tasks:
+				task_futures.add(self._executor.submit(task, *pending_tasks.popleft()))
+
+			while iterators and len(pending_tasks) < self._max_tasks and len(batch_futures) < max(1, self._max_tasks // 4):
+				iterator = iterators.popleft()
+				batch_futures[self._executor.submit(_read_batch, iterator)] = iterator
+
+			if not task_futures and not batch_futures:
+				break
+
+			done, _ = futures.wait(task_futures | batch_futures.keys(), return_when=futures.FIRST_COMPLETED)
+
+			for ft in done:
+				if ft in batch_futures:
+					iterator = batch_futures.pop(ft)
+					next_tasks_args = ft.result()
+
+					# The rest is read next
+					if len(next_tasks_args) == _CHILD_PAGE_BATCH_SIZE:
+						iterators.appendleft(iterator)
+				else:
+					task_futures.remove(ft)
+					next_tasks_args = ft.result()
+
+					if isinstance(next_tasks_args, collections.abc.Iterator):
+						iterators.append(next_tasks_args)
+						continue
+
+				pending_tasks.extend(next_tasks_args)
+
+	def _export_hierarchy_page(self, page: StrDict) -> tp.Iterator[tuple[StrDict]]:
+		# Child IDs are written with the page, so they are listed without bodies first
+		child_ids = [
+			child_page['id']
+			for child_page in self._src_cli.traverse_child_pages(page['id'], limit=_CHILD_PAGE_BATCH_SIZE)
+		]
+		self._inc_total_page_count(len(child_ids))
+
+		with self._lock:
+			self._page_index.add_page(context.Page(src_id=page['id'], src_space=self._src_space, src_title=page['title']))
+
+		self._export_page(page, self._src_space, child_ids)
+
+		# Pages added after the listing aren't exported, since the page doesn't refer to them
+		child_id_set = set(child_ids)
+		child_pages = self._src_cli.traverse_child_pages(page['id'], expand='body.storage', limit=_CHILD_PAGE_BATCH_SIZE)
+
+		return ((child_page,) for child_page in child_pages if child_page['id'] in child_id_set)
+
+	def _export_out_hierarchy_pages(self) -> None:
+		"""Export pages linked from the exported pages level by level, like the session discovers them."""
+		seen_pages = set()
+
+		while True:
+			with self._lock:
+				level_pages = sorted(
+					link
+					for link in self._links
+					if link not in seen_pages and not self._page_index.search_by_title(*link)
+				)
+
+			if not level_pages:
+				break
+
+			seen_pages.update(level_pages)
+			self._inc_total_page_count(len(level_pages))
+
+			self._export_tree(self._export_out_hierarchy_page, level_pages)
+
+	def _export_out_hierarchy_page(self, space: str, title: str) -> list:
+		try:
+			page = self._src_cli.get_page_by_title(space, title, expand='ancestors,body.storage,version')
+		except errors.ApiPermissionError:
+			page = None
+
+		if page is None:
+			_logger.error('Get out hierarchy page, space="%s", title="%s"', space, title)
+			self._inc_exported_page_count()
+
+			return []
+
+		with self._lock:
+			self._page_index.add_page(context.Page(src_id=page['id'], src_space=space, src_title=title))
+
+		self._export_page(page, space, None)
+
+		return []
+
+	def _export_ref_pages(self) -> None:
+		"""Export pages outside the bundle referenced by included draw.io diagrams along with the diagram attachments."""
+		attachment_names = {}
+
+		for ref_page_id, ref_diagram_name in self._ref_diagrams:
+			if not self._page_index.search_by_id(ref_page_id):
+				attachment_names.setdefault(ref_page_id, set()).update(
+					fmt.IncDrawIOFormatter.diagram_attachment_names(ref_diagram_name)
+				)
+
+		self._inc_total_page_count(len(attachment_names))
+
+		self._export_tree(self._export_ref_page, sorted(attachment_names.items()))
+
+	def _export_ref_page(self, page_id: str, attachment_names: set[str]) -> list:
+		try:
+			page = self._src_cli.get_page_by_id(page_id, expand='body.storage,space')
+		except (errors.ApiError, requests.HTTPError):
+			_logger.error('Get page referenced by drawio diagrams, id: %s', page_id)
+			self._inc_exported_page_count()
+
+			return []
+
+		attachments = []
+
+		for attachment_name in sorted(attachment_names):
+			attachments.extend(
+				self._src_cli.get_attachment_by_name(page_id, attachment_name, expand='history.lastUpdated')
+			)
+
+		self._export_attachments(attachments)
+		self._writer.add_page(page, page['space']['key'], None, attachments)
+
+		self._inc_exported_page_count()
+
+		return []
+
+	def _export_page(self, page: StrDict, space: str, child_ids: list[str] | None) -> None:
+		body = page['body']['storage']['value']
+
+		# Links and diagrams are found in every page, including pages that turn out to be in the hierarchy
+		page_context = context.Page(src_id=page['id'], src_space=space, src_title=page['title'])
+		link_keeper = fmt.OutHierarchyPageTitleKeeper(context.PageIndex())
+		fmt.scan_document(page_context, document.PageDocument(page['id'], body), (link_keeper,))
+
+		with self._lock:
+			self._links.update(link_keeper.pages)
+			self._ref_diagrams.update(fmt.IncDrawIOFormatter.scan_ref_diagrams(body))
+
+		attachments = list(self._src_cli.traverse_page_attachments(page['id'], expand='history.lastUpdated'))
+		self._export_attachments(attachments)
+
+		self._writer.add_page(page, space, child_ids, attachments)
+
+		_logger.info('Page exported, "%s"', page['title'])
+		self._inc_exported_page_count()
+
+	def _export_attachments(self, attachments: list[StrDict]) -> None:
+		# Attachments are downloaded one by one, so only one of them is kept in memory by a thread
+		for attachment in attachments:
+			content = self._src_cli.get(attachment['_links']['download'], not_json_response=True)
+			self._writer.add_attachment(attachment, content)
+
+	def _inc_total_page_count(self, n: int) -> None:
+		with self._lock:
+			self._total_page_count += n
+
+		self.notify(events.TotalPageCountChanged(self._total_page_count))
+
+	def _inc_exported_page_count(self) -> None:
+		with self._lock:
+			self._exported_page_count += 1
+
+		self.notify(events.SyncedPageCountChanged(self._exported_page_count))
+
+
+class BundleConfluence(CustomConfluence):
+	"""Source confluence read from a bundle.
+
+	It serves the requests a session makes to the source, so a bundle is imported by a usual session.
+	Pages are kept in memory with compressed bodies, attachment contents are read from the files when they are copied.
+	"""
+
+	def __init__(self, path: str | pathlib.Path) -> None:
+		super().__init__(url='http://bundle')
+
+		self._path = pathlib.Path(path)
+
+		manifest_path = self._path / _MANIFEST_NAME
+
+		if not manifest_path.exists():
+			raise ValueError('Bundle is incomplete, it has no manifest')
+
+		with manifest_path.open(encoding='utf-8') as f:
+			self.manifest = json.load(f)
+
+		if self.manifest.get('version') != _VERSION:
+			raise ValueError(f'Bundle version {self.manifest.get("version")} is not supported')
+
+		# page_id: (page without the body, compressed body)
+		self._pages: dict[str, tuple[StrDict, bytes]] = {}
+		# (space, title): page_id
+		self._page_ids_by_title: dict[tuple[str, str], str] = {}
+		# page_id: child page IDs
+		self._child_ids: dict[str, list[str]] = {}
+		# page_id: parent page ID, for the pages in the hierarchy
+		self._parent_ids: dict[str, str] = {}
+		# page_id: attachments
+		self._attachments: dict[str, list[StrDict]] = {}
+		# download link: attachment location
+		self._attachment_locations: dict[str, StrDict] = {}
+
+		for chunk in self.manifest['page_chunks']:
+			with gzip.open(self._path / chunk, 'rt', encoding='utf-8') as f:
+				for line in f:
+					self._add_record(json.loads(line))
+
+	@property
+	def root_page_id(self) -> str:
+		return self.manifest['root_page_id']
+
+	@property
+	def sync_out_hierarchy(self) -> bool:
+		return self.manifest['sync_out_hierarchy']
+
+	def request(self, method: str = 'GET', path: str = '/', *args, **kwargs) -> tp.NoReturn:
+		raise errors.ApiNotFoundError(f'Request is not in the bundle, {method} {path}')
+
+	def get_page_by_id(self, page_id: str, expand: tp.Any = None, *args, **kwargs) -> StrDict:
+		page = self._get_page(page_id)
+
+		if page is None:
+			raise errors.ApiNotFoundError(f'Page is not in the bundle, id: {page_id}')
+
+		return page
+
+	def get_page_by_title(self, space: str, title: str, *args, **kwargs) -> StrDict | None:
+		page_id = self._page_ids_by_title.get((space, title))
+
+		return self._get_page(page_id) if page_id else None
+
+	def get_page_child_by_type(self, page_id: str, *args, **kwargs) -> list[StrDict]:
+		return [self._get_page(child_id) for child_id in self._child_ids.get(page_id, ())]
+
+	def traverse_child_pages(self, page_id: str, *args, **kwargs) -> tp.Generator[StrDict, None, None]:
+		for child_id in self._child_ids.get(page_id, ()):
+			yield self._get_page(child_id)
+
+	def traverse_page_attachments(
+		self,
+		page_id: str,
+		start: int | None = None,
+		limit: int | None = None,
+		expand: str | None = None,
+		filename: str | None = None,
+		media_type: str | None = None,
+	) -> tp.Generator[StrDict, None, None]:
+		for attachment in self._attachments.get(page_id, ()):
+			if filename is None or attachment['title'] == filename:
+				yield attachment
+
+	def get(self, path: str, *args, **kwargs) -> bytes:
+		location = self._attachment_locations.get(path)
+
+		if location is None:
+			raise errors.ApiNotFoundError(f'Attachment is not in the bundle, {path}')
+
+		with (self._path / location['chunk']).open('rb') as f:
+			f.seek(location['offset'])
+			return zlib.decompress(f.read(location['size']))
+
+	def _add_record(self, record: StrDict) -> None:
+		page = record['page']
+		body = page.pop('body')['storage']['value']
+		page['space'] = {'key': record['space']}
+
+		self._pages[page['id']] = (page, zlib.compress(body.encode()))
+		self._attachments.setdefault(page['id'], []).extend(record['attachments'])
+		self._page_ids_by_title.setdefault((record['space'], page['title']), page['id'])
+
+		if record['child_ids'] is not None:
+			self._child_ids[page['id']] = record['child_ids']
+
+			for child_id in record['child_ids']:
+				self._parent_ids[child_id] = page['id']
+
+		for attachment in record['attachments']:
+			self._attachment_locations[attachment['_links']['download']] = attachment.pop('bundle')
+
+	def _get_page(self, page_id: str) -> StrDict | None:
+		item = self._pages.get(page_id)
+
+		if item is None:
+			return None
+
+		page, packed_body = item
+		page = {**page, 'body': {'storage': {'value': zlib.decompress(packed_body).decode(), 'representation': 'storage'}}}
+
+		if 'ancestors' not in page and page_id in self._parent_ids:
+			page['ancestors'] = self._get_ancestors(page_id)
+
+		return page
+
+	def _get_ancestors(self, page_id: str) -> list[StrDict]:
+		"""Get the ancestors of a page in the hierarchy.
+
+		Only the root page is exported with its ancestors, the ones of its descendants are their parents.
+		"""
+		parents = []
+		page = self._pages[page_id][0]
+
+		while 'ancestors' not in page and (parent_id := self._parent_ids.get(page['id'])) is not None:
+			page = self._pages[parent_id][0]
+			parents.append({'id': page['id'], 'type': 'page', 'title': page['title']})
+
+		return [*page.get('ancestors', ()), *reversed(parents)]
@@ -0,0 +1,378 @@
+import collections
+import dataclasses as dc
+import itertools as it
+import pickle
+import tempfile
+import threading
+import typing as tp
+
+from confluence_sync.confluence import StrDict
+
+KeyT = tp.TypeVar('KeyT', bound=tp.Hashable)
+ValueT = tp.TypeVar('ValueT', bound=tp.Any)
+
+
+@dc.dataclass(slots=True)
+class CacheStats:
+	hits: int = 0
+	misses: int = 0
+	evictions: int = 0
+
+
+class LRUCache(tp.Generic[KeyT, ValueT]):
+	"""Thread-safe cache bounded by the total size of its values.
+
+	The least recently used values are evicted once the size exceeds the maximum.
+	"""
+
+	def __init__(
+		self,
+		max_size: int,
+		sizeof: tp.Callable[[ValueT], int] = lambda value: 1,
+		on_evict: tp.Callable[[KeyT, ValueT], None] | None = None,
+	) -> None:
+		self._max_size = max_size
+		self._sizeof = sizeof
+		self._on_evict = on_evict
+
+		# key: (value, size)
+		self._values: collections.OrderedDict[KeyT, tuple[ValueT, int]] = collections.OrderedDict()
+		self._size = 0
+		self._lock = threading.Lock()
+
+		self.stats = CacheStats()
+
+	@property
+	def size(self) -> int:
+		return self._size
+
+	def get(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+		with self._lock:
+			item = self._values.get(key)
+
+			if item is None:
+				self.stats.misses += 1
+				return default
+
+			self._values.move_to_end(key)
+			self.stats.hits += 1
+
+			return item[0]
+
+	def put(self, key: KeyT, value: ValueT) -> None:
+		with self._lock:
+			self._pop(key)
+
+			size = self._sizeof(value)
+			self._values[key] = (value, size)
+			self._size += size
+
+			evicted = []
+
+			while self._size > self._max_size and self._values:
+				evicted_key, (evicted_value, evicted_size) = self._values.popitem(last=False)
+				self._size -= evicted_size
+				self.stats.evictions += 1
+				evicted.append((evicted_key, evicted_value))
+
+		if self._on_evict:
+			for evicted_key, evicted_value in evicted:
+				self._on_evict(evicted_key, evicted_value)
+
+	def pop(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+		with self._lock:
+			return self._pop(key, default)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._values.clear()
+			self._size = 0
+
+	def _pop(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+		item = self._values.pop(key, None)
+
+		if item is None:
+			return default
+
+		self._size -= item[1]
+
+		return item[0]
+
+	def __contains__(self, key: KeyT) -> bool:
+		return key in self._values
+
+	def __len__(self) -> int:
+		return len(self._values)
+
+
+class SpillableCache(tp.Generic[KeyT, ValueT]):
+	"""Thread-safe cache that keeps values in memory up to the size limit and spills the rest to a temporary file.
+
+	Values read from the file aren't moved back to memory.
+	"""
+
+	def __init__(self, max_memory_size: int, sizeof: tp.Callable[[ValueT], int] = lambda value: 1) -> None:
+		self._memory = LRUCache(max_memory_size, sizeof, self._spill)
+
+		self._file: tp.BinaryIO | None = None
+		# key: (offset, length)
+		self._file_index: dict[KeyT, tuple[int, int]] = {}
+		self._file_lock = threading.Lock()
+
+	@property
+	def stats(self) -> CacheStats:
+		return self._memory.stats
+
+	def get(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+		value = self._memory.get(key)
+
+		if value is not None:
+			return value
+
+		with self._file_lock:
+			position = self._file_index.get(key)
+
+			if position is None:
+				return default
+
+			offset, length = position
+			self._file.seek(offset)
+			data = self._file.read(length)
+
+		return pickle.loads(data)
+
+	def put(self, key: KeyT, value: ValueT) -> None:
+		with self._file_lock:
+			# The file space isn't reused, the file is removed along with the cache
+			self._file_index.pop(key, None)
+
+		self._memory.put(key, value)
+
+	def close(self) -> None:
+		self._memory.clear()
+
+		with self._file_lock:
+			if self._file:
+				self._file.close()
+				self._file = None
+
+			self._file_index.clear()
+
+	def _spill(self, key: KeyT, value: ValueT) -> None:
+		data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+		with self._file_lock:
+			if self._file is None:
+				self._file = tempfile.TemporaryFile(prefix='confluence-sync-')
+
+			offset = self._file.seek(0, 2)
+			self._file.write(data)
+			self._file_index[key] = (offset, len(data))
+
+	def __contains__(self, key: KeyT) -> bool:
+		return key in self._memory or key in self._file_index
+
+
+class PageCache:
+	"""Source pages fetched during a session.
+
+	Only the id, title, version, ancestors and storage body of a page are kept.
+	Pages can be found by id or by space and title.
+	"""
+
+	def __init__(self, max_memory_size: int = 64 * 1024 ** 2) -> None:
+		self._pages: SpillableCache[str, StrDict] = SpillableCache(max_memory_size, self._sizeof)
+
+		# (space, title): page_id
+		self._page_ids: dict[tuple[str, str], str] = {}
+
+	@property
+	def stats(self) -> CacheStats:
+		return self._pages.stats
+
+	def add(self, space: str, page: StrDict) -> None:
+		compact_page = {
+			'id': page['id'],
+			'title': page['title'],
+			'version': {'number': page['version']['number']} if 'version' in page else None,
+			'ancestors': [{'id': a['id'], 'title': a['title']} for a in page.get('ancestors', ())],
+			'body': {'storage': {'value': page['body']['storage']['value']}},
+		}
+
+		self._pages.put(page['id'], compact_page)
+		self._page_ids[(space, page['title'])] = page['id']
+
+	def get_by_id(self, page_id: str) -> StrDict | None:
+		return self._pages.get(page_id)
+
+	def get_by_title(self, space: str, title: str) -> StrDict | None:
+		page_id = self._page_ids.get((space, title))
+
+		if page_id is None:
+			return None
+
+		return self._pages.get(page_id)
+
+	def close(self) -> None:
+		self._pages.close()
+		self._page_ids.clear()
+
+	@staticmethod
+	def _sizeof(page: StrDict) -> int:
+		return len(page['body']['storage']['value']) + len(page['title'])
+
+
+class AttachmentCache:
+	"""Attachments of source pages fetched during a session.
+
+	Both full attachment listings of pages and single attachments found by name are kept,
+	bounded by the number of attachments.
+	"""
+
+	_missing = object()
+
+	def __init__(self, max_count: int = 100_000) -> None:
+		# page_id: {attachment_title: attachment}, an empty listing still takes a place
+		self._listings: LRUCache[str, dict[str, StrDict]] = LRUCache(max_count // 2, lambda listing: len(listing) + 1)
+		# (page_id, attachment_title): attachment, or _missing if the page has no such attachment
+		self._attachments: LRUCache[tuple[str, str], tp.Any] = LRUCache(max_count // 2)
+
+	@property
+	def stats(self) -> CacheStats:
+		listing_stats = self._listings.stats
+		attachment_stats = self._attachments.stats
+
+		return CacheStats(
+			hits=listing_stats.hits + attachment_stats.hits,
+			misses=listing_stats.misses + attachment_stats.misses,
+			evictions=listing_stats.evictions + attachment_stats.evictions,
+		)
+
+	def add_listing(self, page_id: str, attachments: tp.Iterable[StrDict]) -> None:
+		self._listings.put(page_id, {attachment['title']: attachment for attachment in attachments})
+
+	def get_listing(self, page_id: str) -> list[StrDict] | None:
+		listing = self._listings.get(page_id)
+		return list(listing.values()) if listing is not None else None
+
+	def add(self, page_id: str, attachment_name: str, attachment: StrDict | None) -> None:
+		self._attachments.put((page_id, attachment_name), self._missing if attachment is None else attachment)
+
+	def get_by_names(self, page_id: str, attachment_names: tp.Iterable[str]) -> tuple[list[StrDict], list[str]]:
+		"""Get the page attachments by their names.
+
+		:return: A tuple with the found attachments and the names that aren't cached
+		"""
+		listing = self._listings.get(page_id)
+
+		if listing is not None:
+			return [listing[name] for name in attachment_names if name in listing], []
+
+		attachments = []
+		missed_names = []
+
+		for attachment_name in attachment_names:
+			attachment = self._attachments.get((page_id, attachment_name))
+
+			if attachment is None:
+				missed_names.append(attachment_name)
+			elif attachment is not self._missing:
+				attachments.append(attachment)
+
+		return attachments, missed_names
+
+
+class SharedReads(tp.Generic[KeyT, ValueT]):
+	"""Thread-safe results of reads shared by several consumers that read the same data.
+
+	A result is kept until every consumer has read it, or until it is evicted to keep the total size bounded,
+	in which case the consumers that haven't read it yet read it again.
+	Consumers read through their readers, so a consumer reading a key again doesn't take the share of another one.
+	Concurrent reads of the same key wait for the first one.
+	"""
+
+	def __init__(
+		self,
+		consumers: int,
+		max_size: int = 256 * 1024 ** 2,
+		sizeof: tp.Callable[[ValueT], int] = len,
+	) -> None:
+		self._consumers = consumers
+		self._sizeof = sizeof
+		self._consumer_ids = it.count()
+
+		# key: [value, IDs of the consumers that have read it]
+		self._results: LRUCache[KeyT, list] = LRUCache(max_size, self._sizeof_result)
+		# key: event that is set when the result is read
+		self._reads_in_flight: dict[KeyT, threading.Event] = {}
+		self._lock = threading.Lock()
+
+	@property
+	def stats(self) -> CacheStats:
+		return self._results.stats
+
+	def reader(self) -> 'SharedReader[KeyT, ValueT]':
+		"""Get the reader of a new consumer."""
+		return SharedReader(self, next(self._consumer_ids))
+
+	def get_or_read(self, key: KeyT, read: tp.Callable[[], ValueT], consumer: tp.Hashable | None = None) -> ValueT:
+		"""Get the result of the key, or read it.
+
+		:param consumer: ID of the consumer, every read is counted as a read of another consumer if not set
+		"""
+		if consumer is None:
+			consumer = object()
+
+		while True:
+			with self._lock:
+				result = self._results.get(key)
+
+				if result is not None:
+					result[1].add(consumer)
+
+					if len(result[1]) >= self._consumers:
+						self._results.pop(key)
+
+					return result[0]
+
+				read_in_flight = self._reads_in_flight.get(key)
+
+				if read_in_flight is None:
+					self._reads_in_flight[key] = threading.Event()
+					break
+
+			# If the read fails, or the result is already evicted, the key is read again
+			read_in_flight.wait()
+
+		try:
+			value = read()
+
+			if self._consumers > 1:
+				with self._lock:
+					self._results.put(key, [value, {consumer}])
+
+			return value
+		finally:
+			with self._lock:
+				self._reads_in_flight.pop(key).set()
+
+	def close(self) -> None:
+		self._results.clear()
+
+	def __len__(self) -> int:
+		"""Number of results kept for the consumers that haven't read them yet."""
+		return len(self._results)
+
+	def _sizeof_result(self, result: list) -> int:
+		return self._sizeof(result[0])
+
+
+class SharedReader(tp.Generic[KeyT, ValueT]):
+	"""Reads of one consumer of shared reads."""
+
+	def __init__(self, shared_reads: SharedReads[KeyT, ValueT], consumer: int) -> None:
+		self._shared_reads = shared_reads
+		self._consumer = consumer
+
+	def get_or_read(self, key: KeyT, read: tp.Callable[[], ValueT]) -> ValueT:
+		return self._shared_reads.get_or_read(key, read, self._consumer)
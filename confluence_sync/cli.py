@@ -1,10 +1,12 @@
 import argparse
+import datetime as dt
 import logging
+import re
 
 from tqdm.auto import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
-from confluence_sync import events, observer, sync
+from confluence_sync import events, jobs, observer, plan, ratelimit, sync, webhook
 
 _logger = logging.getLogger('confluence-sync')
 
@@ -51,27 +53,105 @@ class ConfluenceSyncedPageProgressBar(observer.Observer):
 
 
 def confluence_sync(args) -> None:
-	validate_page_identifier(
-		source_id_action,
-		args.source_id,
+	if args.jobs:
+		page_identifier_args = (
+			args.source_id,
+			args.source_space,
+			args.source_title,
+			args.dest_id,
+			args.dest_space,
+			args.dest_title,
+		)
+
+		if any(arg is not None for arg in page_identifier_args):
+			parser.error('argument --jobs: not allowed with page identifier arguments')
 
-		source_space_action,
-		args.source_space,
+		if args.watch is not None:
+			parser.error('argument --watch: not allowed with argument --jobs')
 
-		source_title_action,
-		args.source_title,
+		if args.webhook_port is not None:
+			parser.error('argument --webhook-port: not allowed with argument --jobs')
+	else:
+		if args.watch is not None and args.webhook_port is not None:
+			parser.error('argument --webhook-port: not allowed with argument --watch')
+
+		if args.export_bundle is not None and args.import_bundle is not None:
+			parser.error('argument --import-bundle: not allowed with argument --export-bundle')
+
+		# The source of an imported bundle is the bundle itself
+		if args.import_bundle is None:
+			validate_page_identifier(
+				source_id_action,
+				args.source_id,
+
+				source_space_action,
+				args.source_space,
+
+				source_title_action,
+				args.source_title,
+			)
+		elif any(arg is not None for arg in (args.source_id, args.source_space, args.source_title)):
+			parser.error('argument --import-bundle: not allowed with source page identifier arguments')
+
+		if args.export_bundle is None:
+			validate_page_identifier(
+				dest_id_action,
+				args.dest_id,
+
+				dest_space_action,
+				args.dest_space,
+
+				dest_title_action,
+				args.dest_title,
+			)
+		elif any(arg is not None for arg in (args.dest_id, args.dest_space, args.dest_title)):
+			parser.error('argument --export-bundle: not allowed with destination page identifier arguments')
+
+	if args.import_bundle is None:
+		validate_confluence(source_url_action, args.source_url, source_auth_group, args.source_basic, args.source_token)
+
+	if args.export_bundle is None:
+		validate_confluence(dest_url_action, args.dest_url, dest_auth_group, args.dest_basic, args.dest_token)
+
+	single_run_args = (
+		('--journal', args.journal),
+		('--deadline', args.deadline),
+		('--plan', args.plan),
+		('--apply', args.apply),
+		('--export-bundle', args.export_bundle),
+		('--import-bundle', args.import_bundle),
 	)
 
-	validate_page_identifier(
-		dest_id_action,
-		args.dest_id,
+	for name, value in single_run_args:
+		if value is None:
+			continue
 
-		dest_space_action,
-		args.dest_space,
+		for other_name, other_value in (('--jobs', args.jobs), ('--watch', args.watch), ('--webhook-port', args.webhook_port)):
+			if other_value is not None:
+				parser.error(f'argument {name}: not allowed with argument {other_name}')
 
-		dest_title_action,
-		args.dest_title,
-	)
+	if args.resume and args.journal is None:
+		parser.error('argument --resume: must be passed with --journal')
+
+	if args.plan is not None:
+		for other_name, other_value in (('--apply', args.apply), ('--journal', args.journal), ('--deadline', args.deadline)):
+			if other_value is not None:
+				parser.error(f'argument --plan: not allowed with argument {other_name}')
+
+	if args.apply is not None and args.resume:
+		parser.error('argument --apply: not allowed with argument --resume')
+
+	if args.export_bundle is not None:
+		export_other_args = (
+			('--journal', args.journal),
+			('--deadline', args.deadline),
+			('--plan', args.plan),
+			('--apply', args.apply),
+		)
+
+		for other_name, other_value in export_other_args:
+			if other_value is not None:
+				parser.error(f'argument --export-bundle: not allowed with argument {other_name}')
 
 	# source
 	source_kwargs = {'url': args.source_url}
@@ -93,26 +173,173 @@ def confluence_sync(args) -> None:
 	else:
 		dest_kwargs['token'] = args.dest_token
 
-	source = sync.ConfluenceConfig(**source_kwargs)
-	dest = sync.ConfluenceConfig(**dest_kwargs)
-
-	syncer = sync.ConfluenceSynchronizer(source, dest)
+	source = sync.ConfluenceConfig(**source_kwargs) if args.import_bundle is None else None
+	dest = sync.ConfluenceConfig(**dest_kwargs) if args.export_bundle is None else None
+
+	if args.jobs:
+		# Settings passed as arguments are used by all jobs that don't set them
+		job_defaults = {
+			'sync_out_hierarchy': args.sync_out_hierarchy,
+			'replace_title_substr': args.replace_title_substr,
+			'start_title_with': args.start_title_with,
+		}
+
+		try:
+			sync_jobs = jobs.load_jobs(args.jobs, job_defaults)
+		except (OSError, ValueError) as e:
+			parser.error(f'argument --jobs: {e}')
+
+	sync_plan = None
+
+	if args.apply:
+		try:
+			sync_plan = plan.Plan.load(args.apply)
+		except (OSError, ValueError, KeyError, TypeError) as e:
+			parser.error(f'argument --apply: invalid plan, {e}')
+
+	syncer = sync.ConfluenceSynchronizer(
+		source,
+		dest,
+		max_workers=args.max_workers,
+		spill_dir=args.spill_dir,
+		read_workers=args.read_workers,
+		transfer_workers=args.transfer_workers,
+		src_rate_limit=ratelimit.RateLimit(args.source_requests_per_second, args.source_bytes_per_second),
+		dst_rate_limit=ratelimit.RateLimit(args.dest_requests_per_second, args.dest_bytes_per_second),
+		http_cache_path=args.http_cache,
+	)
 
 	with ConfluenceSyncedPageProgressBar() as progress_bar, syncer:
-		session = syncer.sync_page_hierarchy(
-			src_space=args.source_space,
-			src_title=args.source_title,
-			src_id=args.source_id,
-			dst_space=args.dest_space,
-			dst_title=args.dest_title,
-			dst_id=args.dest_id,
-			sync_out_hierarchy=args.sync_out_hierarchy,
-			replace_title_substr=tuple(args.replace_title_substr) if args.replace_title_substr else None,
-			start_title_with=args.start_title_with,
-		)
+		if args.jobs:
+			session = syncer.sync_page_hierarchies(sync_jobs, max_concurrent_jobs=args.max_concurrent_jobs)
+		elif args.export_bundle is not None:
+			session = syncer.export_bundle(
+				args.export_bundle,
+				src_space=args.source_space,
+				src_title=args.source_title,
+				src_id=args.source_id,
+				sync_out_hierarchy=args.sync_out_hierarchy,
+			)
+		elif args.import_bundle is not None:
+			session = syncer.import_bundle(
+				args.import_bundle,
+				dst_space=args.dest_space,
+				dst_title=args.dest_title,
+				dst_id=args.dest_id,
+				sync_out_hierarchy=args.sync_out_hierarchy,
+				replace_title_substr=tuple(args.replace_title_substr) if args.replace_title_substr else None,
+				start_title_with=args.start_title_with,
+				journal_path=args.journal,
+				resume=args.resume,
+				deadline=args.deadline,
+				sync_plan=sync_plan,
+			)
+		else:
+			session = syncer.sync_page_hierarchy(
+				src_space=args.source_space,
+				src_title=args.source_title,
+				src_id=args.source_id,
+				dst_space=args.dest_space,
+				dst_title=args.dest_title,
+				dst_id=args.dest_id,
+				sync_out_hierarchy=args.sync_out_hierarchy,
+				replace_title_substr=tuple(args.replace_title_substr) if args.replace_title_substr else None,
+				start_title_with=args.start_title_with,
+				journal_path=args.journal,
+				resume=args.resume,
+				deadline=args.deadline,
+				sync_plan=sync_plan,
+			)
 
 		session.attach(progress_bar)
-		session.run()
+
+		if args.plan is not None:
+			new_plan = session.make_plan()
+			new_plan.save(args.plan)
+		elif args.watch is not None:
+			session.watch(args.watch)
+		elif args.webhook_port is not None:
+			queue = webhook.WebhookQueue(args.webhook_queue, debounce=args.webhook_debounce)
+			receiver = webhook.WebhookReceiver(
+				session,
+				queue,
+				host=args.webhook_host,
+				port=args.webhook_port,
+				secret=args.webhook_secret,
+			)
+			receiver.serve()
+		else:
+			try:
+				session.run()
+			except sync.DeadlineReached:
+				if args.journal:
+					parser.exit(3, 'Deadline is reached, the run can be continued with --resume\n')
+
+				parser.exit(3, 'Deadline is reached\n')
+
+	if args.plan is not None:
+		print_plan_cost(new_plan.cost())
+
+
+def print_plan_cost(cost: plan.PlanCost) -> None:
+	print(f'Pages to create: {cost.creates}')
+	print(f'Pages to update: {cost.updates}')
+	print(f'Pages to move: {cost.moves}')
+	print(f'Pages unchanged: {cost.unchanged}')
+	print(f'Included draw.io diagram fixes, at most: {cost.drawio_fixes}')
+	print(f'Attachments to upload: {cost.attachment_uploads}, {format_size(cost.attachment_bytes)}')
+	print(f'Write requests: {cost.write_requests}')
+
+
+def format_size(size: float) -> str:
+	for unit in ('B', 'KB', 'MB', 'GB'):
+		if size < 1024 or unit == 'GB':
+			break
+
+		size /= 1024
+
+	return f'{size:.1f} {unit}' if unit != 'B' else f'{size:.0f} {unit}'
+
+
+def parse_size(value: str) -> float:
+	"""Parse a size in bytes, optionally with a unit like 512K, 10M or 1G."""
+	match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)B?', value.upper())
+
+	if not match:
+		raise argparse.ArgumentTypeError(f'invalid size: {value!r}')
+
+	return float(match[1]) * 1024 ** ' KMG'.index(match[2] or ' ')
+
+
+def parse_deadline(value: str) -> dt.datetime:
+	"""Parse either a time, local if the timezone isn't set, or a duration from now like 90m, 6h or 3600s."""
+	match = re.fullmatch(r'(\d+(?:\.\d+)?)([smh])', value)
+
+	if match:
+		seconds = float(match[1]) * {'s': 1, 'm': 60, 'h': 3600}[match[2]]
+		return dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=seconds)
+
+	try:
+		deadline = dt.datetime.fromisoformat(value)
+	except ValueError:
+		raise argparse.ArgumentTypeError(f'invalid deadline: {value!r}')
+
+	return deadline.astimezone(dt.timezone.utc)
+
+
+def validate_confluence(
+	url_action: argparse.Action,
+	url_val: str | None,
+	auth_group: argparse._MutuallyExclusiveGroup,
+	basic_val: str | None,
+	token_val: str | None,
+) -> None:
+	if url_val is None:
+		parser.error(f'the following arguments are required: {argparse._get_action_name(url_action)}')
+
+	if basic_val is None and token_val is None:
+		auth_keys = ' '.join(argparse._get_action_name(action) for action in auth_group._group_actions)
+		parser.error(f'one of the arguments {auth_keys} is required')
 
 
 def validate_page_identifier(
@@ -172,10 +399,11 @@ parser = argparse.ArgumentParser(prog='')
 parser.set_defaults(func=confluence_sync)
 
 # Source
-parser.add_argument('--source-url', required=True)
+# Connections are required unless a bundle is used instead
+source_url_action = parser.add_argument('--source-url')
 
-source_auth_group = parser.add_mutually_exclusive_group(required=True)
-source_auth_group.add_argument('--source-basic', help='Username and password separated by semicolon')
+source_auth_group = parser.add_mutually_exclusive_group()
+source_auth_group.add_argument('--source-basic', help='Username and password separated by colon')
 source_auth_group.add_argument('--source-token')
 
 source_id_action = parser.add_argument('--source-id')
@@ -183,10 +411,10 @@ source_space_action = parser.add_argument('--source-space')
 source_title_action = parser.add_argument('--source-title')
 
 # Destination
-parser.add_argument('--dest-url', required=True)
+dest_url_action = parser.add_argument('--dest-url')
 
-dest_auth_group = parser.add_mutually_exclusive_group(required=True)
-dest_auth_group.add_argument('--dest-basic', help='Username and password separated by semicolon')
+dest_auth_group = parser.add_mutually_exclusive_group()
+dest_auth_group.add_argument('--dest-basic', help='Username and password separated by colon')
 dest_auth_group.add_argument('--dest-token')
 
 dest_id_action = parser.add_argument('--dest-id')
@@ -197,3 +425,87 @@ dest_title_action = parser.add_argument('--dest-title')
 parser.add_argument('--sync-out-hierarchy', action='store_true', help='Copy pages outside the target hierarchy')
 parser.add_argument('--replace-title-substr', nargs=2, help='Change part of page titles to a new value')
 parser.add_argument('--start-title-with', help='Add prefix to page titles')
+
+# Batch
+parser.add_argument('--jobs', help='JSON or YAML file with page hierarchies to copy in one run')
+parser.add_argument('--max-concurrent-jobs', type=int, default=4, help='Maximum number of jobs copied at once')
+parser.add_argument('--max-workers', type=int, help='Maximum number of concurrent page writes to every destination')
+parser.add_argument('--read-workers', type=int, help='Maximum number of concurrent source reads, --max-workers by default')
+parser.add_argument(
+	'--transfer-workers',
+	type=int,
+	help='Maximum number of concurrent attachment copies to every destination, half of --max-workers by default',
+)
+parser.add_argument(
+	'--http-cache',
+	metavar='PATH',
+	help='Keep source responses in the file between runs, and serve unchanged ones from it',
+)
+parser.add_argument(
+	'--spill-dir',
+	metavar='DIR',
+	help='Keep the page index and the pages waiting to be copied in a temporary database in DIR instead of memory',
+)
+
+# Rate limits
+parser.add_argument('--source-requests-per-second', type=float, metavar='N', help='Maximum number of requests to the source per second')
+parser.add_argument(
+	'--source-bytes-per-second',
+	type=parse_size,
+	metavar='SIZE',
+	help='Maximum number of bytes sent to and received from the source per second, e.g. 10M',
+)
+parser.add_argument(
+	'--dest-requests-per-second',
+	type=float,
+	metavar='N',
+	help='Maximum number of requests to every destination per second',
+)
+parser.add_argument(
+	'--dest-bytes-per-second',
+	type=parse_size,
+	metavar='SIZE',
+	help='Maximum number of bytes sent to and received from every destination per second, e.g. 10M',
+)
+
+# Watch
+parser.add_argument(
+	'--watch',
+	type=float,
+	metavar='SECONDS',
+	help='Keep copying changed pages, checking the source every SECONDS',
+)
+
+# Webhooks
+parser.add_argument('--webhook-port', type=int, help='Receive Confluence webhooks on the port and copy changed pages')
+parser.add_argument('--webhook-host', default='127.0.0.1', help='Host to receive webhooks on')
+parser.add_argument(
+	'--webhook-queue',
+	default='confluence-sync-webhooks.json',
+	help='File keeping the changed pages until they are copied',
+)
+parser.add_argument('--webhook-secret', help='Secret of the webhook to check the signatures of events')
+parser.add_argument(
+	'--webhook-debounce',
+	type=float,
+	default=10,
+	metavar='SECONDS',
+	help='Copy a page once there are no events of it for SECONDS',
+)
+
+# Resuming
+parser.add_argument('--journal', help='File recording the completed work, so the run can be resumed')
+parser.add_argument('--resume', action='store_true', help='Continue the run recorded in the journal')
+parser.add_argument(
+	'--deadline',
+	type=parse_deadline,
+	help='Stop starting new work at the time, e.g. 2024-01-31T06:00, or after the duration, e.g. 90m or 6h',
+)
+
+# Plan
+parser.add_argument('--plan', metavar='PATH', help='Save the changes of the run to the file without copying, and print their cost')
+parser.add_argument('--apply', metavar='PATH', help='Copy the changes saved by --plan')
+
+# Bundles
+parser.add_argument('--export-bundle', metavar='PATH', help='Export the hierarchy from the source to the bundle directory')
+parser.add_argument('--import-bundle', metavar='PATH', help='Copy the hierarchy from the bundle directory instead of the source')
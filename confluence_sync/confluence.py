@@ -1,19 +1,320 @@
+import functools
 import queue
+import re
+import threading
 import typing as tp
+from concurrent import futures
+from urllib import parse
 
 import requests
-from atlassian import Confluence, errors
+from atlassian import Confluence, errors, utils
+
+from confluence_sync import httpcache, ratelimit
 
 StrDict = dict[str, tp.Any]
 
 
+class SharedReads(tp.Protocol):
+	def get_or_read(self, key: tp.Hashable, read: tp.Callable[[], tp.Any]) -> tp.Any:
+		pass
+
+
+class SingleFlight:
+	"""Thread-safe deduplication of concurrent identical reads.
+
+	A read of a key that is already being read waits for it and gets its result or error,
+	so concurrent identical reads make one call. Results aren't kept once the read is done.
+	"""
+
+	def __init__(self) -> None:
+		# key: future of the read in flight
+		self._reads_in_flight: dict[tp.Hashable, futures.Future] = {}
+		self._lock = threading.Lock()
+
+		self.read_count = 0
+		# Reads that got the result of a read in flight
+		self.shared_count = 0
+
+	def get_or_read(self, key: tp.Hashable, read: tp.Callable[[], tp.Any]) -> tp.Any:
+		with self._lock:
+			shared_read = self._reads_in_flight.get(key)
+
+			if shared_read is None:
+				own_read = self._reads_in_flight[key] = futures.Future()
+				self.read_count += 1
+			else:
+				self.shared_count += 1
+
+		if shared_read is not None:
+			return shared_read.result()
+
+		try:
+			value = read()
+		except BaseException as e:
+			own_read.set_exception(e)
+			raise
+		else:
+			own_read.set_result(value)
+			return value
+		finally:
+			with self._lock:
+				del self._reads_in_flight[key]
+
+
 class CustomConfluence(Confluence):
+	# Expansions of content that don't change unless the version of the content changes
+	_versioned_expands = frozenset(('body.storage', 'space', 'version'))
+	# Content, a content by ID and child pages of a content, their responses have the versions of the content
+	_versioned_path_re = re.compile(r'.*?/rest/api/content(?:/\d+(?:/child/page)?)?')
+
+	def __init__(
+		self,
+		*args,
+		shared_reads: SharedReads | None = None,
+		rate_limiter: ratelimit.RateLimiter | None = None,
+		single_flight: bool = False,
+		http_cache: httpcache.HttpCache | None = None,
+		**kwargs,
+	) -> None:
+		"""Confluence client.
+
+		:param shared_reads: if set, responses of GET requests are shared with other clients using the same object
+		:param rate_limiter: if set, requests are sent within its limits, shared with other clients using the same object
+		:param single_flight: if True, concurrent identical GET requests share one call and its response;
+			it must be set only for instances that aren't changed by the client, since a shared response
+			may be requested before a change made meanwhile
+		:param http_cache: if set, GET responses are kept in it and served from it while they are unchanged;
+			like single_flight, it must be set only for instances that aren't changed by the client
+		"""
+		super().__init__(*args, **kwargs)
+
+		self._shared_reads = shared_reads
+		self._rate_limiter = rate_limiter
+		self._single_flight = SingleFlight() if single_flight else None
+		self._http_cache = http_cache
+
+		# space key: homepage id
+		self._space_homepage_ids: dict[str, str] = {}
+		self._space_homepage_ids_lock = threading.Lock()
+
+	def request(
+		self,
+		method: str = 'GET',
+		path: str = '/',
+		data: tp.Any = None,
+		json: tp.Any = None,
+		flags: list[str] | None = None,
+		params: StrDict | None = None,
+		headers: dict[str, str] | None = None,
+		files: tp.Any = None,
+		trailing: bool | None = None,
+		absolute: bool = False,
+		advanced_mode: bool = False,
+	) -> requests.Response:
+		read = functools.partial(
+			self._send,
+			method,
+			path,
+			data,
+			json,
+			flags,
+			params,
+			headers,
+			files,
+			trailing,
+			absolute,
+			advanced_mode,
+		)
+
+		if method != 'GET':
+			return read()
+
+		if self._http_cache is not None and not flags and data is None and json is None:
+			read = functools.partial(self._read_cached, path, params, headers, trailing, absolute, advanced_mode)
+
+		if self._shared_reads is None and self._single_flight is None:
+			return read()
+
+		key = (
+			path,
+			tuple(sorted((params or {}).items())),
+			tuple(flags or ()),
+			trailing,
+			absolute,
+			advanced_mode,
+		)
+
+		# Identical requests of the client in flight are sent once, but each of them takes the shared response,
+		# since the shared reads count the requests of every client to release the response
+		if self._single_flight is not None:
+			read = functools.partial(self._single_flight.get_or_read, key, read)
+
+		if self._shared_reads is not None:
+			return self._shared_reads.get_or_read(key, read)
+
+		return read()
+
+	@property
+	def rate_limiter(self) -> ratelimit.RateLimiter | None:
+		return self._rate_limiter
+
+	@property
+	def single_flight(self) -> SingleFlight | None:
+		return self._single_flight
+
+	@property
+	def http_cache(self) -> httpcache.HttpCache | None:
+		return self._http_cache
+
+	def _read_cached(
+		self,
+		path: str,
+		params: StrDict | None,
+		headers: dict[str, str] | None,
+		trailing: bool | None,
+		absolute: bool,
+		advanced_mode: bool,
+	) -> requests.Response:
+		"""Read a response, an unchanged response is served from the HTTP cache.
+
+		Content with the expansions that change only with its version is checked by a request of its versions,
+		which is much smaller than the content with page bodies. Other responses are checked by conditional requests
+		if they have the ETag or Last-Modified headers, and they aren't cached otherwise.
+		"""
+		url, _, query = self.url_joiner(None if absolute else self.url, path, trailing).partition('?')
+		# Parameters of the links to the next results are in the path, parameters set to None aren't sent
+		params = {
+			**dict(parse.parse_qsl(query)),
+			**{name: str(value) for name, value in (params or {}).items() if value is not None},
+		}
+		key = f'{url}?{parse.urlencode(sorted(params.items()))}'
+
+		def _send(_params: dict[str, str], _headers: dict[str, str] | None = headers) -> requests.Response:
+			return self._send('GET', url, None, None, None, _params, _headers, None, False, True, advanced_mode)
+
+		cached = self._http_cache.get(key)
+		expands = set(params['expand'].split(',')) if params.get('expand') else set()
+
+		if expands and expands <= self._versioned_expands and self._versioned_path_re.fullmatch(url):
+			if cached is not None and cached.fingerprint is not None:
+				versions_response = _send({**params, 'expand': 'version'})
+
+				if (
+					versions_response.status_code == 200
+					and self._get_fingerprint(versions_response.json()) == cached.fingerprint
+				):
+					self._http_cache.use(key)
+					return self._get_cached_response(url, cached)
+
+			self._http_cache.miss()
+
+			# Versions are requested along with the content, so it can be checked next time
+			response = _send({**params, 'expand': ','.join(sorted(expands | {'version'}))})
+
+			if response.status_code == 200:
+				fingerprint = self._get_fingerprint(response.json())
+
+				if fingerprint is not None:
+					self._http_cache.put(
+						key,
+						httpcache.CachedResponse(response.content, response.headers.get('Content-Type'), fingerprint=fingerprint),
+					)
+
+			return response
+
+		conditional_headers = dict(headers or self.default_headers)
+
+		if cached is None:
+			self._http_cache.miss()
+		else:
+			if cached.etag:
+				conditional_headers['If-None-Match'] = cached.etag
+			if cached.last_modified:
+				conditional_headers['If-Modified-Since'] = cached.last_modified
+
+		response = _send(params, conditional_headers)
+
+		if cached is not None:
+			if response.status_code == 304:
+				self._http_cache.use(key)
+				return self._get_cached_response(url, cached)
+
+			self._http_cache.miss()
+
+		etag = response.headers.get('ETag')
+		last_modified = response.headers.get('Last-Modified')
+
+		if response.status_code == 200 and (etag or last_modified):
+			self._http_cache.put(
+				key,
+				httpcache.CachedResponse(response.content, response.headers.get('Content-Type'), etag, last_modified),
+			)
+
+		return response
+
+	@staticmethod
+	def _get_fingerprint(content: tp.Any) -> str | None:
+		"""Get the versions of the content in a response, None if some content has no version."""
+		if not isinstance(content, dict):
+			return None
+
+		try:
+			versions = [
+				(item['id'], item['version']['number'], item.get('status'))
+				for item in content.get('results', [content])
+			]
+		except (KeyError, TypeError):
+			return None
+
+		return repr((versions, content.get('start'), content.get('size'), 'next' in content.get('_links', {})))
+
+	@staticmethod
+	def _get_cached_response(url: str, cached: httpcache.CachedResponse) -> requests.Response:
+		response = requests.Response()
+		response.status_code = 200
+		response.url = url
+		response.encoding = 'utf-8'
+		response._content = cached.content
+
+		if cached.content_type:
+			response.headers['Content-Type'] = cached.content_type
+
+		return response
+
+	def _send(self, *args) -> requests.Response:
+		"""Send a request within the rate limits, shared reads are sent once."""
+		if self._rate_limiter is None:
+			return super().request(*args)
+
+		self._rate_limiter.acquire()
+
+		try:
+			response = super().request(*args)
+		except requests.HTTPError as e:
+			if e.response is not None:
+				self._rate_limiter.add_bytes(self._get_transferred_size(e.response))
+
+			raise
+
+		self._rate_limiter.add_bytes(self._get_transferred_size(response))
+
+		return response
+
+	@staticmethod
+	def _get_transferred_size(response: requests.Response) -> int:
+		body = response.request.body if response.request is not None else None
+
+		return len(body or b'') + len(response.content or b'')
+
 	def traverse_descendant_pages(
 		self,
 		page_id: str,
 		expand: str | None = None,
-	) -> tp.Generator[StrDict, None, None]:
-		"""Recursively get all descendant pages of the current page."""
+	) -> tp.Generator[tuple[str, StrDict], None, None]:
+		"""Recursively get all descendant pages of the current page.
+
+		:return: A generator that returns tuples of the parent page ID and the page
+		"""
 		parent_page_id_queue = queue.SimpleQueue()
 		parent_page_id_queue.put(page_id)
 
@@ -23,7 +324,63 @@ class CustomConfluence(Confluence):
 			child_pages = self.get_page_child_by_type(parent_page_id, type='page', expand=expand)
 			for child_page in child_pages:
 				parent_page_id_queue.put(child_page['id'])
-				yield child_page
+				yield parent_page_id, child_page
+
+	def traverse_child_pages(
+		self,
+		page_id: str,
+		expand: str | None = None,
+		limit: int | None = None,
+	) -> tp.Generator[StrDict, None, None]:
+		"""Get child pages of the page lazily.
+
+		Child pages are requested by pages of the limit size as the generator is consumed,
+		so only one response is kept in memory.
+		"""
+		params = {}
+
+		if limit:
+			params['limit'] = limit
+		if expand:
+			params['expand'] = expand
+
+		try:
+			yield from self._get_paged(f'rest/api/content/{page_id}/child/page', params=params)
+		except requests.HTTPError as e:
+			if e.response.status_code == 404:
+				# Raise ApiError as the documented reason is ambiguous
+				raise errors.ApiError(
+					'There is no content with the given id, '
+					'or the calling user does not have permission to view the content',
+					reason=e,
+				)
+
+			raise
+
+	def get_modified_pages(
+		self,
+		page_id: str,
+		minutes: int,
+		expand: str | None = None,
+	) -> tp.Generator[StrDict, None, None]:
+		"""Get the page and its descendant pages modified in the last minutes."""
+		cql = f'type = page and (id = {page_id} or ancestor = {page_id}) and lastmodified >= now("-{minutes}m")'
+
+		return self._get_paged('rest/api/content/search', params={'cql': cql, 'expand': expand})
+
+	def get_modified_attachments(
+		self,
+		space: str,
+		minutes: int,
+		expand: str | None = None,
+	) -> tp.Generator[StrDict, None, None]:
+		"""Get attachments of the space modified in the last minutes.
+
+		Attachments can't be searched by the ancestor page, so they are searched in the whole space.
+		"""
+		cql = f'type = attachment and space = "{space}" and lastmodified >= now("-{minutes}m")'
+
+		return self._get_paged('rest/api/content/search', params={'cql': cql, 'expand': expand})
 
 	def traverse_page_attachments(
 		self,
@@ -78,12 +435,54 @@ class CustomConfluence(Confluence):
 		attachment_names: list[str],
 		expand: str | None = None,
 	) -> list[StrDict]:
-		attachments = list(self.traverse_page_attachments(page_id, expand=expand))
-		return [attachment for attachment in attachments if attachment['title'] in attachment_names]
+		"""Get attachments of the page by their names.
+
+		Every attachment is requested by its name, so all attachments of the page aren't listed.
+		"""
+		attachments = []
+
+		for attachment_name in attachment_names:
+			attachments.extend(self.get_attachment_by_name(page_id, attachment_name, expand=expand))
+
+		return attachments
+
+	def get_attachment_by_name(self, page_id: str, attachment_name: str, expand: str | None = None) -> list[StrDict]:
+		"""Get the attachment of the page by its name.
+
+		:return: A list with the attachment, or an empty list if there is no such attachment
+		"""
+		attachments = self.traverse_page_attachments(page_id, expand=expand, filename=attachment_name)
+		# The filter of the endpoint isn't strict in some versions
+		return [attachment for attachment in attachments if attachment['title'] == attachment_name]
+
+	@staticmethod
+	def is_page_content_same(page: StrDict, body: str, title: str) -> bool:
+		"""Compare a page fetched with the body like is_page_content_is_already_updated does, without fetching it again."""
+		if page['title'] != title:
+			return False
+
+		page_body = page['body']['storage']['value']
+
+		if page_body:
+			page_body = utils.symbol_normalizer(page_body)
+
+		return page_body.strip() == body.strip()
 
 	def get_page_by_title_or_homepage(self, space: str, title: str | None = None, expand: tp.Any = None) -> StrDict:
 		if title:
 			return self.get_page_by_title(space, title, expand=expand)
 		else:
-			space_data = self.get_space(space)
-			return self.get_page_by_id(space_data['homepage']['id'], expand)
+			return self.get_page_by_id(self.get_space_homepage_id(space), expand)
+
+	def get_space_homepage_id(self, space: str) -> str:
+		"""Get the id of the space homepage, it is requested once per client."""
+		with self._space_homepage_ids_lock:
+			homepage_id = self._space_homepage_ids.get(space)
+
+		if homepage_id is None:
+			homepage_id = self.get_space(space)['homepage']['id']
+
+			with self._space_homepage_ids_lock:
+				self._space_homepage_ids[space] = homepage_id
+
+		return homepage_id
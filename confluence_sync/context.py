@@ -1,29 +1,86 @@
 import dataclasses as dc
+import sys
+import threading
+import typing as tp
 
 
-@dc.dataclass
+# Slots keep pages small, an index of a large hierarchy holds hundreds of thousands of them
+@dc.dataclass(slots=True)
 class Page:
 	src_id: str
 	src_space: str
 	src_title: str
 	dst_id: str | None = None
+	# It is set only for pages in the hierarchy, except the root page
+	src_parent_id: str | None = None
 
 
 class PageIndex:
+	"""Thread-safe index of the pages of a sync.
+
+	Pages are looked up by title within their space, so the space keys are stored once
+	instead of a (space, title) key per page.
+	"""
+
 	def __init__(self) -> None:
-		self._page_id_map = {}
-		self._page_title_map = {}
+		self._lock = threading.Lock()
+		# src_id: page
+		self._page_id_map: dict[str, Page] = {}
+		# space: {title: page}
+		self._page_title_map: dict[str, dict[str, Page]] = {}
 
 	@property
 	def count(self) -> int:
 		return len(self._page_id_map)
 
 	def add_page(self, page_context: Page) -> None:
-		self._page_id_map[page_context.src_id] = page_context
-		self._page_title_map[(page_context.src_space, page_context.src_title)] = page_context
+		# Spaces of pages come from different responses, so each page would keep its own copy otherwise
+		page_context.src_space = sys.intern(page_context.src_space)
+
+		with self._lock:
+			self._page_id_map[page_context.src_id] = page_context
+			self._page_title_map.setdefault(page_context.src_space, {})[page_context.src_title] = page_context
+
+	def rename_page(self, page_id: str, title: str) -> None:
+		with self._lock:
+			page_context = self._page_id_map[page_id]
+			space_titles = self._page_title_map[page_context.src_space]
+
+			space_titles.pop(page_context.src_title, None)
+			page_context.src_title = title
+			space_titles[title] = page_context
+
+	def move_page(self, page_id: str, parent_id: str) -> None:
+		with self._lock:
+			self._page_id_map[page_id].src_parent_id = parent_id
+
+	def set_dst_id(self, page_context: Page, dst_id: str) -> None:
+		with self._lock:
+			page_context.dst_id = dst_id
+
+	def pages(self) -> tp.Iterator[Page]:
+		"""Iterate over the pages in the order they were added.
+
+		Pages added meanwhile aren't iterated.
+		"""
+		with self._lock:
+			return iter(list(self._page_id_map.values()))
 
 	def search_by_id(self, page_id: str) -> Page | None:
 		return self._page_id_map.get(page_id)
 
 	def search_by_title(self, space: str, title: str) -> Page | None:
-		return self._page_title_map.get((space, title))
+		space_titles = self._page_title_map.get(space)
+
+		return space_titles.get(title) if space_titles else None
+
+	def is_descendant(self, page_id: str, ancestor_page_id: str) -> bool:
+		page = self.search_by_id(page_id)
+
+		while page and page.src_parent_id:
+			if page.src_parent_id == ancestor_page_id:
+				return True
+
+			page = self.search_by_id(page.src_parent_id)
+
+		return False
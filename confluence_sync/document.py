@@ -0,0 +1,133 @@
+import copy
+import functools
+import hashlib
+import typing as tp
+
+from lxml import etree
+
+from confluence_sync import cache
+from confluence_sync.parser import StorageParser
+
+_parser = StorageParser()
+
+# An lxml tree takes several times more memory than the text it is parsed from
+_TREE_SIZE_FACTOR = 5
+# Approximate memory size of an lxml element
+_ELEMENT_SIZE = 512
+
+
+class PageDocument:
+	"""Page body that is parsed once and shared by all formatting phases.
+
+	Initially, the tree is the parsed source body. After the page is formatted,
+	the tree is the one written to the destination and the formatted body is kept.
+
+	A document must not be used by several threads at the same time.
+	"""
+
+	__slots__ = ('page_id', 'body', 'formatted_body', '_root', '_parse')
+
+	def __init__(
+		self,
+		page_id: str,
+		body: str,
+		parse: tp.Callable[[str], etree._Element] | None = None,
+	) -> None:
+		self.page_id = page_id
+		self.body = body
+		self.formatted_body: str | None = None
+
+		self._root: etree._Element | None = None
+		self._parse = parse or _parser.parse
+
+	@property
+	def root(self) -> etree._Element:
+		if self._root is None:
+			self._root = self._parse(self.body)
+
+		return self._root
+
+	@property
+	def formatted(self) -> bool:
+		return self.formatted_body is not None
+
+	@property
+	def size(self) -> int:
+		"""Approximate memory size of the document."""
+		size = len(self.body) + len(self.formatted_body or '')
+
+		if self._root is not None:
+			size += len(self.body) * _TREE_SIZE_FACTOR
+
+		return size
+
+	def set_formatted(self) -> str:
+		"""Serialize the tree after it has been formatted."""
+		self.formatted_body = _parser.to_storage(self.root)
+		return self.formatted_body
+
+
+class DocumentStore:
+	"""Page documents of a session by source page id, bounded by their approximate memory size.
+
+	Evicted documents are parsed again when they are needed.
+
+	If shared trees are given, bodies are parsed once for all stores using them,
+	and every store gets its own copy of the tree. Shared trees are keyed by the digests of the bodies,
+	so the bodies aren't kept twice.
+	"""
+
+	def __init__(
+		self,
+		max_size: int = 256 * 1024 ** 2,
+		shared_trees: cache.SharedReader[bytes, etree._Element] | None = None,
+	) -> None:
+		self._documents: cache.LRUCache[str, PageDocument] = cache.LRUCache(max_size, self._sizeof)
+		self._shared_trees = shared_trees
+
+	@property
+	def stats(self) -> cache.CacheStats:
+		return self._documents.stats
+
+	def get(self, page_id: str) -> PageDocument | None:
+		return self._documents.get(page_id)
+
+	def get_or_create(self, page_id: str, body: str) -> PageDocument:
+		"""Get the kept document of the body, or create one.
+
+		A formatted document isn't returned, since its tree can't be formatted again.
+		"""
+		document = self._documents.get(page_id)
+
+		if document is None or document.body != body or document.formatted:
+			parse = self._copy_shared_tree if self._shared_trees is not None else None
+			document = PageDocument(page_id, body, parse)
+
+		return document
+
+	def keep(self, document: PageDocument) -> None:
+		"""Add or update the document, so its size is taken into account."""
+		self._documents.put(document.page_id, document)
+
+	def discard(self, page_id: str) -> None:
+		self._documents.pop(page_id)
+
+	def clear(self) -> None:
+		self._documents.clear()
+
+	def _copy_shared_tree(self, body: str) -> etree._Element:
+		# Formatting changes the tree, so the shared one is copied
+		root = self._shared_trees.get_or_read(
+			hashlib.sha256(body.encode()).digest(),
+			functools.partial(_parser.parse, body),
+		)
+		return copy.deepcopy(root)
+
+	@staticmethod
+	def _sizeof(document: PageDocument) -> int:
+		return document.size
+
+
+def shared_tree_size(root: etree._Element) -> int:
+	"""Approximate memory size of a shared tree."""
+	return sum(1 for _ in root.iter()) * _ELEMENT_SIZE
@@ -1,12 +1,16 @@
 import abc
 import collections
+import copy
+import html
 import logging
+import re
 import threading
 import typing as tp
+import zlib
 
 from lxml import etree
 
-from confluence_sync import context
+from confluence_sync import cache, context, document
 from confluence_sync.confluence import CustomConfluence
 from confluence_sync.parser import StorageParser
 
@@ -48,22 +52,31 @@ class OutHierarchyPageTitleChecker(TagFormatter):
 
 
 class OutHierarchyPageTitleKeeper(TagFormatter):
+	"""Collect links to pages outside the hierarchy.
+
+	A link without a space key points to the space of the page that contains it.
+	"""
+
 	_xpath = 'ri:page'
 
-	def __init__(self, page_hierarchy_context: context.PageIndex, src_space: str) -> None:
+	def __init__(self, page_hierarchy_context: context.PageIndex) -> None:
 		self._page_hierarchy_context = page_hierarchy_context
-		self._src_space = src_space
 
 		self.pages = set()
 		self._pages_lock = threading.Lock()
 
+	def snapshot(self) -> set[tuple[str, str]]:
+		"""Get a copy of the collected pages, it is safe while other threads are formatting."""
+		with self._pages_lock:
+			return set(self.pages)
+
 	def format(self, page_context: context.Page, el: etree._Element) -> None:
-		page_space = _parser.get_tag_attr(el, 'ri:space-key')
+		page_space = _parser.get_tag_attr(el, 'ri:space-key') or page_context.src_space
 		page_title = _parser.get_tag_attr(el, 'ri:content-title')
 
-		if not self._page_hierarchy_context.search_by_title(page_space or self._src_space, page_title):
+		if not self._page_hierarchy_context.search_by_title(page_space, page_title):
 			with self._pages_lock:
-				self.pages.add((page_space or self._src_space, page_title))
+				self.pages.add((page_space, page_title))
 
 
 class PageTittleFormatter(TagFormatter):
@@ -152,76 +165,213 @@ class IncDrawIOFormatter(TagFormatter):
 
 	_delayed_comment = 'Fix references in included draw.io diagrams'
 
+	# Used to find referenced pages without parsing the page
+	_macro_re = re.compile(r'<ac:structured-macro\b[^>]*\bac:name="inc-drawio"[^>]*>(.*?)</ac:structured-macro>', re.DOTALL)
+	_page_id_param_re = re.compile(r'<ac:parameter\b[^>]*\bac:name="pageId"[^>]*>\s*(\d+)\s*</ac:parameter>')
+	_diagram_name_param_re = re.compile(r'<ac:parameter\b[^>]*\bac:name="diagramName"[^>]*>([^<]*)</ac:parameter>')
+
 	def __init__(
 		self,
 		src_cli: CustomConfluence,
 		dst_cli: CustomConfluence,
 		page_hierarchy_context: context.PageIndex,
+		document_store: document.DocumentStore | None = None,
+		page_body_cache_size: int = 32 * 1024 ** 2,
+		compress_page_bodies: bool = True,
+		delayed_pages: tp.MutableMapping[str, list[tuple[str, str, str]]] | None = None,
 	) -> None:
+		"""
+		:param delayed_pages: mapping to keep the delayed pages in, e.g. one kept on disk; a dict is used if not set
+		"""
 		self._src_cli = src_cli
 		self._dst_cli = dst_cli
 
 		self._page_hierarchy_context = page_hierarchy_context
+		self._document_store = document_store
 
 		#  page_id: [(macro_id, ref_page_id, ref_diagram_name), ...]
-		self._delayed_pages = collections.defaultdict(list)
+		self._delayed_pages = delayed_pages if delayed_pages is not None else {}
 		self._delayed_pages_lock = threading.Lock()
 
 		self._out_hierarchy_replacements = {}
-		self._page_root_cache = {}
+		# (page_id, macro_id): (ref_page_id, ref_diagram_name) of diagrams that become new sources of diagrams outside the hierarchy
+		self._new_sources = {}
+
+		# Bodies of referenced pages outside the hierarchy are kept serialized, since trees are much bigger,
+		# and parsed every time they are needed.
+		# page_id: body
+		self._page_body_cache: cache.LRUCache[str, str | bytes] = cache.LRUCache(page_body_cache_size, len)
+		self._compress_page_bodies = compress_page_bodies
 
 	@property
 	def delayed_pages_count(self) -> int:
 		return len(self._delayed_pages)
 
+	@property
+	def page_body_cache_stats(self) -> cache.CacheStats:
+		return self._page_body_cache.stats
+
+	def is_delayed(self, page_id: str) -> bool:
+		return page_id in self._delayed_pages
+
+	def delayed_diagrams(self, page_id: str) -> list[tuple[str, str, str]]:
+		"""Get the included diagrams of the page to fix as (macro_id, ref_page_id, ref_diagram_name)."""
+		with self._delayed_pages_lock:
+			return list(self._delayed_pages.get(page_id, ()))
+
+	def restore_delayed_page(self, page_id: str, diagrams: tp.Iterable[tuple[str, str, str]]) -> None:
+		"""Restore the diagrams to fix of a page copied by a previous run."""
+		with self._delayed_pages_lock:
+			self._delayed_pages[page_id] = list(diagrams)
+
+	def new_sources(self) -> tuple[dict[str, str], list[tuple[str, str, str, str]]]:
+		"""Get the chosen new sources of diagrams outside the hierarchy.
+
+		:return: A tuple with:
+			a dict of the destination page ID of the new source by the referenced page ID
+			a list of the diagrams that became new sources as (page_id, macro_id, ref_page_id, ref_diagram_name)
+		"""
+		return (
+			dict(self._out_hierarchy_replacements),
+			[(*key, *value) for key, value in self._new_sources.items()],
+		)
+
+	def restore_new_sources(
+		self,
+		replacements: dict[str, str],
+		new_sources: tp.Iterable[tuple[str, str, str, str]],
+	) -> None:
+		"""Restore the new sources chosen by a previous run."""
+		self._out_hierarchy_replacements.update(replacements)
+
+		for page_id, macro_id, ref_page_id, ref_diagram_name in new_sources:
+			self._new_sources[(page_id, macro_id)] = (ref_page_id, ref_diagram_name)
+
+	@classmethod
+	def scan_ref_page_ids(cls, body: str) -> set[str]:
+		"""Find IDs of the pages referenced by included diagrams.
+
+		The body isn't parsed, so the result is only a hint.
+		"""
+		ref_page_ids = set()
+
+		for macro_match in cls._macro_re.finditer(body):
+			ref_page_ids.update(cls._page_id_param_re.findall(macro_match.group(1)))
+
+		return ref_page_ids
+
+	@classmethod
+	def scan_ref_diagrams(cls, body: str) -> set[tuple[str, str]]:
+		"""Find the included diagrams as (ref_page_id, ref_diagram_name) without parsing the page."""
+		ref_diagrams = set()
+
+		for macro_match in cls._macro_re.finditer(body):
+			page_id_match = cls._page_id_param_re.search(macro_match.group(1))
+			diagram_name_match = cls._diagram_name_param_re.search(macro_match.group(1))
+
+			if page_id_match and diagram_name_match:
+				ref_diagrams.add((page_id_match.group(1), html.unescape(diagram_name_match.group(1))))
+
+		return ref_diagrams
+
 	def format(self, page_context: context.Page, el: etree._Element) -> None:
 		if not self._is_included(el):
 			return
 
 		ref_page_id_param = self._extract_ref_page_param(el)
+		macro_id = _parser.get_tag_attr(el, self._macro_id_attr_xpath)
+
+		# A page copied again keeps being the new source of its diagram, so the diagram is copied again
+		is_new_source = (page_context.src_id, macro_id) in self._new_sources
 
 		# If a diagram points to a page in the current copying hierarchy and the new page ID is known, the reference can be replaced.
-		if not self._try_substitute(ref_page_id_param):
+		if is_new_source or not self._try_substitute(ref_page_id_param):
 			# If the new page ID isn’t known, wait to replace the reference until it is available.
 			# Pages in the current copying hierarchy shouldn’t mark the current diagram as a new source right away,
 			# since sibling pages might reference the same diagram, causing multiple new sources in multithreaded mode.
-			macro_id = _parser.get_tag_attr(el, self._macro_id_attr_xpath)
 			ref_diagram_name_param = self._extract_ref_diagram_name(el)
 
 			diagram = (macro_id, ref_page_id_param.text, ref_diagram_name_param.text)
 
 			with self._delayed_pages_lock:
-				self._delayed_pages[page_context.src_id].append(diagram)
+				# The list is stored again, so the mapping may keep copies of the values
+				self._delayed_pages[page_context.src_id] = [*self._delayed_pages.get(page_context.src_id, ()), diagram]
+
+	def prepare_delayed_pages(self) -> list[str]:
+		"""Choose new sources for included diagrams outside the hierarchy.
+
+		Delayed pages are handled in the order of the page index, so the first page referencing a diagram
+		outside the hierarchy always becomes its new source, no matter in which order pages are fixed after that.
+		Must be called after all pages are synced.
+
+		:return: IDs of the delayed pages in the order of the page index
+		"""
+		page_ids = [
+			page.src_id
+			for page in self._page_hierarchy_context.pages()
+			if page.src_id in self._delayed_pages
+		]
+
+		for page_id in page_ids:
+			page_context = self._page_hierarchy_context.search_by_id(page_id)
+
+			for macro_id, ref_page_id, ref_diagram_name in self._delayed_pages[page_id]:
+				if not self._get_ref_page_id_replacement(ref_page_id):
+					self._out_hierarchy_replacements[ref_page_id] = page_context.dst_id
+					self._new_sources[(page_id, macro_id)] = (ref_page_id, ref_diagram_name)
 
-	def process_delayed_pages(self) -> tp.Generator[tuple[str, str, dict[str, list[str]], str], None, None]:
-		"""Handle all delayed pages.
+		return page_ids
 
-		:return: A generator that returns a tuple with:
-			the source page ID
+	def new_source_attachments(self) -> dict[str, set[str]]:
+		"""Get the attachments to copy to the new sources of diagrams.
+
+		Must be called after prepare_delayed_pages.
+
+		:return: A dict of attachment names by the referenced page ID
+		"""
+		attachments = collections.defaultdict(set)
+
+		for (page_id, _), (ref_page_id, ref_diagram_name) in self._new_sources.items():
+			if page_id in self._delayed_pages:
+				attachments[ref_page_id].update(self.diagram_attachment_names(ref_diagram_name))
+
+		return attachments
+
+	def process_delayed_page(self, page_id: str) -> tuple[str, dict[str, list[str]], str]:
+		"""Handle a delayed page.
+
+		Pages can be handled concurrently after prepare_delayed_pages is called.
+
+		:return: A tuple with:
 			the new page content
 			a dict of attachments to copy from other pages
 			a comment for the new page revision
 		"""
-		for page_id, diagrams in self._delayed_pages.items():
-			page_context = self._page_hierarchy_context.search_by_id(page_id)
-			# Get the destination page since it might have changed, because macros need to be fixed now
-			root = self._get_page_root(self._dst_cli, page_context.dst_id)
-			attachments = collections.defaultdict(list)
+		page_context = self._page_hierarchy_context.search_by_id(page_id)
+		root = self._get_formatted_page_root(page_context)
+		attachments = collections.defaultdict(list)
 
-			for macro_id, ref_page_id, ref_diagram_name in diagrams:
-				el = _parser.find(root, f'.//{self._diagram_by_macro_id_xpath.format(macro_id=macro_id)}')
-				ref_page_id_param = self._extract_ref_page_param(el)
+		for macro_id, ref_page_id, ref_diagram_name in self._delayed_pages[page_id]:
+			el = _parser.find(root, f'.//{self._diagram_by_macro_id_xpath.format(macro_id=macro_id)}')
 
-				if not self._try_substitute(ref_page_id_param):
-					ref_root = self._get_page_root_cached(self._src_cli, ref_page_id)
+			if (page_id, macro_id) in self._new_sources:
+				ref_root = self._get_page_root_cached(self._src_cli, ref_page_id)
 
-					self._copy(el, ref_root, ref_diagram_name)
-					self._out_hierarchy_replacements[ref_page_id] = page_context.dst_id
-					attachments[ref_page_id].append(ref_diagram_name)
-					attachments[ref_page_id].append(f'{ref_diagram_name}.png')
-					attachments[ref_page_id].append(f'~{ref_diagram_name}.tmp')
+				self._copy(el, ref_root, ref_diagram_name)
+				attachments[ref_page_id].extend(self.diagram_attachment_names(ref_diagram_name))
+			else:
+				self._try_substitute(self._extract_ref_page_param(el))
+
+		body = _parser.to_storage(root)
 
-			yield page_id, _parser.to_storage(root), attachments, self._delayed_comment
+		if self._document_store:
+			self._document_store.discard(page_id)
+
+		# The page is delayed again if it is copied again
+		with self._delayed_pages_lock:
+			self._delayed_pages.pop(page_id, None)
+
+		return body, attachments, self._delayed_comment
 
 	def _try_substitute(self, ref_page_id_param: etree._Element) -> bool:
 		"""Attempt to replace the source page ID.
@@ -249,13 +399,23 @@ class IncDrawIOFormatter(TagFormatter):
 		for c in el:
 			el.remove(c)
 
-		# Delete the revision number because it’s kept when copying
+		# Skip the revision number because it’s kept when copying.
+		# The parameters are copied, so the tree of the referenced page isn't changed.
 		revision_param = _parser.find(src_diagram, cls._revision_param_xpath)
-		src_diagram.remove(revision_param)
-
-		src_params = src_diagram.getchildren()
+		src_params = [copy.deepcopy(param) for param in src_diagram if param is not revision_param]
 		el.extend(src_params)
 
+	@staticmethod
+	def diagram_attachment_names(diagram_name: str) -> tuple[str, str, str]:
+		return diagram_name, f'{diagram_name}.png', f'~{diagram_name}.tmp'
+
+	@staticmethod
+	def has_diagram_attachments(attachment_titles: tp.Iterable[str]) -> bool:
+		"""Check if attachments contain a diagram, i.e. an attachment along with its PNG image."""
+		attachment_titles = set(attachment_titles)
+
+		return any(f'{title}.png' in attachment_titles for title in attachment_titles)
+
 	def _get_ref_page_id_replacement(self, ref_page_id: str) -> str | None:
 		"""Get a page ID to replace the provided page ID."""
 
@@ -271,17 +431,53 @@ class IncDrawIOFormatter(TagFormatter):
 
 		return None
 
+	def _get_formatted_page_root(self, page_context: context.Page) -> etree._Element:
+		"""Get the tree of the page as it was written to the destination."""
+		page_document = self._document_store.get(page_context.src_id) if self._document_store else None
+
+		if page_document and page_document.formatted:
+			return page_document.root
+
+		# The document is evicted, so get the destination page, because macros need to be fixed now
+		return self._get_page_root(self._dst_cli, page_context.dst_id)
+
 	@classmethod
 	def _get_page_root(cls, cli: CustomConfluence, page_id: str) -> etree._Element:
+		return _parser.parse(cls._get_page_body(cli, page_id))
+
+	@staticmethod
+	def _get_page_body(cli: CustomConfluence, page_id: str) -> str:
 		page = cli.get_page_by_id(page_id, expand='body.storage')
-		body = page['body']['storage']['value']
-		return _parser.parse(body)
+		return page['body']['storage']['value']
 
 	def _get_page_root_cached(self, cli: CustomConfluence, page_id: str) -> etree._Element:
-		if page_id not in self._page_root_cache:
-			self._page_root_cache[page_id] = self._get_page_root(cli, page_id)
+		"""Get the tree of a page, the page body is cached.
 
-		return self._page_root_cache[page_id]
+		Every call returns a new tree, so it can be changed.
+		"""
+		packed_body = self._page_body_cache.get(page_id)
+
+		if packed_body is None:
+			# Concurrent misses of the same page share one request if the client is single-flight
+			body = self._get_page_body(cli, page_id)
+			self._page_body_cache.put(page_id, self._pack_page_body(body))
+		else:
+			body = self._unpack_page_body(packed_body)
+
+		return _parser.parse(body)
+
+	def _pack_page_body(self, body: str) -> str | bytes:
+		if self._compress_page_bodies:
+			return zlib.compress(body.encode())
+
+		return body
+
+	@staticmethod
+	def _unpack_page_body(packed_body: str | bytes) -> str:
+		if isinstance(packed_body, bytes):
+			return zlib.decompress(packed_body).decode()
+
+		return packed_body
 
 	@classmethod
 	def _extract_ref_page_param(cls, el: etree._Element) -> etree._Element:
@@ -298,15 +494,48 @@ class IncDrawIOFormatter(TagFormatter):
 
 
 def format_page(page_context: context.Page, body: str, tag_formatters: tp.Iterable[TagFormatter]) -> str:
+	return format_document(page_context, document.PageDocument(page_context.src_id, body), tag_formatters)
+
+
+def format_document(
+	page_context: context.Page,
+	page_document: document.PageDocument,
+	tag_formatters: tp.Iterable[TagFormatter],
+) -> str:
+	"""Format the page document.
+
+	The document tree is changed in place, and the formatted body is kept in the document.
+	"""
+	if not _apply_tag_formatters(page_context, page_document, tag_formatters):
+		page_document.formatted_body = page_document.body
+		return page_document.body
+
+	return page_document.set_formatted()
+
+
+def scan_document(
+	page_context: context.Page,
+	page_document: document.PageDocument,
+	tag_formatters: tp.Iterable[TagFormatter],
+) -> None:
+	"""Run tag formatters that only read the page, e.g. to collect links, without formatting the document."""
+	_apply_tag_formatters(page_context, page_document, tag_formatters)
+
+
+def _apply_tag_formatters(
+	page_context: context.Page,
+	page_document: document.PageDocument,
+	tag_formatters: tp.Iterable[TagFormatter],
+) -> bool:
 	xpath_tag_formatters_map = collections.defaultdict(list)
 
 	for tf in tag_formatters:
 		xpath_tag_formatters_map[tf.xpath].append(tf)
 
 	if not xpath_tag_formatters_map:
-		return body
+		return False
 
-	root = _parser.parse(body)
+	root = page_document.root
 
 	for xpath, tag_formatters in xpath_tag_formatters_map.items():
 		xpath = f'.//{xpath}'
@@ -316,7 +545,7 @@ def format_page(page_context: context.Page, body: str, tag_formatters: tp.Iterab
 			for tf in tag_formatters:
 				tf.format(page_context, el)
 
-	return _parser.to_storage(root)
+	return True
 
 
 def title_formatter(
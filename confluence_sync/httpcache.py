@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+import typing as tp
+import zlib
+
+
+class CachedResponse(tp.NamedTuple):
+	content: bytes
+	content_type: str | None = None
+	# Validators the response is checked with before it is used
+	etag: str | None = None
+	last_modified: str | None = None
+	# Versions of the content in the response
+	fingerprint: str | None = None
+
+
+class HttpCache:
+	"""Thread-safe cache of GET responses kept in a SQLite database between runs.
+
+	Responses are kept with the validators they are checked with before they are used, so they are never stale:
+	the ETag and Last-Modified headers, or the versions of the content in the response.
+	The least recently used responses are removed once the total size exceeds the maximum.
+	"""
+
+	def __init__(self, path: str | os.PathLike, max_size: int = 1024 ** 3) -> None:
+		"""
+		:param path: path to the database file, it is created if it doesn't exist
+		:param max_size: maximum total size of the compressed responses,
+			a response bigger than a sixteenth of it isn't cached
+		"""
+		self._max_size = max_size
+
+		self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self._lock = threading.Lock()
+
+		# The cache is only an optimization, so a response lost by a crash is fetched again
+		self._conn.execute('PRAGMA journal_mode = WAL')
+		self._conn.execute('PRAGMA synchronous = OFF')
+		self._conn.execute(
+			'CREATE TABLE IF NOT EXISTS responses ('
+			'key TEXT PRIMARY KEY, content BLOB, content_type TEXT, etag TEXT, last_modified TEXT, fingerprint TEXT, '
+			'size INTEGER, used_at REAL'
+			')'
+		)
+		self._conn.execute('CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)')
+
+		self._size = self._conn.execute('SELECT coalesce(sum(size), 0) FROM responses').fetchone()[0]
+
+		# Responses served from the cache, and the ones fetched since they aren't cached or changed
+		self.hits = 0
+		self.misses = 0
+
+	def close(self) -> None:
+		with self._lock:
+			self._conn.close()
+
+	def get(self, key: str) -> CachedResponse | None:
+		with self._lock:
+			row = self._conn.execute(
+				'SELECT content, content_type, etag, last_modified, fingerprint FROM responses WHERE key = ?',
+				(key,),
+			).fetchone()
+
+		if row is None:
+			return None
+
+		return CachedResponse(zlib.decompress(row[0]), *row[1:])
+
+	def put(self, key: str, response: CachedResponse) -> None:
+		"""Save a response fetched since it isn't cached or is changed."""
+		content = zlib.compress(response.content)
+
+		if len(content) > self._max_size // 16:
+			self.discard(key)
+			return
+
+		with self._lock:
+			rows = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchall()
+
+			self._conn.execute(
+				'INSERT OR REPLACE INTO responses '
+				'(key, content, content_type, etag, last_modified, fingerprint, size, used_at) '
+				'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				(key, content, *response[1:], len(content), time.time()),
+			)
+			self._size += len(content) - (rows[0][0] if rows else 0)
+
+			self._evict()
+
+	def miss(self) -> None:
+		"""Count a response fetched since it isn't cached or is changed, whether it can be cached or not."""
+		with self._lock:
+			self.misses += 1
+
+	def use(self, key: str) -> None:
+		"""Mark the response as served from the cache, so it is evicted later."""
+		with self._lock:
+			self.hits += 1
+			self._conn.execute('UPDATE responses SET used_at = ? WHERE key = ?', (time.time(), key))
+
+	def discard(self, key: str) -> None:
+		with self._lock:
+			rows = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchall()
+
+			if rows:
+				self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+				self._size -= rows[0][0]
+
+	def _evict(self) -> None:
+		"""Remove the least recently used responses, must be called with the lock held."""
+		while self._size > self._max_size:
+			rows = self._conn.execute('SELECT key, size FROM responses ORDER BY used_at LIMIT 100').fetchall()
+
+			if not rows:
+				break
+
+			for key, size in rows:
+				if self._size <= self._max_size:
+					break
+
+				self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+				self._size -= size
@@ -0,0 +1,182 @@
+import json
+import pathlib
+import typing as tp
+
+from confluence_sync import sync
+
+try:
+	import yaml
+except ImportError:
+	yaml = None
+
+_job_keys = {
+	'name',
+	'source_space',
+	'source_title',
+	'source_id',
+	'dest_space',
+	'dest_title',
+	'dest_id',
+	'destinations',
+	'sync_out_hierarchy',
+	'replace_title_substr',
+	'start_title_with',
+}
+_destination_keys = {'url', 'basic', 'token', 'space', 'title', 'id'}
+# Keys of jobs and destinations with their types, ids are often written as numbers
+_key_types = {
+	'name': str,
+	'source_space': str,
+	'source_title': str,
+	'source_id': (str, int),
+	'dest_space': str,
+	'dest_title': str,
+	'dest_id': (str, int),
+	'destinations': list,
+	'sync_out_hierarchy': bool,
+	'replace_title_substr': list,
+	'start_title_with': str,
+	'url': str,
+	'basic': str,
+	'token': str,
+	'space': str,
+	'title': str,
+	'id': (str, int),
+}
+
+
+def load_jobs(path: str | pathlib.Path, defaults: dict[str, tp.Any] | None = None) -> list[sync.SyncJob]:
+	"""Read the jobs of a batch run from a JSON or YAML file.
+
+	The file contains a list of jobs, or an object with the list under the `jobs` key.
+	A job has the same keys as the command-line arguments, for example `source_space` or `dest_id`,
+	and the `destinations` list of other destination pages with their `url`, `basic` or `token`, `space`, `title` and `id`.
+
+	:param path: path to the job file, YAML files require PyYAML
+	:param defaults: values of the keys missed in jobs
+	:return: jobs in the order of the file
+	"""
+	path = pathlib.Path(path)
+
+	with path.open(encoding='utf-8') as f:
+		if path.suffix in ('.yaml', '.yml'):
+			if yaml is None:
+				raise ValueError('PyYAML must be installed to read YAML job files')
+
+			data = yaml.safe_load(f)
+		else:
+			data = json.load(f)
+
+	if isinstance(data, dict):
+		data = data.get('jobs')
+
+	if not isinstance(data, list):
+		raise ValueError('Job file must contain a list of jobs')
+
+	return [parse_job(i, job_data, defaults or {}) for i, job_data in enumerate(data, 1)]
+
+
+def parse_job(job_number: int, job_data: tp.Any, defaults: dict[str, tp.Any]) -> sync.SyncJob:
+	if not isinstance(job_data, dict):
+		raise ValueError(f'job {job_number}: must be an object')
+
+	unknown_keys = job_data.keys() - _job_keys
+
+	if unknown_keys:
+		raise ValueError(f'job {job_number}: unknown keys {", ".join(sorted(unknown_keys))}')
+
+	job_data = {**defaults, **job_data}
+
+	_validate_types(job_number, job_data)
+	_validate_page_identifier(job_number, 'source', job_data)
+
+	destinations = tuple(
+		_parse_destination(job_number, destination_data)
+		for destination_data in job_data.get('destinations') or ()
+	)
+
+	if not destinations or any(job_data.get(f'dest_{key}') is not None for key in ('id', 'space', 'title')):
+		_validate_page_identifier(job_number, 'dest', job_data)
+
+	replace_title_substr = job_data.get('replace_title_substr')
+
+	if replace_title_substr is not None and (
+		len(replace_title_substr) != 2 or not all(isinstance(value, str) for value in replace_title_substr)
+	):
+		raise ValueError(f'job {job_number}: replace_title_substr must contain the old and the new value')
+
+	return sync.SyncJob(
+		src_space=job_data.get('source_space'),
+		src_title=job_data.get('source_title'),
+		src_id=_to_str(job_data.get('source_id')),
+		dst_space=job_data.get('dest_space'),
+		dst_title=job_data.get('dest_title'),
+		dst_id=_to_str(job_data.get('dest_id')),
+		destinations=destinations,
+		sync_out_hierarchy=bool(job_data.get('sync_out_hierarchy')),
+		replace_title_substr=tuple(replace_title_substr) if replace_title_substr else None,
+		start_title_with=job_data.get('start_title_with'),
+		name=job_data.get('name'),
+	)
+
+
+def _parse_destination(job_number: int, destination_data: tp.Any) -> sync.DestinationConfig:
+	if not isinstance(destination_data, dict) or 'url' not in destination_data:
+		raise ValueError(f'job {job_number}: destinations must be objects with the url')
+
+	unknown_keys = destination_data.keys() - _destination_keys
+
+	if unknown_keys:
+		raise ValueError(f'job {job_number}: unknown destination keys {", ".join(sorted(unknown_keys))}')
+
+	_validate_types(job_number, destination_data, 'destination ')
+
+	if (destination_data.get('basic') is None) == (destination_data.get('token') is None):
+		raise ValueError(f'job {job_number}: one of the destination basic or token is required')
+
+	_validate_page_identifier(job_number, 'destination', {f'destination_{k}': v for k, v in destination_data.items()})
+
+	return sync.DestinationConfig(
+		confluence=confluence_config(destination_data['url'], destination_data.get('basic'), destination_data.get('token')),
+		space=destination_data.get('space'),
+		title=destination_data.get('title'),
+		id=_to_str(destination_data.get('id')),
+	)
+
+
+def confluence_config(url: str, basic: str | None = None, token: str | None = None) -> sync.ConfluenceConfig:
+	"""Create a confluence config with either the username and password separated by colon or the token."""
+	if basic:
+		username, password = basic.split(':', 1)
+		return sync.ConfluenceConfig(url=url, username=username, password=password)
+
+	return sync.ConfluenceConfig(url=url, token=token)
+
+
+def _validate_types(job_number: int, data: dict[str, tp.Any], prefix: str = '') -> None:
+	for key, value in data.items():
+		key_type = _key_types[key]
+
+		# bool is an int, so it isn't allowed where numbers are
+		if value is not None and (not isinstance(value, key_type) or (isinstance(value, bool) and key_type is not bool)):
+			raise ValueError(f'job {job_number}: {prefix}{key} has a wrong type')
+
+
+def _validate_page_identifier(job_number: int, prefix: str, job_data: dict[str, tp.Any]) -> None:
+	id_passed = job_data.get(f'{prefix}_id') is not None
+	space_passed = job_data.get(f'{prefix}_space') is not None
+	title_passed = job_data.get(f'{prefix}_title') is not None
+
+	if not id_passed and not (space_passed or title_passed):
+		raise ValueError(f'job {job_number}: one of {prefix}_id or ({prefix}_space and {prefix}_title) is required')
+
+	if id_passed and (space_passed or title_passed):
+		raise ValueError(f'job {job_number}: {prefix}_id is not allowed with {prefix}_space and {prefix}_title')
+
+	if not id_passed and space_passed != title_passed:
+		raise ValueError(f'job {job_number}: {prefix}_space must be passed with {prefix}_title')
+
+
+def _to_str(value: tp.Any) -> str | None:
+	# Ids are often written as numbers in job files
+	return str(value) if value is not None else None
@@ -0,0 +1,142 @@
+import dataclasses as dc
+import json
+import logging
+import pathlib
+import threading
+import typing as tp
+
+from confluence_sync import context
+
+_logger = logging.getLogger('confluence-sync')
+
+
+@dc.dataclass
+class JournalState:
+	"""Work of a session restored from its journal."""
+
+	# Settings of the session, a journal can only be resumed by the same session
+	header: dict[str, tp.Any] | None = None
+	# Pages of the hierarchy as (src_id, src_space, src_title, src_parent_id)
+	index: list[tuple[str, str, str, str | None]] | None = None
+	# src_id: page copied along with its attachments
+	pages: dict[str, context.Page] = dc.field(default_factory=dict)
+	# src_id: included draw.io diagrams of the page to fix as (macro_id, ref_page_id, ref_diagram_name)
+	delayed_pages: dict[str, list[tuple[str, str, str]]] = dc.field(default_factory=dict)
+	# Links to pages outside the hierarchy as (space, title)
+	links: set[tuple[str, str]] = dc.field(default_factory=set)
+	# ref_page_id: dst_id of the new source of diagrams outside the hierarchy
+	drawio_replacements: dict[str, str] = dc.field(default_factory=dict)
+	# Diagrams that became new sources as (page_id, macro_id, ref_page_id, ref_diagram_name)
+	drawio_new_sources: list[tuple[str, str, str, str]] = dc.field(default_factory=list)
+	# Pages whose included draw.io diagrams are fixed
+	fixed_drawio_page_ids: set[str] = dc.field(default_factory=set)
+
+
+class Journal:
+	"""Thread-safe append-only log of the work completed by a session.
+
+	Every record is a JSON line written as soon as the work is completed,
+	so the journal of a run that has died can be used to resume it.
+	"""
+
+	def __init__(self, path: str | pathlib.Path, resume: bool = False) -> None:
+		"""
+		:param path: path to the journal file
+		:param resume: if True, the state is read from the existing journal, and new records are appended to it;
+			otherwise, the journal is started over
+		"""
+		self._path = pathlib.Path(path)
+		self._lock = threading.Lock()
+
+		self.state = JournalState()
+		# True if the last record is written partially
+		partial_record = False
+
+		if resume and self._path.exists():
+			partial_record = self._read()
+
+		self._file = self._path.open('a' if resume else 'w', encoding='utf-8')
+
+		# New records start on a new line, so they aren't joined to the partial record
+		if partial_record:
+			self._file.write('\n')
+
+	@property
+	def resumed(self) -> bool:
+		"""True if the journal contains the work of the previous run."""
+		return self.state.header is not None and self.state.index is not None
+
+	def close(self) -> None:
+		with self._lock:
+			self._file.close()
+
+	def write_header(self, header: dict[str, tp.Any]) -> None:
+		self._write({'type': 'header', 'header': header})
+
+	def write_index(self, page_index: context.PageIndex) -> None:
+		pages = [
+			(page.src_id, page.src_space, page.src_title, page.src_parent_id)
+			for page in page_index.pages()
+		]
+
+		self._write({'type': 'index', 'pages': pages})
+
+	def write_page(self, page_context: context.Page, delayed_diagrams: list[tuple[str, str, str]]) -> None:
+		self._write({'type': 'page', 'page': dc.asdict(page_context), 'delayed': delayed_diagrams})
+
+	def write_links(self, links: tp.Iterable[tuple[str, str]]) -> None:
+		self._write({'type': 'links', 'links': sorted(links)})
+
+	def write_drawio_sources(
+		self,
+		replacements: dict[str, str],
+		new_sources: list[tuple[str, str, str, str]],
+	) -> None:
+		self._write({'type': 'drawio_sources', 'replacements': replacements, 'new_sources': new_sources})
+
+	def write_drawio_fixed(self, page_id: str) -> None:
+		self._write({'type': 'drawio_fixed', 'page_id': page_id})
+
+	def _write(self, record: dict[str, tp.Any]) -> None:
+		line = json.dumps(record, ensure_ascii=False)
+
+		with self._lock:
+			self._file.write(line + '\n')
+			self._file.flush()
+
+	def _read(self) -> bool:
+		"""Restore the state from the records, and check if the last record is written partially."""
+		state = self.state
+		line = ''
+
+		# A character written partially is replaced, so the partial record is skipped like others
+		with self._path.open(encoding='utf-8', errors='replace') as f:
+			for line in f:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					# The last record may be written partially if the run has died
+					_logger.warning('Skip broken journal record')
+					continue
+
+				record_type = record['type']
+
+				if record_type == 'header':
+					state.header = record['header']
+				elif record_type == 'index':
+					state.index = [tuple(page) for page in record['pages']]
+				elif record_type == 'page':
+					page_context = context.Page(**record['page'])
+					state.pages[page_context.src_id] = page_context
+
+					if record['delayed']:
+						state.delayed_pages[page_context.src_id] = [tuple(diagram) for diagram in record['delayed']]
+				elif record_type == 'links':
+					state.links.update(tuple(link) for link in record['links'])
+				elif record_type == 'drawio_sources':
+					state.drawio_replacements = record['replacements']
+					state.drawio_new_sources = [tuple(new_source) for new_source in record['new_sources']]
+				elif record_type == 'drawio_fixed':
+					state.fixed_drawio_page_ids.add(record['page_id'])
+
+		return bool(line) and not line.endswith('\n')
@@ -0,0 +1,102 @@
+import dataclasses as dc
+import hashlib
+import json
+import pathlib
+import typing as tp
+
+# Page actions
+CREATE = 'create'
+UPDATE = 'update'
+MOVE = 'move'
+KEEP = 'keep'
+
+
+@dc.dataclass
+class PlannedPage:
+	src_id: str
+	# Title of the destination page
+	title: str
+	action: str
+	# ID of the existing destination page
+	dst_id: str | None = None
+	# Titles of the attachments to upload
+	attachments: list[str] = dc.field(default_factory=list)
+	attachment_bytes: int = 0
+	nominal: bool = False
+	# Hash of the planned body, so a page changed since the plan is detected, None for nominal pages
+	body_hash: str | None = None
+
+
+def hash_body(body: str) -> str:
+	return hashlib.sha256(body.encode()).hexdigest()
+
+
+@dc.dataclass(slots=True, frozen=True)
+class PlanCost:
+	creates: int
+	updates: int
+	moves: int
+	unchanged: int
+	# Pages updated again once the pages referenced by their included draw.io diagrams are copied
+	drawio_fixes: int
+	attachment_uploads: int
+	attachment_bytes: int
+
+	@property
+	def write_requests(self) -> int:
+		return self.creates + self.updates + self.moves + self.drawio_fixes + self.attachment_uploads
+
+
+@dc.dataclass
+class Plan:
+	"""Changes a sync makes to the destination, computed without writing.
+
+	Applying the plan doesn't look up destination pages and attachments again,
+	so pages are written as soon as their parents are.
+	"""
+
+	# Settings of the session, a plan can only be applied by the same session
+	header: dict[str, tp.Any]
+	# Pages of the hierarchy as (src_id, src_space, src_title, src_parent_id)
+	index: list[tuple[str, str, str, str | None]]
+	# src_id: planned page
+	pages: dict[str, PlannedPage] = dc.field(default_factory=dict)
+	drawio_fixes: int = 0
+
+	def cost(self) -> PlanCost:
+		actions = [page.action for page in self.pages.values()]
+
+		return PlanCost(
+			creates=actions.count(CREATE),
+			updates=actions.count(UPDATE),
+			moves=actions.count(MOVE),
+			unchanged=actions.count(KEEP),
+			drawio_fixes=self.drawio_fixes,
+			attachment_uploads=sum(len(page.attachments) for page in self.pages.values()),
+			attachment_bytes=sum(page.attachment_bytes for page in self.pages.values()),
+		)
+
+	def save(self, path: str | pathlib.Path) -> None:
+		data = {
+			'header': self.header,
+			'index': self.index,
+			'pages': [dc.asdict(page) for page in self.pages.values()],
+			'drawio_fixes': self.drawio_fixes,
+		}
+
+		with pathlib.Path(path).open('w', encoding='utf-8') as f:
+			json.dump(data, f, ensure_ascii=False)
+
+	@classmethod
+	def load(cls, path: str | pathlib.Path) -> 'Plan':
+		with pathlib.Path(path).open(encoding='utf-8') as f:
+			data = json.load(f)
+
+		pages = (PlannedPage(**page_data) for page_data in data['pages'])
+
+		return cls(
+			header=data['header'],
+			index=[tuple(page) for page in data['index']],
+			pages={page.src_id: page for page in pages},
+			drawio_fixes=data['drawio_fixes'],
+		)
@@ -0,0 +1,120 @@
+import dataclasses as dc
+import threading
+import time
+import typing as tp
+
+
+@dc.dataclass(frozen=True)
+class RateLimit:
+	"""Limits of the requests to a Confluence instance, None means no limit."""
+
+	requests_per_second: float | None = None
+	bytes_per_second: float | None = None
+
+	def __bool__(self) -> bool:
+		"""True if any limit is set."""
+		return bool(self.requests_per_second or self.bytes_per_second)
+
+
+@dc.dataclass(slots=True)
+class RateLimitStats:
+	waits: int = 0
+	# Seconds the requests waited for the limits in total
+	wait_time: float = 0.0
+
+
+class TokenBucket:
+	"""Thread-safe token bucket.
+
+	Tokens are added at the rate up to the capacity. Taking more tokens than there are puts the bucket in debt,
+	so a take bigger than the capacity, like a large attachment, doesn't fail, and the next takes wait for the debt.
+	"""
+
+	def __init__(
+		self,
+		rate: float,
+		capacity: float | None = None,
+		clock: tp.Callable[[], float] = time.monotonic,
+	) -> None:
+		"""
+		:param rate: tokens added per second
+		:param capacity: maximum number of tokens, i.e. the burst, the tokens of one second if not set
+		:param clock: function returning the current time in seconds
+		"""
+		if rate <= 0:
+			raise ValueError('rate must be greater than 0')
+
+		self._rate = rate
+		self._capacity = capacity if capacity is not None else rate
+		self._tokens = self._capacity
+		self._clock = clock
+		self._updated_at = clock()
+		self._lock = threading.Lock()
+
+	def reserve(self, n: float) -> float:
+		"""Take the tokens and get the seconds to wait until they are added.
+
+		Takes are served in the order they are made, zero tokens are taken to wait for the debt.
+		"""
+		with self._lock:
+			now = self._clock()
+			self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+			self._updated_at = now
+			self._tokens -= n
+
+			return max(0.0, -self._tokens / self._rate)
+
+
+class RateLimiter:
+	"""Rate limits of a Confluence instance shared by all its clients.
+
+	A request is sent once there is a token for it and the transferred bytes are within the limit.
+	Bytes are counted once the request is done, since the size of the response isn't known before.
+	"""
+
+	def __init__(
+		self,
+		rate_limit: RateLimit,
+		clock: tp.Callable[[], float] = time.monotonic,
+		sleep: tp.Callable[[float], None] = time.sleep,
+	) -> None:
+		"""
+		:param rate_limit: limits of the instance
+		:param clock: function returning the current time in seconds
+		:param sleep: function waiting for the seconds
+		"""
+		self._requests = None
+		self._bytes = None
+		self._sleep = sleep
+
+		if rate_limit.requests_per_second:
+			self._requests = TokenBucket(rate_limit.requests_per_second, clock=clock)
+		if rate_limit.bytes_per_second:
+			self._bytes = TokenBucket(rate_limit.bytes_per_second, clock=clock)
+
+		# Statistics of all clients of the instance since the limiter is created
+		self.stats = RateLimitStats()
+		self._stats_lock = threading.Lock()
+
+	def acquire(self) -> None:
+		"""Wait until a request can be sent."""
+		delay = 0.0
+
+		if self._requests is not None:
+			delay = self._requests.reserve(1)
+		if self._bytes is not None:
+			delay = max(delay, self._bytes.reserve(0))
+
+		if delay <= 0:
+			return
+
+		with self._stats_lock:
+			self.stats.waits += 1
+			self.stats.wait_time += delay
+
+		self._sleep(delay)
+
+	def add_bytes(self, n: int) -> None:
+		"""Count the bytes transferred by a request."""
+		if self._bytes is not None and n > 0:
+			self._bytes.reserve(n)
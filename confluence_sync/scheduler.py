@@ -0,0 +1,198 @@
+import collections
+import heapq
+import itertools as it
+import os
+import threading
+import typing as tp
+from concurrent import futures
+
+# Priorities of work, lower runs first
+URGENT = 0
+NORMAL = 1
+
+
+def default_max_workers() -> int:
+	"""Number of workers of an executor, chosen like in ThreadPoolExecutor."""
+	return min(32, (os.cpu_count() or 1) + 4)
+
+
+class _Task(tp.NamedTuple):
+	future: futures.Future
+	fn: tp.Callable[..., tp.Any]
+	args: tuple
+	kwargs: dict[str, tp.Any]
+	# Size of the transferred data, it is set only for transfers
+	size: int | None = None
+
+
+class PriorityExecutor(futures.Executor):
+	"""Thread pool running work before transfers, and urgent work before the rest.
+
+	Work is anything that unblocks other tasks, like writing pages whose children wait for them.
+	Transfers are attachment copies, they get up to half of the workers while there is work waiting,
+	and all free workers otherwise. Large transfers get up to a quarter of the workers,
+	so a few huge attachments don't hold every worker while the pages wait.
+	"""
+
+	def __init__(self, max_workers: int | None = None, large_transfer_size: int = 64 * 1024 ** 2) -> None:
+		"""
+		:param max_workers: number of worker threads, the default one is used if not set
+		:param large_transfer_size: transfers of this size in bytes and bigger are large
+		"""
+		if max_workers is None:
+			max_workers = default_max_workers()
+
+		if max_workers <= 0:
+			raise ValueError('max_workers must be greater than 0')
+
+		self._max_workers = max_workers
+		self._large_transfer_size = large_transfer_size
+
+		self._max_transfers = max(1, max_workers // 2)
+		self._max_large_transfers = max(1, max_workers // 4)
+
+		# [(priority, seq, task), ...]
+		self._work: list[tuple[int, int, _Task]] = []
+		self._transfers: collections.deque[_Task] = collections.deque()
+		self._large_transfers: collections.deque[_Task] = collections.deque()
+		self._seq = it.count()
+
+		self._running_transfers = 0
+		self._running_large_transfers = 0
+
+		self._threads: list[threading.Thread] = []
+		self._idle_workers = 0
+		self._shutdown = False
+		self._changed = threading.Condition()
+
+	@property
+	def max_workers(self) -> int:
+		return self._max_workers
+
+	def submit(self, fn: tp.Callable[..., tp.Any], /, *args, **kwargs) -> futures.Future:
+		return self.submit_work(NORMAL, fn, *args, **kwargs)
+
+	def submit_work(self, priority: int, fn: tp.Callable[..., tp.Any], /, *args, **kwargs) -> futures.Future:
+		task = _Task(futures.Future(), fn, args, kwargs)
+
+		with self._changed:
+			self._ensure_running()
+			heapq.heappush(self._work, (priority, next(self._seq), task))
+			self._wake_worker()
+
+		return task.future
+
+	def submit_transfer(self, size: int, fn: tp.Callable[..., tp.Any], /, *args, **kwargs) -> futures.Future:
+		"""Submit a transfer of the data of the size in bytes."""
+		task = _Task(futures.Future(), fn, args, kwargs, size)
+
+		with self._changed:
+			self._ensure_running()
+
+			if size >= self._large_transfer_size:
+				self._large_transfers.append(task)
+			else:
+				self._transfers.append(task)
+
+			self._wake_worker()
+
+		return task.future
+
+	def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+		with self._changed:
+			self._shutdown = True
+
+			if cancel_futures:
+				tasks = [task for _, _, task in self._work] + list(self._transfers) + list(self._large_transfers)
+
+				self._work.clear()
+				self._transfers.clear()
+				self._large_transfers.clear()
+
+				for task in tasks:
+					task.future.cancel()
+
+			self._changed.notify_all()
+
+		if wait:
+			for thread in self._threads:
+				thread.join()
+
+	def _ensure_running(self) -> None:
+		if self._shutdown:
+			raise RuntimeError('cannot schedule new futures after shutdown')
+
+	def _wake_worker(self) -> None:
+		self._changed.notify()
+
+		# Idle workers may be already woken by previous tasks
+		queued_count = len(self._work) + len(self._transfers) + len(self._large_transfers)
+
+		if self._idle_workers < queued_count and len(self._threads) < self._max_workers:
+			thread = threading.Thread(
+				target=self._work_loop,
+				name=f'confluence-sync-worker-{len(self._threads)}',
+				daemon=True,
+			)
+			self._threads.append(thread)
+			thread.start()
+
+	def _take_task(self) -> _Task | None:
+		"""Take the next task to run, must be called with the lock held."""
+		can_take_large_transfer = self._large_transfers and self._running_large_transfers < self._max_large_transfers
+		can_take_transfer = self._transfers or can_take_large_transfer
+
+		if can_take_transfer and (not self._work or self._running_transfers < self._max_transfers):
+			# Large transfers are started first, since they take the longest
+			if can_take_large_transfer:
+				self._running_large_transfers += 1
+				task = self._large_transfers.popleft()
+			else:
+				task = self._transfers.popleft()
+
+			self._running_transfers += 1
+
+			return task
+
+		if self._work:
+			return heapq.heappop(self._work)[2]
+
+		return None
+
+	def _work_loop(self) -> None:
+		while True:
+			with self._changed:
+				while (task := self._take_task()) is None:
+					if self._shutdown:
+						return
+
+					self._idle_workers += 1
+					self._changed.wait()
+					self._idle_workers -= 1
+
+			self._run(task)
+
+			if task.size is not None:
+				with self._changed:
+					self._running_transfers -= 1
+
+					if task.size >= self._large_transfer_size:
+						self._running_large_transfers -= 1
+
+					# A transfer waiting for a free slot can run now
+					self._changed.notify()
+
+			# The arguments aren't kept while the worker is idle
+			del task
+
+	@staticmethod
+	def _run(task: _Task) -> None:
+		if not task.future.set_running_or_notify_cancel():
+			return
+
+		try:
+			result = task.fn(*task.args, **task.kwargs)
+		except BaseException as e:
+			task.future.set_exception(e)
+		else:
+			task.future.set_result(result)
@@ -0,0 +1,256 @@
+import collections.abc
+import itertools as it
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import typing as tp
+import weakref
+
+from confluence_sync import context
+
+KeyT = tp.TypeVar('KeyT', bound=tp.Hashable)
+ValueT = tp.TypeVar('ValueT', bound=tp.Any)
+
+# Rows read from the database at once while iterating
+_BATCH_SIZE = 1000
+
+
+class SpillDatabase:
+	"""Temporary SQLite database keeping the state of a session on disk instead of memory.
+
+	Only the pages SQLite caches are kept in memory, so the memory doesn't grow with the hierarchy.
+	The database is thread-safe, and its file is removed when it is closed.
+	"""
+
+	def __init__(self, directory: str | os.PathLike | None = None, cache_size: int = 16 * 1024 ** 2) -> None:
+		"""
+		:param directory: directory of the database file, the default temporary directory is used if not set
+		:param cache_size: maximum memory size of the pages cached by SQLite
+		"""
+		fd, self._path = tempfile.mkstemp(prefix='confluence-sync-', suffix='.sqlite', dir=directory)
+		os.close(fd)
+
+		self._conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+		self._lock = threading.Lock()
+		self._table_ids = it.count()
+
+		# The database isn't needed after a crash, so writes aren't made durable
+		self._conn.execute('PRAGMA journal_mode = OFF')
+		self._conn.execute('PRAGMA synchronous = OFF')
+		self._conn.execute(f'PRAGMA cache_size = {-(cache_size // 1024)}')
+
+		self._finalizer = weakref.finalize(self, self._remove, self._conn, self._path)
+
+	def close(self) -> None:
+		self._finalizer()
+
+	def page_index(self) -> 'DiskPageIndex':
+		return DiskPageIndex(self, self._new_table_name('pages'))
+
+	def queue(self) -> 'DiskQueue':
+		return DiskQueue(self, self._new_table_name('queue'))
+
+	def mapping(self) -> 'DiskMapping':
+		return DiskMapping(self, self._new_table_name('mapping'))
+
+	def execute(self, sql: str, params: tp.Sequence[tp.Any] = ()) -> list[tuple]:
+		with self._lock:
+			return self._conn.execute(sql, params).fetchall()
+
+	def execute_changes(self, sql: str, params: tp.Sequence[tp.Any] = ()) -> int:
+		"""Execute a statement changing rows and get the number of changed rows."""
+		with self._lock:
+			return self._conn.execute(sql, params).rowcount
+
+	def _new_table_name(self, prefix: str) -> str:
+		return f'{prefix}_{next(self._table_ids)}'
+
+	@staticmethod
+	def _remove(conn: sqlite3.Connection, path: str) -> None:
+		conn.close()
+
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			pass
+
+
+class DiskPageIndex(context.PageIndex):
+	"""Page index kept in the spill database.
+
+	Pages are read from the database on every search, so every search returns a new page object.
+	Destination IDs, titles and parents must be changed through the index to be saved.
+	"""
+
+	def __init__(self, database: SpillDatabase, table: str) -> None:
+		super().__init__()
+
+		self._db = database
+		self._table = table
+		self._count = 0
+
+		# Row IDs keep the order the pages were added in
+		self._db.execute(
+			f'CREATE TABLE {table} ('
+			'seq INTEGER PRIMARY KEY, src_id TEXT UNIQUE, src_space TEXT, src_title TEXT, dst_id TEXT, src_parent_id TEXT'
+			')'
+		)
+		self._db.execute(f'CREATE INDEX {table}_title ON {table} (src_space, src_title)')
+
+	@property
+	def count(self) -> int:
+		return self._count
+
+	def add_page(self, page_context: context.Page) -> None:
+		with self._lock:
+			if not self._db.execute(f'SELECT 1 FROM {self._table} WHERE src_id = ?', (page_context.src_id,)):
+				self._count += 1
+
+			# A page added again keeps its position
+			self._db.execute(
+				f'INSERT INTO {self._table} (src_id, src_space, src_title, dst_id, src_parent_id) VALUES (?, ?, ?, ?, ?) '
+				'ON CONFLICT (src_id) DO UPDATE SET '
+				'src_space = excluded.src_space, src_title = excluded.src_title, '
+				'dst_id = excluded.dst_id, src_parent_id = excluded.src_parent_id',
+				(
+					page_context.src_id,
+					page_context.src_space,
+					page_context.src_title,
+					page_context.dst_id,
+					page_context.src_parent_id,
+				),
+			)
+
+	def rename_page(self, page_id: str, title: str) -> None:
+		self._db.execute(f'UPDATE {self._table} SET src_title = ? WHERE src_id = ?', (title, page_id))
+
+	def move_page(self, page_id: str, parent_id: str) -> None:
+		self._db.execute(f'UPDATE {self._table} SET src_parent_id = ? WHERE src_id = ?', (parent_id, page_id))
+
+	def set_dst_id(self, page_context: context.Page, dst_id: str) -> None:
+		with self._lock:
+			page_context.dst_id = dst_id
+
+			self._db.execute(f'UPDATE {self._table} SET dst_id = ? WHERE src_id = ?', (dst_id, page_context.src_id))
+
+	def pages(self) -> tp.Iterator[context.Page]:
+		"""Iterate over the pages in the order they were added.
+
+		Pages added meanwhile aren't iterated.
+		"""
+		rows = self._db.execute(f'SELECT max(seq) FROM {self._table}')
+		last_seq = rows[0][0] or 0
+		seq = 0
+
+		while seq < last_seq:
+			rows = self._db.execute(
+				f'SELECT seq, src_id, src_space, src_title, dst_id, src_parent_id FROM {self._table} '
+				'WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?',
+				(seq, last_seq, _BATCH_SIZE),
+			)
+
+			if not rows:
+				break
+
+			for row in rows:
+				yield context.Page(*row[1:])
+
+			seq = rows[-1][0]
+
+	def search_by_id(self, page_id: str) -> context.Page | None:
+		rows = self._db.execute(
+			f'SELECT src_id, src_space, src_title, dst_id, src_parent_id FROM {self._table} WHERE src_id = ?',
+			(page_id,),
+		)
+
+		return context.Page(*rows[0]) if rows else None
+
+	def search_by_title(self, space: str, title: str) -> context.Page | None:
+		# The last added page is found, like in the memory index
+		rows = self._db.execute(
+			f'SELECT src_id, src_space, src_title, dst_id, src_parent_id FROM {self._table} '
+			'WHERE src_space = ? AND src_title = ? ORDER BY seq DESC LIMIT 1',
+			(space, title),
+		)
+
+		return context.Page(*rows[0]) if rows else None
+
+
+class DiskQueue(tp.Generic[ValueT]):
+	"""FIFO queue kept in the spill database, items are pickled.
+
+	The queue isn't thread-safe.
+	"""
+
+	def __init__(self, database: SpillDatabase, table: str) -> None:
+		self._db = database
+		self._table = table
+
+		# Items are numbered in the order they are appended
+		self._head = 0
+		self._tail = 0
+
+		self._db.execute(f'CREATE TABLE {table} (seq INTEGER PRIMARY KEY, value BLOB)')
+
+	def append(self, item: ValueT) -> None:
+		self._db.execute(
+			f'INSERT INTO {self._table} (seq, value) VALUES (?, ?)',
+			(self._tail, pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)),
+		)
+		self._tail += 1
+
+	def popleft(self) -> ValueT:
+		if not self:
+			raise IndexError('pop from an empty queue')
+
+		rows = self._db.execute(f'SELECT value FROM {self._table} WHERE seq = ?', (self._head,))
+		self._db.execute(f'DELETE FROM {self._table} WHERE seq = ?', (self._head,))
+		self._head += 1
+
+		return pickle.loads(rows[0][0])
+
+	def __len__(self) -> int:
+		return self._tail - self._head
+
+
+class DiskMapping(collections.abc.MutableMapping[KeyT, ValueT]):
+	"""Mapping kept in the spill database, keys must be strings or numbers, values are pickled.
+
+	Single operations are thread-safe, changing a value read before needs a lock.
+	"""
+
+	def __init__(self, database: SpillDatabase, table: str) -> None:
+		self._db = database
+		self._table = table
+
+		self._db.execute(f'CREATE TABLE {table} (key PRIMARY KEY, value BLOB)')
+
+	def __getitem__(self, key: KeyT) -> ValueT:
+		rows = self._db.execute(f'SELECT value FROM {self._table} WHERE key = ?', (key,))
+
+		if not rows:
+			raise KeyError(key)
+
+		return pickle.loads(rows[0][0])
+
+	def __setitem__(self, key: KeyT, value: ValueT) -> None:
+		self._db.execute(
+			f'INSERT OR REPLACE INTO {self._table} (key, value) VALUES (?, ?)',
+			(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)),
+		)
+
+	def __delitem__(self, key: KeyT) -> None:
+		if not self._db.execute_changes(f'DELETE FROM {self._table} WHERE key = ?', (key,)):
+			raise KeyError(key)
+
+	def __contains__(self, key: tp.Any) -> bool:
+		return bool(self._db.execute(f'SELECT 1 FROM {self._table} WHERE key = ?', (key,)))
+
+	def __iter__(self) -> tp.Iterator[KeyT]:
+		rows = self._db.execute(f'SELECT key FROM {self._table}')
+		return (row[0] for row in rows)
+
+	def __len__(self) -> int:
+		return self._db.execute(f'SELECT count(*) FROM {self._table}')[0][0]
@@ -1,21 +1,47 @@
 import collections
+import collections.abc
+import contextlib
 import dataclasses as dc
 import datetime as dt
+import functools
 import itertools as it
 import logging
-import queue
+import math
+import pathlib
 import threading
+import time
 import typing as tp
 from concurrent import futures
 
+import requests
 from atlassian import errors
-
-from confluence_sync import context, events, fmt, observer, tree
+from lxml import etree
+
+from confluence_sync import (
+	bundle,
+	cache,
+	context,
+	document,
+	events,
+	fmt,
+	httpcache,
+	journal,
+	observer,
+	plan,
+	ratelimit,
+	scheduler,
+	spill,
+	tree,
+)
 from confluence_sync.confluence import CustomConfluence, StrDict
 
+# Child pages requested at once, they are read as the queue of pages to sync has room
+_CHILD_PAGE_BATCH_SIZE = 25
+
 
 @dc.dataclass(slots=True)
 class OutHierarchyPage:
+	id: str
 	title: str
 	# True if the page is just used to keep the tree structure;
 	# otherwise, False, which means the page itself is copied.
@@ -30,6 +56,206 @@ class ConfluenceConfig:
 	token: str | None = None
 
 
+@dc.dataclass(frozen=True)
+class DestinationConfig:
+	"""A destination page of a hierarchy synced to several destinations."""
+
+	confluence: ConfluenceConfig
+	space: str | None = None
+	title: str | None = None
+	id: str | None = None
+
+
+@dc.dataclass(frozen=True)
+class SyncJob:
+	"""A page hierarchy copied by a batch run."""
+
+	src_space: str | None = None
+	src_title: str | None = None
+	src_id: str | None = None
+	dst_space: str | None = None
+	dst_title: str | None = None
+	dst_id: str | None = None
+	destinations: tuple[DestinationConfig, ...] = ()
+	sync_out_hierarchy: bool = False
+	replace_title_substr: tuple[str, str] | None = None
+	start_title_with: str | None = None
+	name: str | None = None
+
+	@property
+	def display_name(self) -> str:
+		if self.name:
+			return self.name
+
+		src = self.src_id if self.src_id is not None else f'{self.src_space}/{self.src_title or ""}'
+		dst = self.dst_id if self.dst_id is not None else f'{self.dst_space}/{self.dst_title or ""}'
+
+		return f'{src} -> {dst}'
+
+
+class DeadlineReached(Exception):
+	"""The run is stopped by the deadline, it can be resumed from its journal."""
+
+
+class _Countdown:
+	"""Call the function when the count of done calls reaches zero."""
+
+	def __init__(self, count: int, fn: tp.Callable[[], None]) -> None:
+		self._count = count
+		self._fn = fn
+		self._lock = threading.Lock()
+
+	def done(self) -> None:
+		with self._lock:
+			self._count -= 1
+			finished = self._count == 0
+
+		if finished:
+			self._fn()
+
+
+class _KeyLocks:
+	"""Locks of keys, a lock is kept only while it is held or waited for."""
+
+	def __init__(self) -> None:
+		self._lock = threading.Lock()
+		# key: [lock, holder and waiter count]
+		self._locks: dict[str, list] = {}
+
+	@contextlib.contextmanager
+	def hold(self, key: str) -> tp.Iterator[None]:
+		with self._lock:
+			entry = self._locks.setdefault(key, [threading.Lock(), 0])
+			entry[1] += 1
+
+		try:
+			with entry[0]:
+				yield
+		finally:
+			with self._lock:
+				entry[1] -= 1
+
+				if not entry[1]:
+					del self._locks[key]
+
+	def __len__(self) -> int:
+		return len(self._locks)
+
+
+class _BoundedTasks:
+	"""Tasks of a session submitted to the shared executors, bounded by the number of submitted and unfinished tasks.
+
+	If the limit is reached, the task is run by the caller, so the queues of the executors don't grow,
+	and workers submitting tasks never wait for each other. Reads have a separate limit of the same size,
+	so reads ahead don't take the places of the writes. Transfers have a separate and bigger limit:
+	they are queued until the transfer executor has free workers for them, and a queued transfer is small.
+	Futures are forgotten as soon as they are done, and the first error is kept until it is raised.
+	"""
+
+	def __init__(
+		self,
+		read_executor: scheduler.PriorityExecutor,
+		write_executor: scheduler.PriorityExecutor,
+		transfer_executor: scheduler.PriorityExecutor,
+		max_tasks: int,
+		max_transfers: int,
+	) -> None:
+		self._read_executor = read_executor
+		self._write_executor = write_executor
+		self._transfer_executor = transfer_executor
+		self._work_semaphore = threading.BoundedSemaphore(max_tasks)
+		self._read_semaphore = threading.BoundedSemaphore(max_tasks)
+		self._transfer_semaphore = threading.BoundedSemaphore(max_transfers)
+
+		self._futures: set[futures.Future] = set()
+		self._error: Exception | None = None
+		self._changed = threading.Condition()
+
+	def submit(self, fn: tp.Callable[..., tp.Any], *args, **kwargs) -> futures.Future:
+		return self._submit(self._work_semaphore, self._write_executor.submit, fn, args, kwargs)
+
+	def submit_read(self, fn: tp.Callable[..., tp.Any], *args, **kwargs) -> futures.Future:
+		return self._submit(self._read_semaphore, self._read_executor.submit, fn, args, kwargs)
+
+	def submit_transfer(self, size: int, fn: tp.Callable[..., tp.Any], *args, **kwargs) -> futures.Future:
+		"""Submit a transfer of the data of the size in bytes."""
+		return self._submit(
+			self._transfer_semaphore,
+			functools.partial(self._transfer_executor.submit_transfer, size),
+			fn,
+			args,
+			kwargs,
+		)
+
+	def raise_error(self) -> None:
+		"""Raise the error of a failed task, if any."""
+		with self._changed:
+			error, self._error = self._error, None
+
+		if error is not None:
+			raise error
+
+	def wait(self) -> None:
+		"""Wait until all tasks, including the ones submitted meanwhile, are done, or until a task fails."""
+		with self._changed:
+			while self._futures and self._error is None:
+				self._changed.wait()
+
+		self.raise_error()
+
+	def _submit(
+		self,
+		semaphore: threading.BoundedSemaphore,
+		submit: tp.Callable[..., futures.Future],
+		fn: tp.Callable[..., tp.Any],
+		args: tuple,
+		kwargs: dict[str, tp.Any],
+	) -> futures.Future:
+		if not semaphore.acquire(blocking=False):
+			return self._run(fn, *args, **kwargs)
+
+		try:
+			ft = submit(fn, *args, **kwargs)
+		except Exception:
+			semaphore.release()
+			raise
+
+		with self._changed:
+			self._futures.add(ft)
+
+		ft.add_done_callback(functools.partial(self._on_done, semaphore))
+
+		return ft
+
+	def _run(self, fn: tp.Callable[..., tp.Any], *args, **kwargs) -> futures.Future:
+		ft = futures.Future()
+
+		try:
+			ft.set_result(fn(*args, **kwargs))
+		except Exception as e:
+			ft.set_exception(e)
+			self._set_error(e)
+
+		return ft
+
+	def _on_done(self, semaphore: threading.BoundedSemaphore, ft: futures.Future) -> None:
+		semaphore.release()
+
+		if not ft.cancelled() and ft.exception() is not None:
+			self._set_error(ft.exception())
+
+		with self._changed:
+			self._futures.discard(ft)
+			self._changed.notify_all()
+
+	def _set_error(self, error: Exception) -> None:
+		with self._changed:
+			if self._error is None:
+				self._error = error
+
+			self._changed.notify_all()
+
+
 class _ConfluenceSynchronizerSession(observer.Observable):
 	_datetime_parser = dt.datetime.fromisoformat
 	_logger = logging.getLogger('confluence-sync')
@@ -37,7 +263,9 @@ class _ConfluenceSynchronizerSession(observer.Observable):
 	def __init__(
 		self,
 		*,
-		executor: futures.ThreadPoolExecutor,
+		read_executor: scheduler.PriorityExecutor,
+		write_executor: scheduler.PriorityExecutor,
+		transfer_executor: scheduler.PriorityExecutor,
 		src_cli: CustomConfluence,
 		dst_cli: CustomConfluence,
 		src_space: str | None = None,
@@ -49,13 +277,34 @@ class _ConfluenceSynchronizerSession(observer.Observable):
 		sync_out_hierarchy: bool = False,
 		replace_title_substr: tuple[str, str] | None = None,
 		start_title_with: str | None = None,
+		shared_trees: cache.SharedReader[bytes, etree._Element] | None = None,
+		page_cache: cache.PageCache | None = None,
+		attachment_cache: cache.AttachmentCache | None = None,
+		journal: journal.Journal | None = None,
+		deadline: dt.datetime | None = None,
+		sync_plan: plan.Plan | None = None,
+		spill_database: spill.SpillDatabase | None = None,
+		max_page_tasks: int = 64,
+		max_tasks: int = 64,
+		max_transfers: int = 1024,
 	):
 		super().__init__()
 
 		# THREADING
-		self._executor = executor
+		# Source reads, destination writes and attachment copies run in separate lanes,
+		# so reading the next pages overlaps with writing the current ones
+		self._read_executor = read_executor
+		self._write_executor = write_executor
+		# Page tasks of a tree submitted to the write executor at once, the rest wait in a queue
+		self._max_page_tasks = max_page_tasks
+		# Counters of the stats
 		self._lock = threading.Lock()
-		self._futures = []
+		# Uploads to the same destination page are serialized, uploads to different pages run concurrently
+		self._attachment_locks = _KeyLocks()
+		# Tasks other than the pages of trees, e.g. attachment copies
+		self._tasks = _BoundedTasks(read_executor, write_executor, transfer_executor, max_tasks, max_transfers)
+		# src page id: future of the attachments listed by the read executor before the page is synced
+		self._prefetched_attachments: dict[str, futures.Future] = {}
 
 		# CLIENTS
 		self._src_cli = src_cli
@@ -78,18 +327,62 @@ class _ConfluenceSynchronizerSession(observer.Observable):
 
 		self._sync_out_hierarchy = sync_out_hierarchy
 
+		# JOURNAL
+		# Completed work is written to the journal, so the run can be resumed if it dies or reaches the deadline
+		self._journal = journal
+		self._journal_lock = threading.Lock()
+		self._journaled_links = set()
+		# Pages copied by the previous run
+		self._completed_page_ids = set()
+		self._deadline = deadline
+
+		# Settings identifying the sync in journals and plans
+		self._header = {
+			'src_page_id': self._src_page['id'],
+			'dst_page_id': self._dst_page['id'],
+			'sync_out_hierarchy': sync_out_hierarchy,
+			'replace_title_substr': list(replace_title_substr) if replace_title_substr else None,
+			'start_title_with': start_title_with,
+		}
+
+		if journal and journal.resumed and journal.state.header != self._header:
+			raise ValueError('Journal belongs to another sync')
+
+		# PLAN
+		# Destination pages and attachments are already looked up by the plan, so they are written without lookups
+		if sync_plan and sync_plan.header != self._header:
+			raise ValueError('Plan belongs to another sync')
+
+		self._planned_pages = sync_plan.pages if sync_plan else {}
+
+		# SPILL
+		# The page index, the pages waiting to be synced and the delayed draw.io fixes are kept on disk if the database is given
+		self._spill_database = spill_database
+
 		# PAGE INDEX
-		descendant_pages = self._src_cli.traverse_descendant_pages(self._src_page['id'])
+		self._page_index = spill_database.page_index() if spill_database else context.PageIndex()
 
-		self._page_index = context.PageIndex()
-		for page in it.chain((self._src_page,), descendant_pages):
-			self._page_index.add_page(
-				context.Page(
-					src_id=page['id'],
-					src_space=self._src_space,
-					src_title=page['title']
-				)
-			)
+		if journal and journal.resumed:
+			self._restore_page_index(journal.state)
+		else:
+			if sync_plan:
+				self._restore_planned_page_index(sync_plan)
+			else:
+				descendant_pages = self._src_cli.traverse_descendant_pages(self._src_page['id'])
+
+				for parent_page_id, page in it.chain(((None, self._src_page),), descendant_pages):
+					self._page_index.add_page(
+						context.Page(
+							src_id=page['id'],
+							src_space=self._src_space,
+							src_title=page['title'],
+							src_parent_id=parent_page_id,
+						)
+					)
+
+			if journal:
+				journal.write_header(self._header)
+				journal.write_index(self._page_index)
 
 		# FORMATTERS
 		self._title_formatter = fmt.title_formatter(
@@ -100,7 +393,7 @@ class _ConfluenceSynchronizerSession(observer.Observable):
 
 		if sync_out_hierarchy:
 			self._page_title_formatter = fmt.PageTittleFormatter(self._title_formatter, self._src_space, self._dst_space)
-			self._out_hierarchy_title_keeper = fmt.OutHierarchyPageTitleKeeper(self._page_index, self._src_space)
+			self._out_hierarchy_title_keeper = fmt.OutHierarchyPageTitleKeeper(self._page_index)
 			self._out_hierarchy_title_checker = None
 		else:
 			self._page_title_formatter = fmt.HierarchyPageTittleFormatter(
@@ -113,24 +406,104 @@ class _ConfluenceSynchronizerSession(observer.Observable):
 			self._out_hierarchy_title_keeper = None
 			self._out_hierarchy_title_checker = fmt.OutHierarchyPageTitleChecker(self._page_index, self._src_space)
 
-		self._inc_drawio_formatter = fmt.IncDrawIOFormatter(self._src_cli, self._dst_cli, self._page_index)
+		# CACHES
+		# Pages outside the hierarchy are fetched while discovering and read from the cache while syncing.
+		# Caches of source data may be shared by sessions, then they are closed by their owner.
+		self._own_page_cache = page_cache is None
+		self._page_cache = page_cache or cache.PageCache()
+		# Page bodies are parsed once: documents are kept until they are formatted,
+		# and after that only while the page waits for the included draw.io diagrams fix
+		self._document_store = document.DocumentStore(shared_trees=shared_trees)
+		# Attachment listings of synced pages with diagrams are reused to find attachments of included draw.io diagrams
+		self._attachment_cache = attachment_cache or cache.AttachmentCache()
+
+		self._inc_drawio_formatter = fmt.IncDrawIOFormatter(
+			self._src_cli,
+			self._dst_cli,
+			self._page_index,
+			self._document_store,
+			delayed_pages=spill_database.mapping() if spill_database else None,
+		)
+
+		if journal and journal.resumed:
+			self._restore_formatters(journal.state)
 
 		# STATS
 		self._total_page_count = 0
 		self._synced_paged_count = 0
 
-	def _run_task(self, fn, *args, **kwargs) -> None:
-		ft = self._executor.submit(fn, *args, **kwargs)
-		self._futures.append(ft)
+	def _add_index_pages(self, index: tp.Iterable[tuple[str, str, str, str | None]]) -> None:
+		for src_id, src_space, src_title, src_parent_id in index:
+			self._page_index.add_page(
+				context.Page(
+					src_id=src_id,
+					src_space=src_space,
+					src_title=src_title,
+					src_parent_id=src_parent_id,
+				)
+			)
+
+	def _restore_planned_page_index(self, sync_plan: plan.Plan) -> None:
+		"""Restore the page index from the plan along with the IDs of the existing destination pages.
 
-	def _wait_tasks(self) -> None:
-		done, _ = futures.wait(self._futures, return_when=futures.FIRST_EXCEPTION)
+		The IDs are known before the pages are written, so pages referring to them don't wait.
+		"""
+		self._add_index_pages(sync_plan.index)
+
+		for page_context in self._page_index.pages():
+			planned_page = sync_plan.pages.get(page_context.src_id)
+
+			if planned_page and planned_page.dst_id:
+				self._page_index.set_dst_id(page_context, planned_page.dst_id)
+
+	def _restore_page_index(self, journal_state: journal.JournalState) -> None:
+		"""Restore the page index and the destination page IDs from the journal of the previous run."""
+		self._add_index_pages(journal_state.index)
+
+		for page_context in journal_state.pages.values():
+			indexed_page_context = self._page_index.search_by_id(page_context.src_id)
+
+			if indexed_page_context:
+				self._page_index.set_dst_id(indexed_page_context, page_context.dst_id)
+			else:
+				# Pages outside the hierarchy
+				self._page_index.add_page(page_context)
+
+		self._completed_page_ids = set(journal_state.pages)
+
+		self._logger.info('Journal restored, copied page count: %d', len(self._completed_page_ids))
+
+	def _restore_formatters(self, journal_state: journal.JournalState) -> None:
+		"""Restore the work left by the formatters of the previous run."""
+		for page_id, diagrams in journal_state.delayed_pages.items():
+			if page_id not in journal_state.fixed_drawio_page_ids:
+				self._inc_drawio_formatter.restore_delayed_page(page_id, diagrams)
+
+		self._inc_drawio_formatter.restore_new_sources(journal_state.drawio_replacements, journal_state.drawio_new_sources)
+
+		if self._sync_out_hierarchy:
+			self._journaled_links.update(journal_state.links)
+			self._out_hierarchy_title_keeper.pages.update(
+				(space, title)
+				for space, title in journal_state.links
+				if not self._page_index.search_by_title(space, title)
+			)
 
-		# We need to get the result so that errors in the child thread are thrown in the main thread.
-		for ft in done:
-			ft.result()
+	def _run_task(self, fn, *args, **kwargs) -> futures.Future:
+		return self._tasks.submit(fn, *args, **kwargs)
 
-		self._futures.clear()
+	def _run_read_task(self, fn, *args, **kwargs) -> futures.Future:
+		"""Run a task only reading the source, it doesn't wait for the destination writes."""
+		return self._tasks.submit_read(fn, *args, **kwargs)
+
+	def _run_transfer_task(self, size: int, fn, *args, **kwargs) -> futures.Future:
+		"""Run a task transferring the data of the size in bytes, it yields workers to the other tasks."""
+		return self._tasks.submit_transfer(size, fn, *args, **kwargs)
+
+	def _wait_tasks(self) -> None:
+		# Tasks can run other tasks, so wait until no new tasks are added.
+		# Errors of the tasks are thrown in the main thread.
+		self._tasks.wait()
 
 	def _init_stats(self, total_page_count: int) -> None:
 		"""Initialize statistics values."""
@@ -152,374 +525,1587 @@ class _ConfluenceSynchronizerSession(observer.Observable):
 
 	def run(self) -> None:
 		self._init_stats(self._page_index.count)
-		self._sync_hierarchy(self._src_page, self._dst_page)
-
-		if self._sync_out_hierarchy:
-			self._sync_out_hierarchy_pages()
 
-		self._sync_inc_drawio()
+		if self._completed_page_ids:
+			self._inc_synced_page_count(len(self._completed_page_ids))
 
-	# FIXME: it doesn't work with some macros, for example, the 'Page tree' macro
-	def _sync_out_hierarchy_pages(self):
-		pages = [
-			self._out_hierarchy_title_keeper.pages.pop()
-			for _ in range(len(self._out_hierarchy_title_keeper.pages))
-		]
+		try:
+			if self._completed_page_ids:
+				tasks_args = self._get_resumed_tasks_args()
+			else:
+				tasks_args = ((self._src_page, self._dst_page['id'], True),)
 
-		space_roots: dict[str, tree.Node] = collections.defaultdict(tree.Node[OutHierarchyPage])
+			self._sync_hierarchy(tasks_args)
 
-		# Get all pages in the tree.
-		while pages:
-			space, title = pages.pop()
-			try:
-				page = self._src_cli.get_page_by_title(space, title, expand='ancestors,body.storage')
-			# Keep syncing even if ‘included page’ values are incorrect.
-			except errors.ApiPermissionError:
-				self._logger.error('Get out hierarchy page, space="%s", title="%s"', space, title)
+			if self._sync_out_hierarchy:
+				self._sync_out_hierarchy_pages()
 
-				continue
+			self._sync_inc_drawio()
+		except DeadlineReached:
+			self._logger.warning('Deadline reached, run stopped, synced page count: %d', self._synced_paged_count)
+			raise
+		finally:
+			if self._journal:
+				# Changes synced after the run aren't journaled
+				self._journal.close()
+				self._journal = None
 
-			# Skip ancestor pages
-			cur_node = space_roots[space]
+			# Changes synced after the run are looked up
+			self._planned_pages = {}
 
-			ancestors = page['ancestors']
-			# Skip homepage
-			ancestors = ancestors[1:] if len(ancestors) > 0 else ancestors
+			self._log_summary()
 
-			for ancestor in ancestors:
-				ancestor_node = cur_node.find_child_by(key=lambda d: d.title == ancestor['title'])
+			if self._own_page_cache:
+				self._page_cache.close()
 
-				if not ancestor_node:
-					ancestor_node = tree.Node(OutHierarchyPage(title=ancestor['title'], nominal=True))
-					cur_node.add_child(ancestor_node)
+			self._document_store.clear()
 
-				cur_node = ancestor_node
+	def make_plan(self) -> plan.Plan:
+		"""Compute the changes the run makes to the destination without writing them.
 
-			# Add page itself
-			page_node = tree.Node(OutHierarchyPage(title=title, nominal=False))
-			cur_node.add_child(page_node)
+		All destination pages are looked up first, so the draw.io formatter knows the IDs of the existing pages,
+		and pages are compared with them concurrently. A planned session must not be run.
+		"""
+		sync_plan = plan.Plan(
+			header=self._header,
+			index=[
+				(page.src_id, page.src_space, page.src_title, page.src_parent_id)
+				for page in self._page_index.pages()
+			],
+		)
 
-			page_context = context.Page(src_id=page['id'], src_space=space, src_title=title)
-			self._page_index.add_page(page_context)
+		self._init_stats(self._page_index.count)
 
-			# Get page dependencies
-			self._out_hierarchy_title_keeper._src_space = space
-			fmt.format_page(
-				context.Page(src_id=page['id'], src_space=space, src_title=page['title']),
-				page['body']['storage']['value'],
-				(self._out_hierarchy_title_keeper,),
-			)
+		try:
+			self._plan_hierarchy(sync_plan)
 
-			while self._out_hierarchy_title_keeper.pages:
-				space, title = self._out_hierarchy_title_keeper.pages.pop()
-				space_root = space_roots[space]
-				page_node = space_root.find_descendant_by(key=lambda d: d.title == title)
-
-				if page_node:
-					if page_node.data.nominal:
-						page_node.data.nominal = False
-						# The page is fully copied and added to the index to prevent duplicates in _out_hierarchy_title_keeper
-						ext_page = self._src_cli.get_page_by_title(space, title)
-						page_context = context.Page(src_id=ext_page['id'], src_space=space, src_title=title)
-						self._page_index.add_page(page_context)
-					else:
-						continue
+			if self._sync_out_hierarchy:
+				self._plan_out_hierarchy_pages(sync_plan)
 
-				pages.append((space, title))
+			sync_plan.drawio_fixes = self._inc_drawio_formatter.delayed_pages_count
+		finally:
+			self._log_summary()
 
-		total_count = 0
-		for space_root in space_roots.values():
-			# Go through the entire tree
-			descendants_count = space_root.descendants_count
+			if self._own_page_cache:
+				self._page_cache.close()
 
-			self._inc_total_page_count(descendants_count)
-			total_count += descendants_count
+			self._document_store.clear()
 
-		self._logger.info('Syncing out hierarchy pages, page count: %d', total_count)
+		return sync_plan
 
-		page_formatters = (
-			self._page_title_formatter,
-			self._inc_drawio_formatter,
+	def _plan_hierarchy(self, sync_plan: plan.Plan) -> None:
+		dst_pages = self._look_up_dst_pages(
+			(page.src_id, page.src_space, page.src_title)
+			for page in self._page_index.pages()
 		)
 
-		for space, space_root in space_roots.items():
-			dst_parent_page_id = self._dst_page['id']
+		for page_context in self._page_index.pages():
+			if dst_pages[page_context.src_id]:
+				self._page_index.set_dst_id(page_context, dst_pages[page_context.src_id]['id'])
+
+		page_formatters = self._get_hierarchy_page_formatters()
+
+		def _task(_src_page: StrDict, _dst_parent_page_id: str | None) -> tp.Iterable[tuple[StrDict, str | None]]:
+			page_context = self._page_index.search_by_id(_src_page['id'])
+
+			# The page is created after the index was built, it is copied by the run anyway
+			if page_context is None:
+				return []
+
+			sync_plan.pages[page_context.src_id] = self._plan_page(
+				page_context,
+				page_formatters,
+				_src_page,
+				dst_pages[page_context.src_id],
+				_dst_parent_page_id,
+			)
+
+			src_child_pages = self._src_cli.traverse_child_pages(
+				_src_page['id'],
+				expand='body.storage',
+				limit=_CHILD_PAGE_BATCH_SIZE,
+			)
 
-			pages_to_sync = queue.SimpleQueue()
+			return ((src_child_page, page_context.dst_id) for src_child_page in src_child_pages)
 
-			# tuple(nodes, dst_page_id)
-			pages_to_sync.put((space_root.children(), dst_parent_page_id))
+		self._sync_tree(_task, ((self._src_page, self._dst_page['id']),), spill_tasks=True)
 
-			while not pages_to_sync.empty():
-				nodes, dst_parent_page_id = pages_to_sync.get()
+	def _plan_out_hierarchy_pages(self, sync_plan: plan.Plan) -> None:
+		pages = [
+			self._out_hierarchy_title_keeper.pages.pop()
+			for _ in range(len(self._out_hierarchy_title_keeper.pages))
+		]
 
-				for node in nodes:
-					page = self._src_cli.get_page_by_title(space, node.data.title, expand='body.storage')
+		space_roots = self._discover_out_hierarchy_pages(pages)
 
-					page_context = self._page_index.search_by_title(space, page['title'])
-					# Pages not in the index are considered nominal.
-					# Nominal pages shouldn’t be in the index, so any draw.io diagrams they contain as a source won’t be referenced.
-					if page_context is None:
-						page_context = context.Page(src_id=page['id'], src_space=space, src_title=page['title'])
+		nodes = [(space, node) for space, space_root in space_roots.items() for node in space_root.descendants()]
+		self._inc_total_page_count(len(nodes))
 
-					dst_page_id = self._sync_page(page_context, page_formatters, page, dst_parent_page_id, node.data.nominal)
-					pages_to_sync.put((node.children(), dst_page_id))
+		dst_pages = self._look_up_dst_pages((node.data.id, space, node.data.title) for space, node in nodes)
 
-	def _sync_hierarchy(self, src_page: StrDict, dst_page: StrDict) -> None:
-		if self._sync_out_hierarchy:
-			page_formatters = (
-				self._out_hierarchy_title_keeper,
-				self._page_title_formatter,
-				self._inc_drawio_formatter,
-			)
-		else:
-			page_formatters = (
-				self._out_hierarchy_title_checker,
-				self._page_title_formatter,
-				self._inc_drawio_formatter,
-			)
+		for _, node in nodes:
+			page_context = self._page_index.search_by_id(node.data.id)
 
-		pages_to_sync = queue.SimpleQueue()
+			if not node.data.nominal and dst_pages[node.data.id]:
+				self._page_index.set_dst_id(page_context, dst_pages[node.data.id]['id'])
 
-		# tuple(iterable of source pages, parent_page_id)
-		pages_to_sync.put(((src_page,), dst_page['id']))
+		page_formatters = (
+			self._page_title_formatter,
+			self._inc_drawio_formatter,
+		)
 
-		def _task(_src_page: StrDict, _dst_parent_page_id: str) -> None:
-			page_context = self._page_index.search_by_id(_src_page['id'])
+		def _task(
+			_space: str,
+			_node: tree.Node[OutHierarchyPage],
+			_dst_parent_page_id: str | None,
+		) -> tp.Iterable[tuple[str, tree.Node[OutHierarchyPage], str | None]]:
+			page_context, src_page = self._get_out_hierarchy_page(_space, _node)
+			dst_page = dst_pages[_node.data.id]
 
-			dst_page_id = self._sync_page(
+			sync_plan.pages[page_context.src_id] = self._plan_page(
 				page_context,
 				page_formatters,
-				_src_page,
+				src_page,
+				dst_page,
 				_dst_parent_page_id,
+				_node.data.nominal,
 			)
 
-			src_child_pages = self._src_cli.get_page_child_by_type(_src_page['id'], expand='body.storage')
-			pages_to_sync.put((src_child_pages, dst_page_id))
+			dst_page_id = dst_page['id'] if dst_page else None
 
-		while not pages_to_sync.empty():
-			src_pages, dst_parent_page_id = pages_to_sync.get()
+			return [(_space, child_node, dst_page_id) for child_node in _node.children()]
 
-			for src_page in src_pages:
-				self._run_task(_task, src_page, dst_parent_page_id)
+		self._sync_tree(
+			_task,
+			(
+				(space, node, self._dst_page['id'])
+				for space, space_root in space_roots.items()
+				for node in space_root.children()
+			),
+		)
 
-			self._wait_tasks()
+	def _look_up_dst_pages(self, pages: tp.Iterable[tuple[str, str, str]]) -> dict[str, StrDict | None]:
+		"""Get the existing destination pages concurrently.
 
-	def _sync_page(
-		self,
-		page_context: context.Page,
-		page_formatters: tp.Iterable[fmt.TagFormatter],
-		src_page: StrDict,
-		dst_parent_page_id: str,
-		nominal: bool = False,
-	) -> str:
-		"""Copy page."""
-		dst_page_id, dst_page_title = self._sync_body(
-			page_context,
-			page_formatters,
-			src_page,
-			dst_parent_page_id,
-			nominal,
-		)
+		Pages are kept for the whole plan, so they are looked up without bodies,
+		and only their ID, title, version and parent ID are kept.
 
-		if not nominal:
-			self._sync_attachments(page_context.src_id, dst_page_id, dst_page_title)
+		:param pages: tuples of the source page ID, space and title
+		:return: the destination page by the source page ID
+		"""
+		pages_futures = {
+			src_id: self._run_task(
+				self._dst_cli.get_page_by_title,
+				self._dst_space,
+				self._title_formatter(src_space, src_title),
+				expand='ancestors,version',
+			)
+			for src_id, src_space, src_title in pages
+		}
 
-		self._logger.info('Page synced, "%s"', src_page['title'])
-		self._inc_synced_page_count()
+		self._wait_tasks()
 
-		return dst_page_id
+		return {src_id: self._trim_dst_page(ft.result()) for src_id, ft in pages_futures.items()}
 
-	def _sync_body(
+	@staticmethod
+	def _trim_dst_page(dst_page: StrDict | None) -> StrDict | None:
+		if not dst_page:
+			return None
+
+		return {
+			'id': dst_page['id'],
+			'title': dst_page['title'],
+			'version': dst_page['version']['number'],
+			'parent_id': dst_page['ancestors'][-1].get('id') if dst_page['ancestors'] else None,
+		}
+
+	def _plan_page(
 		self,
 		page_context: context.Page,
 		page_formatters: tp.Iterable[fmt.TagFormatter],
-		src_page: StrDict,
-		dst_page_parent_id: str,
+		src_page: StrDict | None,
+		dst_page: StrDict | None,
+		dst_parent_page_id: str | None,
 		nominal: bool = False,
-	) -> tuple[str, str]:
-		"""Copy page text."""
-		old_title = page_context.src_title
-		old_body = src_page['body']['storage']['value']
+	) -> plan.PlannedPage:
+		"""Compare a page and its attachments with the destination page.
 
-		new_title = self._title_formatter(page_context.src_space, old_title)
+		:param dst_parent_page_id: destination parent page ID, None if the parent page is created by the run
+		"""
+		new_title = self._title_formatter(page_context.src_space, page_context.src_title)
+
+		planned_page = plan.PlannedPage(
+			src_id=page_context.src_id,
+			title=new_title,
+			action=plan.KEEP,
+			dst_id=dst_page['id'] if dst_page else None,
+			nominal=nominal,
+		)
 
-		# If a nominal page is needed, and it already exists, skip it
 		if nominal:
-			dst_page = self._dst_cli.get_page_by_title(self._dst_space, new_title)
-
+			# Existing nominal pages aren't changed
 			if not dst_page:
-				new_body = 'Nominal page that keeps the tree structure'
-				dst_page = self._dst_cli.create_page(self._dst_space, new_title, new_body, dst_page_parent_id)
-		else:
-			new_body = fmt.format_page(page_context, old_body, page_formatters)
-			dst_page = self._dst_cli.get_page_by_title(self._dst_space, new_title, expand='ancestors')
+				planned_page.action = plan.CREATE
 
-			if dst_page:
-				# If the page exists and the content hasn’t changed, simply move it.
-				if self._dst_cli.is_page_content_is_already_updated(dst_page['id'], new_body, new_title):
-					cur_dst_page_parent_id = dst_page['ancestors'][-1].get('id')
+			self._inc_synced_page_count()
 
-					if cur_dst_page_parent_id and cur_dst_page_parent_id != dst_page_parent_id:
-						self._dst_cli.move_page(self._dst_space, dst_page['id'], dst_page_parent_id)
-				else:
-					dst_page = self._dst_cli.update_page(
-						page_id=dst_page['id'],
-						title=new_title,
-						body=new_body,
-						parent_id=dst_page_parent_id,
-					)
-			else:
-				dst_page = self._dst_cli.create_page(
-					space=self._dst_space,
-					title=new_title,
-					body=new_body,
-					parent_id=dst_page_parent_id,
-				)
+			return planned_page
 
-		page_context.dst_id = dst_page['id']
+		page_document = self._document_store.get_or_create(page_context.src_id, src_page['body']['storage']['value'])
+		new_body = fmt.format_document(page_context, page_document, page_formatters)
+		self._document_store.discard(page_context.src_id)
 
-		self._logger.info('Page body synced, "%s"', old_title)
+		planned_page.body_hash = plan.hash_body(new_body)
 
-		return dst_page['id'], dst_page['title']
+		if not dst_page:
+			planned_page.action = plan.CREATE
+		elif dst_page['title'] != new_title or not self._is_dst_body_same(dst_page['id'], new_body, new_title):
+			planned_page.action = plan.UPDATE
+		elif dst_page['parent_id'] and dst_page['parent_id'] != dst_parent_page_id:
+			planned_page.action = plan.MOVE
 
-	def _sync_attachments(self, src_page_id: str, dst_page_id: str, dst_page_title: str | None = None) -> None:
-		"""Copy page attachments."""
-		src_attachments = self._src_cli.traverse_page_attachments(
-			src_page_id,
-			expand='history.lastUpdated'
-		)
+		src_attachments = list(self._src_cli.traverse_page_attachments(page_context.src_id, expand='history.lastUpdated'))
 
-		self._copy_attachments(src_attachments, dst_page_id, dst_page_title)
+		dst_attachments_map = {}
 
-	def _copy_attachments(
-		self,
-		src_attachments: tp.Iterable[StrDict],
-		dst_page_id: str,
-		dst_page_title: str | None = None
-	) -> None:
-		"""Copy page attachments to the destination page."""
-		dst_attachments = self._dst_cli.traverse_page_attachments(dst_page_id, expand='history.lastUpdated')
-		dst_attachments_map = {attachment['title']: attachment for attachment in dst_attachments}
+		if dst_page:
+			dst_attachments = self._dst_cli.traverse_page_attachments(dst_page['id'], expand='history.lastUpdated')
+			dst_attachments_map = {attachment['title']: attachment for attachment in dst_attachments}
 
 		for src_attachment in src_attachments:
-			dst_attachment = dst_attachments_map.get(src_attachment['title'])
-			self._copy_attachment_only_updated(
-				src_attachment,
-				dst_attachment,
-				dst_page_id,
-				dst_page_title
-			)
+			if self._is_attachment_outdated(src_attachment, dst_attachments_map.get(src_attachment['title'])):
+				planned_page.attachments.append(src_attachment['title'])
+				planned_page.attachment_bytes += self._get_attachment_size(src_attachment)
 
-	def _copy_attachment_only_updated(
-		self,
-		src_attachment: StrDict,
-		dst_attachment: StrDict | None,
-		dst_page_id: str,
-		dst_page_title: str | None = None,
-	) -> None:
-		"""Copy an attachment.
+		self._inc_synced_page_count()
 
-		Copy the attachment only if it’s new or its content has changed since the last copy.
+		return planned_page
+
+	def _is_dst_body_same(self, dst_page_id: str, new_body: str, new_title: str) -> bool:
+		"""Compare the body of the destination page with the new body, the body is fetched only for the comparison."""
+		dst_page = self._dst_cli.get_page_by_id(dst_page_id, expand='body.storage')
+
+		return self._dst_cli.is_page_content_same(dst_page, new_body, new_title)
+
+	def watch(self, interval: float = 60, stop: threading.Event | None = None) -> None:
+		"""Copy the hierarchy, then keep copying its changes until stopped.
+
+		The source is polled every interval seconds, and only the pages changed since the previous poll are copied.
+
+		:param interval: seconds between polls
+		:param stop: event that stops watching
 		"""
-		if dst_attachment:
-			src_attachment_last_updated = self._datetime_parser(src_attachment['history']['lastUpdated']['when'])
-			dst_attachment_last_updated = self._datetime_parser(dst_attachment['history']['lastUpdated']['when'])
-
-			if dst_attachment_last_updated >= src_attachment_last_updated:
-				self._logger.warning(
-					'Attachment "%s" already copied, page: "%s"',
-					src_attachment['title'],
-					dst_page_title or dst_page_id
-				)
+		stop = stop or threading.Event()
 
-				return
+		polled_at = time.monotonic()
+		self.run()
 
-		self._run_task(self._copy_attachment, src_attachment, dst_page_id, dst_page_title)
+		while not stop.wait(interval):
+			poll_started_at = time.monotonic()
 
-	def _copy_attachment(
-		self,
-		src_attachment: StrDict,
-		dst_page_id: str,
-		dst_page_title: str | None = None,
-	) -> None:
-		title = src_attachment['title']
+			try:
+				self.sync_changes(poll_started_at - polled_at)
+			except Exception:
+				# The changes are polled again next time
+				self._logger.exception('Sync changes')
+			else:
+				polled_at = poll_started_at
 
-		download_url = src_attachment['_links']['download']
-		content = self._src_cli.get(download_url, not_json_response=True)
+	def sync_changes(self, period: float) -> int:
+		"""Copy the pages of the hierarchy modified in the last period.
 
-		# For some reason, it gives a 503 HTTP status code without a lock, but the Confluence log shows 403
-		with self._lock:
-			self._dst_cli.attach_content(
-				content,
-				page_id=dst_page_id,
-				title=title,
-				name=title,
-				comment=src_attachment['metadata'].get('comment'),
-			)
+		Changed pages are copied along with their attachments and moved if their parent has changed.
+		New pages are copied along with their descendants. Pages with changed attachments only get their attachments copied.
+		The run must be completed before.
 
-		self._logger.info('Attachment "%s" copied, page: "%s"', title, dst_page_title or dst_page_id)
+		:param period: seconds since the previous check
+		:return: the number of changed pages
+		"""
+		# CQL dates are precise to a minute, so one more minute is checked
+		minutes = math.ceil(period / 60) + 1
 
-	def _sync_inc_drawio(self) -> None:
-		self._logger.info(
-			'Fixing pages with included drawio diagrams, page count: %d',
-			self._inc_drawio_formatter.delayed_pages_count
+		changed_pages = list(
+			self._src_cli.get_modified_pages(self._src_page['id'], minutes, expand='ancestors,body.storage')
 		)
+		changed_attachment_page_ids = {
+			attachment['container']['id']
+			for attachment in self._src_cli.get_modified_attachments(self._src_space, minutes, expand='container')
+		}
 
-		self._inc_synced_page_count(-self._inc_drawio_formatter.delayed_pages_count)
+		return self._sync_changed_pages(changed_pages, changed_attachment_page_ids)
 
-		for src_page_id, body, attachments, comment in self._inc_drawio_formatter.process_delayed_pages():
-			page_context = self._page_index.search_by_id(src_page_id)
+	def sync_pages(self, page_ids: tp.Iterable[str], attachment_page_ids: tp.Iterable[str] = ()) -> int:
+		"""Copy the given pages of the hierarchy the same way as changed pages.
 
-			new_title = self._title_formatter(page_context.src_space, page_context.src_title)
+		Pages outside the hierarchy and pages that no longer exist are skipped.
+		The run must be completed before.
 
-			self._dst_cli.update_page(
-				page_id=page_context.dst_id,
-				title=new_title,
-				body=body,
-				version_comment=comment
-			)
+		:param page_ids: IDs of the changed source pages
+		:param attachment_page_ids: IDs of the source pages with changed attachments
+		:return: the number of changed pages
+		"""
+		pages_futures = [
+			self._run_read_task(self._get_hierarchy_page, page_id)
+			for page_id in sorted(set(page_ids))
+		]
 
-			attachments = it.chain.from_iterable(
-				self._src_cli.get_attachment_by_names(
-					ref_page_id,
-					attachment_names,
-					expand='history.lastUpdated',
-				)
+		self._wait_tasks()
 
-				for ref_page_id, attachment_names
-				in attachments.items()
-			)
+		changed_pages = [page for ft in pages_futures if (page := ft.result()) is not None]
 
-			attachments = list(attachments)
+		return self._sync_changed_pages(changed_pages, set(attachment_page_ids))
 
-			self._copy_attachments(attachments, page_context.dst_id, new_title)
-			self._wait_tasks()
+	def _get_hierarchy_page(self, page_id: str) -> StrDict | None:
+		"""Get a source page if it is in the hierarchy."""
+		try:
+			page = self._src_cli.get_page_by_id(page_id, expand='ancestors,body.storage')
+		except (errors.ApiError, requests.HTTPError):
+			self._logger.warning('Get changed page, id: %s', page_id)
+			return None
 
-			self._logger.info('Included drawio diagram was fixed, page: "%s"', new_title)
-			self._inc_synced_page_count()
+		if page['id'] != self._src_page['id'] and all(a['id'] != self._src_page['id'] for a in page['ancestors']):
+			return None
 
+		return page
 
-class ConfluenceSynchronizer:
-	def __init__(self, src_conf: ConfluenceConfig, dst_conf: ConfluenceConfig) -> None:
-		super().__init__()
+	def _sync_changed_pages(self, changed_pages: list[StrDict], changed_attachment_page_ids: set[str]) -> int:
+		"""Copy changed pages of the hierarchy.
 
-		self._src_conf = src_conf
-		self._dst_conf = dst_conf
+		The pages must contain the ancestors and the body.
+		"""
+		# Parents are handled before their children
+		changed_pages.sort(key=lambda page: len(page['ancestors']))
+
+		tasks_args = []
+		new_page_ids = set()
+
+		for page in changed_pages:
+			if page['id'] in new_page_ids:
+				continue
+
+			page_context = self._page_index.search_by_id(page['id'])
+
+			if page['id'] == self._src_page['id']:
+				tasks_args.append((page, self._dst_page['id'], False))
+				continue
+
+			parent_page_id = page['ancestors'][-1]['id']
+			parent_page_context = self._page_index.search_by_id(parent_page_id)
+
+			if parent_page_context is None or parent_page_context.dst_id is None:
+				self._logger.warning('Parent page of a changed page isn\'t synced, page: "%s"', page['title'])
+				continue
+
+			if page_context is None:
+				# A new page or a page moved to the hierarchy is copied along with its descendants
+				self._page_index.add_page(
+					context.Page(
+						src_id=page['id'],
+						src_space=self._src_space,
+						src_title=page['title'],
+						src_parent_id=parent_page_id,
+					)
+				)
+
+				for descendant_parent_page_id, descendant_page in self._src_cli.traverse_descendant_pages(page['id']):
+					new_page_ids.add(descendant_page['id'])
+					self._page_index.add_page(
+						context.Page(
+							src_id=descendant_page['id'],
+							src_space=self._src_space,
+							src_title=descendant_page['title'],
+							src_parent_id=descendant_parent_page_id,
+						)
+					)
+
+				tasks_args.append((page, parent_page_context.dst_id, True))
+			else:
+				if page_context.src_title != page['title']:
+					self._page_index.rename_page(page['id'], page['title'])
+
+				if page_context.src_parent_id != parent_page_id:
+					self._page_index.move_page(page['id'], parent_page_id)
+
+				tasks_args.append((page, parent_page_context.dst_id, False))
+
+		changed_page_ids = {page['id'] for page in changed_pages}
+		attachment_page_contexts = [
+			page_context
+			for page_id in sorted(changed_attachment_page_ids - changed_page_ids)
+			if (page_context := self._page_index.search_by_id(page_id)) and page_context.dst_id is not None
+		]
+
+		changed_page_count = len(tasks_args) + len(new_page_ids) + len(attachment_page_contexts)
+
+		if not changed_page_count:
+			return 0
+
+		self._logger.info('Syncing changed pages, page count: %d', changed_page_count)
+		self._inc_total_page_count(len(tasks_args) + len(new_page_ids))
+
+		try:
+			self._sync_hierarchy(tasks_args)
+
+			for page_context in attachment_page_contexts:
+				self._run_task(self._sync_attachments, page_context.src_id, page_context.dst_id)
+
+			self._wait_tasks()
+
+			if self._sync_out_hierarchy and self._out_hierarchy_title_keeper.pages:
+				self._sync_out_hierarchy_pages()
+
+			self._sync_inc_drawio()
+		finally:
+			if self._own_page_cache:
+				self._page_cache.close()
+
+			self._document_store.clear()
+
+		return changed_page_count
+
+	def _get_resumed_tasks_args(self) -> list[tuple[StrDict, str, bool]]:
+		"""Get the pages to start copying the hierarchy from, skipping the pages copied by the previous run.
+
+		Children are copied after their parents, so the pages left are the subtrees of the pages
+		whose parent is copied. Pages copied meanwhile are skipped while copying the subtrees.
+		"""
+		if self._src_page['id'] not in self._completed_page_ids:
+			return [(self._src_page, self._dst_page['id'], True)]
+
+		page_ids = [
+			page_context.src_id
+			for page_context in self._page_index.pages()
+			if (
+				page_context.src_parent_id in self._completed_page_ids
+				and page_context.src_id not in self._completed_page_ids
+			)
+		]
+
+		pages_futures = [self._run_read_task(self._get_hierarchy_page, page_id) for page_id in page_ids]
+
+		self._wait_tasks()
+
+		tasks_args = []
+
+		for ft in pages_futures:
+			page = ft.result()
+
+			if page is None:
+				continue
+
+			parent_page_context = self._page_index.search_by_id(page['ancestors'][-1]['id'])
+
+			if parent_page_context is None or parent_page_context.dst_id is None:
+				continue
+
+			tasks_args.append((page, parent_page_context.dst_id, True))
+
+		self._logger.info('Resuming the run, page count to start from: %d', len(tasks_args))
+
+		return tasks_args
+
+	def _is_deadline_reached(self) -> bool:
+		return self._deadline is not None and dt.datetime.now(self._deadline.tzinfo) >= self._deadline
+
+	def _check_deadline(self) -> None:
+		if self._is_deadline_reached():
+			raise DeadlineReached
+
+	def _journal_page(self, page_context: context.Page) -> None:
+		"""Write the page copied along with its attachments to the journal."""
+		if self._journal is None:
+			return
+
+		with self._journal_lock:
+			# Links found in the page are written before the page, so they aren't lost on resume
+			if self._sync_out_hierarchy:
+				links = self._out_hierarchy_title_keeper.snapshot() - self._journaled_links
+
+				if links:
+					self._journal.write_links(links)
+					self._journaled_links.update(links)
+
+			self._journal.write_page(page_context, self._inc_drawio_formatter.delayed_diagrams(page_context.src_id))
+
+	def _journal_links(self, links: tp.Iterable[tuple[str, str]]) -> None:
+		if self._journal is None:
+			return
+
+		with self._journal_lock:
+			links = set(links) - self._journaled_links
+
+			if links:
+				self._journal.write_links(links)
+				self._journaled_links.update(links)
+
+	def _log_summary(self) -> None:
+		self._logger.info('Run summary, synced page count: %d', self._synced_paged_count)
+
+		caches_stats = (
+			('pages outside the hierarchy', self._page_cache.stats),
+			('page documents', self._document_store.stats),
+			('attachments', self._attachment_cache.stats),
+			('pages referenced by drawio diagrams', self._inc_drawio_formatter.page_body_cache_stats),
+		)
+
+		for name, stats in caches_stats:
+			self._logger.info(
+				'Run summary, cache of %s: hits %d, misses %d, evictions %d',
+				name,
+				stats.hits,
+				stats.misses,
+				stats.evictions,
+			)
+
+		if self._src_cli.single_flight is not None:
+			self._logger.info(
+				'Run summary, source GET requests: sent %d, shared with identical requests in flight %d',
+				self._src_cli.single_flight.read_count,
+				self._src_cli.single_flight.shared_count,
+			)
+
+		if self._src_cli.http_cache is not None:
+			self._logger.info(
+				'Run summary, HTTP cache of the source: hits %d, misses %d',
+				self._src_cli.http_cache.hits,
+				self._src_cli.http_cache.misses,
+			)
+
+		clients = (('source', self._src_cli), ('destination', self._dst_cli))
+
+		for name, cli in clients:
+			if cli.rate_limiter is None:
+				continue
+
+			self._logger.info(
+				'Run summary, rate limit of the %s instance: waits %d, wait time %.1f s',
+				name,
+				cli.rate_limiter.stats.waits,
+				cli.rate_limiter.stats.wait_time,
+			)
+
+	# FIXME: it doesn't work with some macros, for example, the 'Page tree' macro
+	def _sync_out_hierarchy_pages(self):
+		pages = [
+			self._out_hierarchy_title_keeper.pages.pop()
+			for _ in range(len(self._out_hierarchy_title_keeper.pages))
+		]
+
+		space_roots = self._discover_out_hierarchy_pages(pages)
+
+		total_count = 0
+		for space_root in space_roots.values():
+			descendants_count = space_root.descendants_count
+
+			self._inc_total_page_count(descendants_count)
+			total_count += descendants_count
+
+		self._logger.info('Syncing out hierarchy pages, page count: %d', total_count)
+
+		page_formatters = (
+			self._page_title_formatter,
+			self._inc_drawio_formatter,
+		)
+
+		def _task(
+			_space: str,
+			_node: tree.Node[OutHierarchyPage],
+			_dst_parent_page_id: str,
+		) -> tp.Iterable[tuple[str, tree.Node[OutHierarchyPage], str]]:
+			page_context, src_page = self._get_out_hierarchy_page(_space, _node)
+
+			dst_page_id = self._sync_page(page_context, page_formatters, src_page, _dst_parent_page_id, _node.data.nominal)
+
+			return [(_space, child_node, dst_page_id) for child_node in _node.children()]
+
+		# Space roots are synced independently
+		self._sync_tree(
+			_task,
+			(
+				(space, node, self._dst_page['id'])
+				for space, space_root in space_roots.items()
+				for node in space_root.children()
+			),
+		)
+
+	def _get_out_hierarchy_page(
+		self,
+		space: str,
+		node: tree.Node[OutHierarchyPage],
+	) -> tuple[context.Page, StrDict | None]:
+		"""Get the context and the source page of a tree node, nominal pages have no source page."""
+		if node.data.nominal:
+			# Nominal pages shouldn’t be in the index, so any draw.io diagrams they contain as a source won’t be referenced.
+			return context.Page(src_id=node.data.id, src_space=space, src_title=node.data.title), None
+
+		page_context = self._page_index.search_by_id(node.data.id)
+		src_page = self._page_cache.get_by_id(page_context.src_id)
+
+		if src_page is None:
+			src_page = self._src_cli.get_page_by_id(page_context.src_id, expand='body.storage')
+
+		return page_context, src_page
+
+	def _discover_out_hierarchy_pages(self, pages: tp.Iterable[tuple[str, str]]) -> dict[str, tree.Node[OutHierarchyPage]]:
+		"""Get all pages outside the hierarchy, including pages linked from them, and build their trees.
+
+		Links are resolved level by level: all pages of the current level are fetched concurrently,
+		and the links found in them make up the next level.
+		The trees are only changed in the main thread between levels.
+
+		:param pages: tuples of space and title of the linked pages
+		:return: the tree of pages for every space
+		"""
+		space_roots: dict[str, tree.Node[OutHierarchyPage]] = collections.defaultdict(tree.Node[OutHierarchyPage])
+
+		seen_pages = set(pages)
+		level_pages = sorted(seen_pages)
+
+		while level_pages:
+			self._check_deadline()
+
+			level_futures = [
+				self._run_read_task(self._discover_out_hierarchy_page, space, title)
+				for space, title in level_pages
+			]
+
+			self._wait_tasks()
+
+			level_pages = []
+			linked_pages = []
+
+			for ft in level_futures:
+				result = ft.result()
+
+				if result is None:
+					continue
+
+				page, page_context, page_links = result
+
+				self._add_out_hierarchy_page(space_roots[page_context.src_space], page, page_context.src_title)
+				self._page_index.add_page(page_context)
+
+				linked_pages.extend(sorted(page_links))
+
+			self._journal_links(linked_pages)
+
+			for space, title in linked_pages:
+				# Linked pages that are nominal in a tree are also fetched, so they become fully copied
+				if (space, title) in seen_pages or self._page_index.search_by_title(space, title):
+					continue
+
+				seen_pages.add((space, title))
+				level_pages.append((space, title))
+
+		return space_roots
+
+	def _discover_out_hierarchy_page(
+		self,
+		space: str,
+		title: str,
+	) -> tuple[StrDict, context.Page, set[tuple[str, str]]] | None:
+		"""Get a page outside the hierarchy and the pages it links to.
+
+		The page is kept in the page cache, so it isn't fetched again while syncing.
+		"""
+		page = self._page_cache.get_by_title(space, title)
+
+		if page is None:
+			try:
+				page = self._src_cli.get_page_by_title(space, title, expand='ancestors,body.storage,version')
+			# Keep syncing even if ‘included page’ values are incorrect.
+			except errors.ApiPermissionError:
+				page = None
+
+			if page is None:
+				self._logger.error('Get out hierarchy page, space="%s", title="%s"', space, title)
+
+				return None
+
+			self._page_cache.add(space, page)
+
+		page_context = context.Page(src_id=page['id'], src_space=space, src_title=title)
+
+		# The keeper is created for every page, so the space of the page doesn't have to be shared between threads
+		title_keeper = fmt.OutHierarchyPageTitleKeeper(self._page_index)
+		page_document = self._document_store.get_or_create(page['id'], page['body']['storage']['value'])
+		fmt.scan_document(page_context, page_document, (title_keeper,))
+		self._document_store.keep(page_document)
+
+		return page, page_context, title_keeper.pages
+
+	@staticmethod
+	def _add_out_hierarchy_page(space_root: tree.Node[OutHierarchyPage], page: StrDict, title: str) -> None:
+		"""Add a page outside the hierarchy to the tree of its space along with its ancestors."""
+		cur_node = space_root
+
+		ancestors = page['ancestors']
+		# Skip homepage
+		ancestors = ancestors[1:] if len(ancestors) > 0 else ancestors
+
+		for ancestor in ancestors:
+			ancestor_node = cur_node.find_child(ancestor['title'])
+
+			if not ancestor_node:
+				ancestor_node = tree.Node(
+					OutHierarchyPage(id=ancestor['id'], title=ancestor['title'], nominal=True),
+					ancestor['title'],
+				)
+				cur_node.add_child(ancestor_node)
+
+			cur_node = ancestor_node
+
+		# Add page itself, it may already be added as a nominal page
+		page_node = cur_node.find_child(title)
+
+		if page_node:
+			page_node.data.nominal = False
+		else:
+			page_node = tree.Node(OutHierarchyPage(id=page['id'], title=title, nominal=False), title)
+			cur_node.add_child(page_node)
+
+	def _sync_hierarchy(self, tasks_args: tp.Iterable[tuple[StrDict, str, bool]]) -> None:
+		"""Copy pages of the hierarchy.
+
+		:param tasks_args: tuples of the source page, the destination parent page ID
+			and whether the descendant pages are copied too
+		"""
+		page_formatters = self._get_hierarchy_page_formatters()
+
+		def _task(
+			_src_page: StrDict,
+			_dst_parent_page_id: str,
+			_with_descendants: bool,
+		) -> tuple[str, tp.Iterable[tuple[StrDict, str, bool]]]:
+			if _src_page['id'] in self._completed_page_ids:
+				# The page is copied by the previous run
+				dst_page_id = self._page_index.search_by_id(_src_page['id']).dst_id
+			else:
+				page_context = self._page_index.search_by_id(_src_page['id'])
+
+				if page_context is None:
+					# The page is created after the index was built by the previous run,
+					# its parent isn't known here, so it is only used to order draw.io fixes
+					page_context = context.Page(
+						src_id=_src_page['id'],
+						src_space=self._src_space,
+						src_title=_src_page['title'],
+					)
+					self._page_index.add_page(page_context)
+
+				try:
+					dst_page_id = self._sync_page(
+						page_context,
+						page_formatters,
+						_src_page,
+						_dst_parent_page_id,
+					)
+				finally:
+					# The listing isn't used if the page fails
+					self._prefetched_attachments.pop(_src_page['id'], None)
+
+			if not _with_descendants:
+				return _src_page['id'], []
+
+			return _src_page['id'], _child_tasks_args(_src_page['id'], dst_page_id)
+
+		def _child_tasks_args(_src_page_id: str, _dst_page_id: str) -> tp.Iterator[tuple[StrDict, str, bool]]:
+			src_child_pages = self._src_cli.traverse_child_pages(
+				_src_page_id,
+				expand='body.storage',
+				limit=_CHILD_PAGE_BATCH_SIZE,
+			)
+
+			for src_child_page in src_child_pages:
+				if src_child_page['id'] not in self._completed_page_ids:
+					# Attachments are listed while the pages before the child page are written
+					self._prefetched_attachments[src_child_page['id']] = self._run_read_task(
+						self._prefetch_attachments,
+						src_child_page['id'],
+					)
+
+				yield src_child_page, _dst_page_id, True
+
+		def _dependencies(_src_page: StrDict, _dst_parent_page_id: str, _with_descendants: bool) -> set[str]:
+			# Pages with included draw.io diagrams wait for the referenced pages, so they are written once.
+			# The page itself and its descendants can't be synced before the page, so they aren't waited for.
+			ref_page_ids = set()
+
+			for ref_page_id in fmt.IncDrawIOFormatter.scan_ref_page_ids(_src_page['body']['storage']['value']):
+				ref_page_context = self._page_index.search_by_id(ref_page_id)
+
+				if (
+					ref_page_id != _src_page['id']
+					and ref_page_context
+					and ref_page_context.dst_id is None
+					and not self._page_index.is_descendant(ref_page_id, _src_page['id'])
+				):
+					ref_page_ids.add(ref_page_id)
+
+			return ref_page_ids
+
+		try:
+			self._sync_tree(_task, tasks_args, _dependencies, spill_tasks=True)
+		finally:
+			self._discard_prefetched_attachments()
+
+	def _discard_prefetched_attachments(self) -> None:
+		"""Forget the listings of the pages left unsynced by a stopped or failed run, unstarted listings aren't read."""
+		while self._prefetched_attachments:
+			_, prefetched_ft = self._prefetched_attachments.popitem()
+			prefetched_ft.cancel()
+
+	def _get_hierarchy_page_formatters(self) -> tuple[fmt.TagFormatter, ...]:
+		if self._sync_out_hierarchy:
+			return (
+				self._out_hierarchy_title_keeper,
+				self._page_title_formatter,
+				self._inc_drawio_formatter,
+			)
+
+		return (
+			self._out_hierarchy_title_checker,
+			self._page_title_formatter,
+			self._inc_drawio_formatter,
+		)
+
+	def _sync_tree(
+		self,
+		task: tp.Callable[..., tp.Iterable[tuple]],
+		tasks_args: tp.Iterable[tuple],
+		dependencies: tp.Callable[..., set[str]] | None = None,
+		spill_tasks: bool = False,
+	) -> None:
+		"""Run a task for every page of a tree.
+
+		The task syncs a page and returns the arguments of the tasks for its child pages.
+		Child tasks are run as soon as their parent page is synced,
+		so sibling subtrees don't wait for each other. Only a few tasks are submitted to the write executor at once,
+		the rest wait in a queue.
+
+		If the task returns an iterator, e.g. of child pages requested lazily, it is read by the read executor
+		in batches only while the queue has room. So the next pages are read while the current ones are written,
+		and the memory doesn't depend on the number of child pages.
+		Batches of up to a quarter of the page tasks are read at once, each of another page,
+		so that many partly read responses are kept at most.
+
+		If dependencies are given, they return the IDs of the source pages in the index a task should wait for.
+		The task is postponed until all these pages are synced. Then the task returns the ID of the source page
+		it synced along with the arguments of the child tasks, so only the tasks waiting for that page are checked.
+		If only postponed tasks are left, the dependencies are cyclic, so the task postponed first is run anyway.
+
+		If spill_tasks is True and the session has a spill database, arguments of waiting and postponed tasks
+		are kept on disk, so they must be picklable.
+		"""
+		spill_database = self._spill_database if spill_tasks else None
+
+		page_futures = set()
+		# True if tasks aren't run because of the deadline
+		stopped = False
+
+		# Arguments of the tasks waiting to be submitted
+		pending_tasks = spill_database.queue() if spill_database else collections.deque()
+
+		def _submit(_task_args: tuple) -> None:
+			pending_tasks.append(_task_args)
+
+		# Iterators of child tasks arguments that aren't read till the end
+		child_iterators = collections.deque()
+		# future: iterator read by the future
+		child_batch_futures = {}
+
+		def _read_child_batch(_child_iterator: tp.Iterator[tuple]) -> list[tuple]:
+			return list(it.islice(_child_iterator, _CHILD_PAGE_BATCH_SIZE))
+
+		def _schedule() -> None:
+			nonlocal stopped
+
+			while pending_tasks and len(page_futures) < self._max_page_tasks:
+				_task_args = pending_tasks.popleft()
+
+				if self._is_deadline_reached():
+					stopped = True
+				else:
+					page_futures.add(self._write_executor.submit(task, *_task_args))
+
+			# Most pages have few children, so several batches are read at once, and the queue doesn't exceed the limit
+			# by more than the batches of a quarter of the page tasks
+			while (
+				child_iterators
+				and not stopped
+				and len(pending_tasks) < self._max_page_tasks
+				and len(child_batch_futures) < max(1, self._max_page_tasks // 4)
+			):
+				child_iterator = child_iterators.popleft()
+				# Child pages unblock the pages to sync, so they are read before other reads
+				child_batch_futures[
+					self._read_executor.submit_work(scheduler.URGENT, _read_child_batch, child_iterator)
+				] = child_iterator
+
+		# page_id: [postponed task, ...]
+		waiting_tasks = collections.defaultdict(list)
+		# [(task_key, page_ids), ...] in the order the tasks were postponed
+		postponed_tasks = collections.deque()
+		# task_key: task_args
+		postponed_tasks_args = spill_database.mapping() if spill_database else {}
+		postponed_task_keys = it.count()
+
+		def _run(_task_args: tuple) -> None:
+			page_ids = dependencies(*_task_args) if dependencies else None
+
+			if page_ids:
+				postponed_task = (next(postponed_task_keys), page_ids)
+				postponed_tasks.append(postponed_task)
+				postponed_tasks_args[postponed_task[0]] = _task_args
+
+				for page_id in page_ids:
+					waiting_tasks[page_id].append(postponed_task)
+			else:
+				_submit(_task_args)
+
+		def _wake(_page_id: str) -> None:
+			# Tasks waiting only for the synced page are submitted
+			for postponed_task in waiting_tasks.pop(_page_id, ()):
+				task_key, page_ids = postponed_task
+				page_ids.discard(_page_id)
+
+				if not page_ids:
+					postponed_tasks.remove(postponed_task)
+					_submit(postponed_tasks_args.pop(task_key))
+
+		for task_args in tasks_args:
+			_run(task_args)
+
+		_schedule()
+
+		while page_futures or child_batch_futures or postponed_tasks:
+			if page_futures or child_batch_futures:
+				done, _ = futures.wait(
+					page_futures | child_batch_futures.keys(),
+					return_when=futures.FIRST_COMPLETED,
+				)
+
+				for ft in done:
+					if ft in child_batch_futures:
+						child_iterator = child_batch_futures.pop(ft)
+						child_tasks_args = ft.result()
+
+						# The rest of the children are read next
+						if len(child_tasks_args) == _CHILD_PAGE_BATCH_SIZE:
+							child_iterators.appendleft(child_iterator)
+					else:
+						page_futures.remove(ft)
+
+						if dependencies:
+							synced_page_id, child_tasks_args = ft.result()
+							_wake(synced_page_id)
+						else:
+							child_tasks_args = ft.result()
+
+						if isinstance(child_tasks_args, collections.abc.Iterator):
+							child_iterators.append(child_tasks_args)
+							continue
+
+					for task_args in child_tasks_args:
+						_run(task_args)
+
+			else:
+				task_key, page_ids = postponed_tasks.popleft()
+
+				for page_id in page_ids:
+					waiting_tasks[page_id].remove((task_key, page_ids))
+
+					if not waiting_tasks[page_id]:
+						del waiting_tasks[page_id]
+
+				self._logger.info('Pages with included drawio diagrams reference each other, referenced page count: %d', len(page_ids))
+				_submit(postponed_tasks_args.pop(task_key))
+
+			# Failed attachment copies stop the tree at once
+			self._tasks.raise_error()
+
+			_schedule()
+
+		# Wait for the attachments
+		self._wait_tasks()
+
+		if stopped:
+			raise DeadlineReached
+
+	def _sync_page(
+		self,
+		page_context: context.Page,
+		page_formatters: tp.Iterable[fmt.TagFormatter],
+		src_page: StrDict | None,
+		dst_parent_page_id: str,
+		nominal: bool = False,
+	) -> str:
+		"""Copy page.
+
+		The source page must contain the body, it isn't needed for nominal pages.
+		"""
+		dst_page_id, dst_page_title = self._sync_body(
+			page_context,
+			page_formatters,
+			src_page,
+			dst_parent_page_id,
+			nominal,
+		)
+
+		if not nominal:
+			self._sync_attachments(
+				page_context.src_id,
+				dst_page_id,
+				dst_page_title,
+				on_copied=functools.partial(self._journal_page, page_context),
+			)
+
+		self._logger.info('Page synced, "%s"', page_context.src_title)
+		self._inc_synced_page_count()
+
+		return dst_page_id
+
+	def _sync_body(
+		self,
+		page_context: context.Page,
+		page_formatters: tp.Iterable[fmt.TagFormatter],
+		src_page: StrDict | None,
+		dst_page_parent_id: str,
+		nominal: bool = False,
+	) -> tuple[str, str]:
+		"""Copy page text."""
+		old_title = page_context.src_title
+		new_title = self._title_formatter(page_context.src_space, old_title)
+		planned_page = self._planned_pages.get(page_context.src_id)
+
+		# If a nominal page is needed, and it already exists, skip it
+		if nominal:
+			if planned_page:
+				dst_page = {'id': planned_page.dst_id, 'title': new_title} if planned_page.dst_id else None
+			else:
+				dst_page = self._dst_cli.get_page_by_title(self._dst_space, new_title)
+
+			if not dst_page:
+				new_body = 'Nominal page that keeps the tree structure'
+				dst_page = self._dst_cli.create_page(self._dst_space, new_title, new_body, dst_page_parent_id)
+		else:
+			page_document = self._document_store.get_or_create(page_context.src_id, src_page['body']['storage']['value'])
+			new_body = fmt.format_document(page_context, page_document, page_formatters)
+
+			# Only the pages with delayed fixes need the document later
+			if self._inc_drawio_formatter.is_delayed(page_context.src_id):
+				self._document_store.keep(page_document)
+			else:
+				self._document_store.discard(page_context.src_id)
+
+			if planned_page:
+				dst_page = self._write_planned_page(planned_page, new_title, new_body, dst_page_parent_id)
+			else:
+				dst_page = self._write_page(new_title, new_body, dst_page_parent_id, page_context.dst_id)
+
+		self._page_index.set_dst_id(page_context, dst_page['id'])
+
+		self._logger.info('Page body synced, "%s"', old_title)
+
+		return dst_page['id'], dst_page['title']
+
+	def _write_page(
+		self,
+		new_title: str,
+		new_body: str,
+		dst_page_parent_id: str,
+		dst_page_id: str | None = None,
+	) -> StrDict:
+		"""Create the destination page, or update it if it exists.
+
+		:param dst_page_id: ID of the destination page the page is already copied to, if known,
+			it is updated by ID, so a renamed page keeps its destination page
+		"""
+		dst_page = None
+
+		if dst_page_id is not None:
+			try:
+				dst_page = self._dst_cli.get_page_by_id(dst_page_id, expand='ancestors')
+			except (errors.ApiError, requests.HTTPError):
+				self._logger.warning('Get synced page, id: %s', dst_page_id)
+
+		if dst_page is None:
+			dst_page = self._dst_cli.get_page_by_title(self._dst_space, new_title, expand='ancestors')
+
+		if dst_page:
+			# If the page exists and the content hasn’t changed, simply move it.
+			if self._dst_cli.is_page_content_is_already_updated(dst_page['id'], new_body, new_title):
+				cur_dst_page_parent_id = dst_page['ancestors'][-1].get('id')
+
+				if cur_dst_page_parent_id and cur_dst_page_parent_id != dst_page_parent_id:
+					self._dst_cli.move_page(self._dst_space, dst_page['id'], dst_page_parent_id)
+			else:
+				dst_page = self._dst_cli.update_page(
+					page_id=dst_page['id'],
+					title=new_title,
+					body=new_body,
+					parent_id=dst_page_parent_id,
+				)
+		else:
+			dst_page = self._dst_cli.create_page(
+				space=self._dst_space,
+				title=new_title,
+				body=new_body,
+				parent_id=dst_page_parent_id,
+			)
+
+		return dst_page
+
+	def _write_planned_page(
+		self,
+		planned_page: plan.PlannedPage,
+		new_title: str,
+		new_body: str,
+		dst_page_parent_id: str,
+	) -> StrDict:
+		"""Write the destination page as planned, without looking it up again."""
+		if planned_page.action == plan.CREATE:
+			return self._dst_cli.create_page(
+				space=self._dst_space,
+				title=new_title,
+				body=new_body,
+				parent_id=dst_page_parent_id,
+			)
+
+		action = planned_page.action
+
+		# The source page is changed since the plan, so the destination page is updated instead of kept or moved
+		if action in (plan.KEEP, plan.MOVE) and planned_page.body_hash not in (None, plan.hash_body(new_body)):
+			self._logger.warning('Page is changed since the plan, it is updated, "%s"', new_title)
+			action = plan.UPDATE
+
+		if action == plan.UPDATE:
+			return self._dst_cli.update_page(
+				page_id=planned_page.dst_id,
+				title=new_title,
+				body=new_body,
+				parent_id=dst_page_parent_id,
+			)
+
+		if action == plan.MOVE:
+			self._dst_cli.move_page(self._dst_space, planned_page.dst_id, dst_page_parent_id)
+
+		return {'id': planned_page.dst_id, 'title': new_title}
+
+	def _sync_attachments(
+		self,
+		src_page_id: str,
+		dst_page_id: str,
+		dst_page_title: str | None = None,
+		on_copied: tp.Callable[[], None] | None = None,
+	) -> None:
+		"""Copy page attachments.
+
+		:param on_copied: function called once all attachments are copied
+		"""
+		prefetched_ft = self._prefetched_attachments.pop(src_page_id, None)
+
+		# The listing isn't waited for, since it may be still queued behind other reads
+		if prefetched_ft is not None and prefetched_ft.done() and prefetched_ft.result() is not None:
+			src_attachments = prefetched_ft.result()
+		else:
+			src_attachments = self._list_src_attachments(src_page_id)
+
+		# Only pages with diagrams can be the new sources of included diagrams, whose attachments are looked up later
+		if fmt.IncDrawIOFormatter.has_diagram_attachments(attachment['title'] for attachment in src_attachments):
+			self._attachment_cache.add_listing(src_page_id, src_attachments)
+
+		planned_page = self._planned_pages.get(src_page_id)
+
+		self._copy_attachments(
+			src_attachments,
+			dst_page_id,
+			dst_page_title,
+			on_copied,
+			planned_page.attachments if planned_page else None,
+		)
+
+	def _list_src_attachments(self, src_page_id: str) -> list[StrDict]:
+		return list(
+			self._src_cli.traverse_page_attachments(
+				src_page_id,
+				expand='history.lastUpdated'
+			)
+		)
+
+	def _prefetch_attachments(self, src_page_id: str) -> list[StrDict] | None:
+		"""List attachments of a source page ahead of syncing it, None if they can't be listed."""
+		try:
+			return self._list_src_attachments(src_page_id)
+		except Exception:
+			# The page lists its attachments again and gets the error itself
+			self._logger.debug('Prefetch attachments, page id: %s', src_page_id, exc_info=True)
+			return None
+
+	def _copy_attachments(
+		self,
+		src_attachments: tp.Iterable[StrDict],
+		dst_page_id: str,
+		dst_page_title: str | None = None,
+		on_copied: tp.Callable[[], None] | None = None,
+		attachment_titles: tp.Collection[str] | None = None,
+	) -> None:
+		"""Copy page attachments to the destination page.
+
+		Attachments are copied by separate tasks.
+
+		:param on_copied: function called once all attachments are copied
+		:param attachment_titles: titles of the attachments to copy, if set, destination attachments aren't listed
+		"""
+		if attachment_titles is not None:
+			updated_src_attachments = [
+				src_attachment
+				for src_attachment in src_attachments
+				if src_attachment['title'] in attachment_titles
+			]
+		else:
+			dst_attachments = self._dst_cli.traverse_page_attachments(dst_page_id, expand='history.lastUpdated')
+			dst_attachments_map = {attachment['title']: attachment for attachment in dst_attachments}
+
+			updated_src_attachments = [
+				src_attachment
+				for src_attachment in src_attachments
+				if self._is_attachment_updated(
+					src_attachment,
+					dst_attachments_map.get(src_attachment['title']),
+					dst_page_id,
+					dst_page_title,
+				)
+			]
+
+		if not updated_src_attachments:
+			if on_copied:
+				on_copied()
+
+			return
+
+		countdown = _Countdown(len(updated_src_attachments), on_copied) if on_copied else None
+
+		for src_attachment in updated_src_attachments:
+			self._run_transfer_task(
+				self._get_attachment_size(src_attachment),
+				self._copy_attachment,
+				src_attachment,
+				dst_page_id,
+				dst_page_title,
+				countdown,
+			)
+
+	def _is_attachment_updated(
+		self,
+		src_attachment: StrDict,
+		dst_attachment: StrDict | None,
+		dst_page_id: str,
+		dst_page_title: str | None = None,
+	) -> bool:
+		"""Check if the attachment is new or its content has changed since the last copy."""
+		if self._is_attachment_outdated(src_attachment, dst_attachment):
+			return True
+
+		self._logger.warning(
+			'Attachment "%s" already copied, page: "%s"',
+			src_attachment['title'],
+			dst_page_title or dst_page_id
+		)
+
+		return False
+
+	@classmethod
+	def _is_attachment_outdated(cls, src_attachment: StrDict, dst_attachment: StrDict | None) -> bool:
+		if not dst_attachment:
+			return True
+
+		src_attachment_last_updated = cls._datetime_parser(src_attachment['history']['lastUpdated']['when'])
+		dst_attachment_last_updated = cls._datetime_parser(dst_attachment['history']['lastUpdated']['when'])
+
+		return dst_attachment_last_updated < src_attachment_last_updated
+
+	@staticmethod
+	def _get_attachment_size(attachment: StrDict) -> int:
+		return (attachment.get('extensions') or {}).get('fileSize') or 0
+
+	def _copy_attachment(
+		self,
+		src_attachment: StrDict,
+		dst_page_id: str,
+		dst_page_title: str | None = None,
+		countdown: _Countdown | None = None,
+	) -> None:
+		title = src_attachment['title']
+
+		download_url = src_attachment['_links']['download']
+		content = self._src_cli.get(download_url, not_json_response=True)
+
+		# For some reason, concurrent uploads to a page give a 503 HTTP status code, but the Confluence log shows 403
+		with self._attachment_locks.hold(dst_page_id):
+			self._dst_cli.attach_content(
+				content,
+				page_id=dst_page_id,
+				title=title,
+				name=title,
+				comment=src_attachment['metadata'].get('comment'),
+			)
+
+		self._logger.info('Attachment "%s" copied, page: "%s"', title, dst_page_title or dst_page_id)
+
+		if countdown:
+			countdown.done()
+
+	def _sync_inc_drawio(self) -> None:
+		self._check_deadline()
+
+		src_page_ids = self._inc_drawio_formatter.prepare_delayed_pages()
+
+		if self._journal:
+			self._journal.write_drawio_sources(*self._inc_drawio_formatter.new_sources())
+
+		self._logger.info('Fixing pages with included drawio diagrams, page count: %d', len(src_page_ids))
+
+		self._inc_synced_page_count(-len(src_page_ids))
+
+		# Attachments of the new diagram sources are found concurrently, once for all pages referring to them
+		for ref_page_id, attachment_names in self._inc_drawio_formatter.new_source_attachments().items():
+			_, missed_attachment_names = self._attachment_cache.get_by_names(ref_page_id, attachment_names)
+
+			for attachment_name in missed_attachment_names:
+				self._run_read_task(self._find_attachment, ref_page_id, attachment_name)
+
+		self._wait_tasks()
+
+		for src_page_id in src_page_ids:
+			if self._is_deadline_reached():
+				self._wait_tasks()
+				raise DeadlineReached
+
+			self._run_task(self._sync_inc_drawio_page, src_page_id)
+
+		self._wait_tasks()
+
+	def _sync_inc_drawio_page(self, src_page_id: str) -> None:
+		"""Fix included drawio diagrams of a page and copy the attachments of the diagrams."""
+		body, attachments, comment = self._inc_drawio_formatter.process_delayed_page(src_page_id)
+
+		page_context = self._page_index.search_by_id(src_page_id)
+
+		new_title = self._title_formatter(page_context.src_space, page_context.src_title)
+
+		self._dst_cli.update_page(
+			page_id=page_context.dst_id,
+			title=new_title,
+			body=body,
+			version_comment=comment
+		)
+
+		attachments = it.chain.from_iterable(
+			self._get_attachments_by_names(ref_page_id, attachment_names)
+
+			for ref_page_id, attachment_names
+			in attachments.items()
+		)
+
+		attachments = list(attachments)
+
+		self._copy_attachments(
+			attachments,
+			page_context.dst_id,
+			new_title,
+			on_copied=functools.partial(self._journal_drawio_fixed, src_page_id),
+		)
+
+		self._logger.info('Included drawio diagram was fixed, page: "%s"', new_title)
+		self._inc_synced_page_count()
+
+	def _journal_drawio_fixed(self, src_page_id: str) -> None:
+		if self._journal:
+			self._journal.write_drawio_fixed(src_page_id)
+
+	def _get_attachments_by_names(self, src_page_id: str, attachment_names: tp.Iterable[str]) -> list[StrDict]:
+		"""Get attachments of a source page from the cache, or find the missing ones by name."""
+		attachments, missed_attachment_names = self._attachment_cache.get_by_names(src_page_id, attachment_names)
+
+		for attachment_name in missed_attachment_names:
+			attachments.extend(self._find_attachment(src_page_id, attachment_name))
+
+		return attachments
+
+	def _find_attachment(self, src_page_id: str, attachment_name: str) -> list[StrDict]:
+		"""Find an attachment of a source page by name and cache it."""
+		attachments = self._src_cli.get_attachment_by_name(src_page_id, attachment_name, expand='history.lastUpdated')
+		self._attachment_cache.add(src_page_id, attachment_name, attachments[0] if attachments else None)
+
+		return attachments
+
+
+class _SessionGroup(observer.Observable):
+	"""Sessions run in parallel with their page counts summed up.
+
+	Sessions are created just before they are run, so at most `max_concurrent` sessions keep their page index at once.
+	If a session fails, the others are still run, and the first error is raised at the end.
+	"""
+
+	_logger = logging.getLogger('confluence-sync')
+
+	def __init__(
+		self,
+		*,
+		sessions: list[tuple[str, tp.Callable[[], observer.Observable]]],
+		max_concurrent: int,
+		close: tp.Callable[[], None] | None = None,
+	) -> None:
+		"""
+		:param sessions: tuples of the session name and the function creating the session
+		:param max_concurrent: maximum number of sessions run at once
+		:param close: function releasing resources shared by the sessions
+		"""
+		super().__init__()
+
+		self._sessions = sessions
+		self._max_concurrent = max_concurrent
+		self._close = close
+
+		self._lock = threading.Lock()
+		self._total_page_counts = [0] * len(sessions)
+		self._synced_page_counts = [0] * len(sessions)
+
+	def run(self) -> None:
+		error = None
+
+		try:
+			with futures.ThreadPoolExecutor(self._max_concurrent) as executor:
+				sessions_futures = {
+					executor.submit(self._run_session, i, create_session): name
+					for i, (name, create_session) in enumerate(self._sessions)
+				}
+
+				for ft in futures.as_completed(sessions_futures):
+					if ft.exception() is None:
+						continue
+
+					self._logger.error('Sync failed, %s', sessions_futures[ft], exc_info=ft.exception())
+					error = error or ft.exception()
+		finally:
+			if self._close:
+				self._close()
+
+		if error:
+			raise error
+
+	def _run_session(self, session_idx: int, create_session: tp.Callable[[], observer.Observable]) -> None:
+		session = create_session()
+		session.attach(_SessionGroupObserver(self, session_idx))
+		session.run()
+
+	def on_session_event(self, session_idx: int, event: events.Event) -> None:
+		"""Sum up the page counts of the sessions."""
+		if isinstance(event, events.TotalPageCountChanged):
+			with self._lock:
+				self._total_page_counts[session_idx] = event.total_page_count
+				event = events.TotalPageCountChanged(sum(self._total_page_counts))
+		elif isinstance(event, events.SyncedPageCountChanged):
+			with self._lock:
+				self._synced_page_counts[session_idx] = event.synced_page_count
+				event = events.SyncedPageCountChanged(sum(self._synced_page_counts))
+
+		self.notify(event)
+
+
+class _SessionGroupObserver(observer.Observer):
+	def __init__(self, session_group: _SessionGroup, session_idx: int) -> None:
+		self._session_group = session_group
+		self._session_idx = session_idx
+
+	def update(self, event: events.Event) -> None:
+		self._session_group.on_session_event(self._session_idx, event)
+
+
+class ConfluenceSynchronizer:
+	def __init__(
+		self,
+		src_conf: ConfluenceConfig | None,
+		dst_conf: ConfluenceConfig | None,
+		max_workers: int | None = None,
+		spill_dir: str | pathlib.Path | None = None,
+		read_workers: int | None = None,
+		transfer_workers: int | None = None,
+		src_rate_limit: ratelimit.RateLimit | None = None,
+		dst_rate_limit: ratelimit.RateLimit | None = None,
+		http_cache_path: str | pathlib.Path | None = None,
+	) -> None:
+		"""
+		:param src_conf: source confluence, it isn't needed to import bundles
+		:param dst_conf: destination confluence, it isn't needed to export bundles
+		:param max_workers: maximum number of concurrent page writes of all sessions to every destination instance
+		:param spill_dir: if set, every session keeps its page index and the pages waiting to be synced
+			in a temporary database in the directory instead of memory
+		:param read_workers: maximum number of concurrent source reads made ahead of the writes,
+			max_workers is used if not set
+		:param transfer_workers: maximum number of concurrent attachment copies to every destination instance,
+			half of max_workers is used if not set
+		:param src_rate_limit: limits of the requests to the source
+		:param dst_rate_limit: limits of the requests to every destination instance
+		:param http_cache_path: if set, source responses are kept in the file between runs,
+			and unchanged ones are served from it
+		"""
+		super().__init__()
+
+		self._src_conf = src_conf
+		self._dst_conf = dst_conf
 
 		self._src_cli: CustomConfluence | None = None
 		self._dst_cli: CustomConfluence | None = None
-
-		self._executor = futures.ThreadPoolExecutor()
+		# Clients of other destination instances used by fan-out sessions
+		self._dst_clis: dict[ConfluenceConfig, CustomConfluence] = {}
+		self._dst_clis_lock = threading.Lock()
+
+		# Limiters are shared by all clients of an instance
+		self._src_rate_limiter = ratelimit.RateLimiter(src_rate_limit) if src_rate_limit else None
+		self._dst_rate_limit = dst_rate_limit
+		# destination url: limiter
+		self._dst_rate_limiters: dict[str, ratelimit.RateLimiter] = {}
+
+		self._http_cache_path = http_cache_path
+		self._http_cache: httpcache.HttpCache | None = None
+
+		# Every instance has its own lanes shared by all sessions, so a slow destination doesn't hold the source reads,
+		# and attachment copies don't hold the page writes
+		max_workers = max_workers or scheduler.default_max_workers()
+		self._write_workers = max_workers
+		self._transfer_workers = transfer_workers or max(1, max_workers // 2)
+		self._read_executor = scheduler.PriorityExecutor(read_workers or max_workers)
+		# destination instance: (write executor, transfer executor)
+		self._dst_executors: dict[ConfluenceConfig | None, tuple[scheduler.PriorityExecutor, scheduler.PriorityExecutor]] = {}
+		# Every session keeps a couple of page tasks and other tasks per worker in the queue of the write executor
+		self._max_page_tasks = 2 * max_workers
+
+		self._spill_dir = spill_dir
+		self._spill_databases: list[spill.SpillDatabase] = []
+		self._spill_databases_lock = threading.Lock()
 
 		self._opened = False
 
 	def __enter__(self) -> 'ConfluenceSynchronizer':
 		self._ensure_closed()
 
-		self._src_cli = CustomConfluence(**dc.asdict(self._src_conf))
-		self._dst_cli = CustomConfluence(**dc.asdict(self._dst_conf))
-		self._executor = self._executor.__enter__()
+		if self._src_conf:
+			if self._http_cache_path is not None:
+				self._http_cache = httpcache.HttpCache(self._http_cache_path)
+
+			# The source isn't changed by the run, so concurrent identical reads of it are shared and cached
+			self._src_cli = CustomConfluence(
+				**dc.asdict(self._src_conf),
+				rate_limiter=self._src_rate_limiter,
+				single_flight=True,
+				http_cache=self._http_cache,
+			)
+
+		if self._dst_conf:
+			self._dst_cli = self._create_dst_client(self._dst_conf)
+			self._dst_clis[self._dst_conf] = self._dst_cli
 
 		self._opened = True
 
@@ -528,9 +2114,27 @@ class ConfluenceSynchronizer:
 	def __exit__(self, *args) -> None:
 		self._ensure_opened()
 
-		self._executor.__exit__(*args)
-		self._src_cli.close()
-		self._dst_cli.close()
+		self._read_executor.shutdown()
+
+		with self._dst_clis_lock:
+			for write_executor, transfer_executor in self._dst_executors.values():
+				write_executor.shutdown()
+				transfer_executor.shutdown()
+
+		if self._src_cli:
+			self._src_cli.close()
+
+		for dst_cli in self._dst_clis.values():
+			dst_cli.close()
+
+		if self._http_cache is not None:
+			self._http_cache.close()
+
+		with self._spill_databases_lock:
+			for spill_database in self._spill_databases:
+				spill_database.close()
+
+			self._spill_databases.clear()
 
 	def _ensure_opened(self) -> None:
 		if not self._opened:
@@ -540,6 +2144,38 @@ class ConfluenceSynchronizer:
 		if self._opened:
 			raise ValueError('ConfluenceSynchronizer must be closed')
 
+	def _get_dst_client(self, conf: ConfluenceConfig) -> CustomConfluence:
+		with self._dst_clis_lock:
+			if conf not in self._dst_clis:
+				self._dst_clis[conf] = self._create_dst_client(conf)
+
+			return self._dst_clis[conf]
+
+	def _create_dst_client(self, conf: ConfluenceConfig) -> CustomConfluence:
+		rate_limiter = None
+
+		if self._dst_rate_limit:
+			if conf.url not in self._dst_rate_limiters:
+				self._dst_rate_limiters[conf.url] = ratelimit.RateLimiter(self._dst_rate_limit)
+
+			rate_limiter = self._dst_rate_limiters[conf.url]
+
+		return CustomConfluence(**dc.asdict(conf), rate_limiter=rate_limiter)
+
+	def _get_dst_executors(
+		self,
+		conf: ConfluenceConfig | None,
+	) -> tuple[scheduler.PriorityExecutor, scheduler.PriorityExecutor]:
+		"""Get the write and the transfer executors of the destination instance."""
+		with self._dst_clis_lock:
+			if conf not in self._dst_executors:
+				self._dst_executors[conf] = (
+					scheduler.PriorityExecutor(self._write_workers),
+					scheduler.PriorityExecutor(self._transfer_workers),
+				)
+
+			return self._dst_executors[conf]
+
 	def sync_page_hierarchy(
 		self,
 		src_space: str | None,
@@ -549,10 +2185,15 @@ class ConfluenceSynchronizer:
 		dst_title: str | None,
 		dst_id: str | None,
 		*,
+		destinations: tp.Sequence[DestinationConfig] = (),
 		sync_out_hierarchy: bool = False,
 		replace_title_substr: tuple[str, str] | None = None,
 		start_title_with: str | None = None,
-	) -> _ConfluenceSynchronizerSession:
+		journal_path: str | pathlib.Path | None = None,
+		resume: bool = False,
+		deadline: dt.datetime | None = None,
+		sync_plan: plan.Plan | None = None,
+	) -> _ConfluenceSynchronizerSession | _SessionGroup:
 		"""Copy all pages in the tree hierarchy.
 
 		:param src_space: source page space
@@ -561,20 +2202,110 @@ class ConfluenceSynchronizer:
 		:param dst_space: destination page space
 		:param dst_title: destination page title
 		:param dst_id: destination page id
+		:param destinations: other destination pages, the source is read once for all destinations
 		:param sync_out_hierarchy: copy the page outside the target hierarchy
 		:param replace_title_substr: change part of page titles to a new value
 		:param start_title_with: add prefix to page title
+		:param journal_path: path to the journal of completed work, it isn't supported with other destinations
+		:param resume: continue the run from the journal
+		:param deadline: time to stop starting new work, DeadlineReached is raised by the run then
+		:param sync_plan: plan made by a session with the same settings, the run applies it;
+			plans aren't supported with other destinations
 		:return: page copying session
 		"""
 		self._ensure_opened()
 
-		return _ConfluenceSynchronizerSession(
-			executor=self._executor,
+		if journal_path is not None and destinations:
+			raise ValueError('Journal is not supported with several destinations')
+
+		if sync_plan is not None and destinations:
+			raise ValueError('Plan is not supported with several destinations')
+
+		job = SyncJob(
+			src_space=src_space,
+			src_title=src_title,
+			src_id=src_id,
+			dst_space=dst_space,
+			dst_title=dst_title,
+			dst_id=dst_id,
+			destinations=tuple(destinations),
+			sync_out_hierarchy=sync_out_hierarchy,
+			replace_title_substr=replace_title_substr,
+			start_title_with=start_title_with,
+		)
+
+		if destinations:
+			return self._create_fan_out_session(job, deadline=deadline)
+
+		return self._create_journaled_session(job, journal_path, resume, deadline=deadline, sync_plan=sync_plan)
+
+	def export_bundle(
+		self,
+		path: str | pathlib.Path,
+		src_space: str | None,
+		src_title: str | None,
+		src_id: str | None,
+		sync_out_hierarchy: bool = False,
+	) -> bundle.BundleExporter:
+		"""Export the tree hierarchy from the source to a bundle, so it can be imported without the source.
+
+		:param path: path to the bundle directory
+		:param src_space: source page space
+		:param src_title: source page title
+		:param src_id: source page id
+		:param sync_out_hierarchy: export the pages outside the target hierarchy, so they can be imported
+		:return: export session
+		"""
+		self._ensure_opened()
+
+		return bundle.BundleExporter(
+			executor=self._read_executor,
+			max_tasks=self._max_page_tasks,
 			src_cli=self._src_cli,
-			dst_cli=self._dst_cli,
+			path=path,
 			src_space=src_space,
 			src_title=src_title,
 			src_id=src_id,
+			sync_out_hierarchy=sync_out_hierarchy,
+		)
+
+	def import_bundle(
+		self,
+		path: str | pathlib.Path,
+		dst_space: str | None,
+		dst_title: str | None,
+		dst_id: str | None,
+		*,
+		sync_out_hierarchy: bool = False,
+		replace_title_substr: tuple[str, str] | None = None,
+		start_title_with: str | None = None,
+		journal_path: str | pathlib.Path | None = None,
+		resume: bool = False,
+		deadline: dt.datetime | None = None,
+		sync_plan: plan.Plan | None = None,
+	) -> _ConfluenceSynchronizerSession:
+		"""Copy the hierarchy of a bundle to the destination, the bundle is the source of a usual session.
+
+		The other parameters are the same as the ones of sync_page_hierarchy.
+
+		:param path: path to the bundle directory
+		:param dst_space: destination page space
+		:param dst_title: destination page title
+		:param dst_id: destination page id
+		:param sync_out_hierarchy: copy the pages outside the target hierarchy, they must be exported
+		:return: page copying session
+		"""
+		self._ensure_opened()
+
+		src_cli = bundle.BundleConfluence(path)
+
+		if sync_out_hierarchy and not src_cli.sync_out_hierarchy:
+			raise ValueError('Bundle is exported without the pages outside the hierarchy')
+
+		job = SyncJob(
+			src_space=None,
+			src_title=None,
+			src_id=src_cli.root_page_id,
 			dst_space=dst_space,
 			dst_title=dst_title,
 			dst_id=dst_id,
@@ -583,6 +2314,153 @@ class ConfluenceSynchronizer:
 			start_title_with=start_title_with,
 		)
 
+		return self._create_journaled_session(
+			job,
+			journal_path,
+			resume,
+			src_cli=src_cli,
+			deadline=deadline,
+			sync_plan=sync_plan,
+		)
+
+	def sync_page_hierarchies(self, jobs: tp.Sequence[SyncJob], max_concurrent_jobs: int = 4) -> _SessionGroup:
+		"""Copy several page hierarchies in one run.
+
+		The jobs share the clients, the executors and the caches of source pages and attachments,
+		except the jobs copied to several destinations, which share the source reads of their destinations.
+
+		:param jobs: page hierarchies to copy
+		:param max_concurrent_jobs: maximum number of jobs run at once
+		:return: page copying session of all jobs
+		"""
+		self._ensure_opened()
+
+		page_cache = cache.PageCache()
+		attachment_cache = cache.AttachmentCache()
+
+		def _create_job_session(_job: SyncJob) -> _ConfluenceSynchronizerSession | _SessionGroup:
+			if not _job.destinations:
+				return self._create_session(_job, page_cache=page_cache, attachment_cache=attachment_cache)
+
+			return self._create_fan_out_session(_job)
+
+		return _SessionGroup(
+			sessions=[(job.display_name, functools.partial(_create_job_session, job)) for job in jobs],
+			max_concurrent=max_concurrent_jobs,
+			close=page_cache.close,
+		)
+
+	def _create_journaled_session(
+		self,
+		job: SyncJob,
+		journal_path: str | pathlib.Path | None,
+		resume: bool,
+		**kwargs,
+	) -> _ConfluenceSynchronizerSession:
+		if journal_path is None:
+			return self._create_session(job, **kwargs)
+
+		session_journal = journal.Journal(journal_path, resume)
+
+		try:
+			return self._create_session(job, journal=session_journal, **kwargs)
+		except Exception:
+			session_journal.close()
+			raise
+
+	def _create_session(
+		self,
+		job: SyncJob,
+		*,
+		src_cli: CustomConfluence | None = None,
+		dst_conf: ConfluenceConfig | None = None,
+		**kwargs,
+	) -> _ConfluenceSynchronizerSession:
+		write_executor, transfer_executor = self._get_dst_executors(dst_conf or self._dst_conf)
+
+		return _ConfluenceSynchronizerSession(
+			read_executor=self._read_executor,
+			write_executor=write_executor,
+			transfer_executor=transfer_executor,
+			max_page_tasks=self._max_page_tasks,
+			max_tasks=self._max_page_tasks,
+			spill_database=self._create_spill_database(),
+			src_cli=src_cli or self._src_cli,
+			dst_cli=self._get_dst_client(dst_conf) if dst_conf else self._dst_cli,
+			src_space=job.src_space,
+			src_title=job.src_title,
+			src_id=job.src_id,
+			dst_space=job.dst_space,
+			dst_title=job.dst_title,
+			dst_id=job.dst_id,
+			sync_out_hierarchy=job.sync_out_hierarchy,
+			replace_title_substr=job.replace_title_substr,
+			start_title_with=job.start_title_with,
+			**kwargs,
+		)
+
+	def _create_spill_database(self) -> spill.SpillDatabase | None:
+		if self._spill_dir is None:
+			return None
+
+		spill_database = spill.SpillDatabase(self._spill_dir)
+
+		with self._spill_databases_lock:
+			self._spill_databases.append(spill_database)
+
+		return spill_database
+
+	def _create_fan_out_session(self, job: SyncJob, deadline: dt.datetime | None = None) -> _SessionGroup:
+		destinations = list(job.destinations)
+
+		if job.dst_space is not None or job.dst_title is not None or job.dst_id is not None:
+			destinations.insert(0, DestinationConfig(self._dst_conf, job.dst_space, job.dst_title, job.dst_id))
+
+		# Source responses and parsed bodies are kept until every destination session has used them.
+		# Sessions don't share the caches of source pages and attachments, since a read answered
+		# by such a cache wouldn't release the shared response.
+		shared_reads = cache.SharedReads(len(destinations), sizeof=lambda response: len(response.content))
+		shared_trees = cache.SharedReads(len(destinations), sizeof=document.shared_tree_size)
+		src_clis = []
+
+		def _create_destination_session(_destination: DestinationConfig) -> _ConfluenceSynchronizerSession:
+			# Every session reads the source with its own client, so its reads are counted as reads of one consumer
+			src_cli = CustomConfluence(
+				**dc.asdict(self._src_conf),
+				shared_reads=shared_reads.reader(),
+				rate_limiter=self._src_rate_limiter,
+				single_flight=True,
+				http_cache=self._http_cache,
+			)
+			src_clis.append(src_cli)
+
+			return self._create_session(
+				dc.replace(job, dst_space=_destination.space, dst_title=_destination.title, dst_id=_destination.id),
+				src_cli=src_cli,
+				dst_conf=_destination.confluence,
+				shared_trees=shared_trees.reader(),
+				deadline=deadline,
+			)
+
+		def _close() -> None:
+			shared_reads.close()
+			shared_trees.close()
+
+			for src_cli in src_clis:
+				src_cli.close()
+
+		return _SessionGroup(
+			sessions=[
+				(
+					f'{job.display_name}, destination {destination.confluence.url}',
+					functools.partial(_create_destination_session, destination),
+				)
+				for destination in destinations
+			],
+			max_concurrent=len(destinations),
+			close=_close,
+		)
+
 
 def get_page(
 	cli: CustomConfluence,
@@ -5,26 +5,50 @@ NodeT = tp.TypeVar('NodeT', bound=tp.Any)
 
 
 class Node(tp.Generic[NodeT]):
-	"""First child / next sibling."""
-
-	def __init__(self, data: NodeT | None = None) -> None:
+	"""First child / next sibling.
+
+	Nodes created with a key are indexed: every node keeps its children by key, so lookups don't scan the siblings.
+	Subtree sizes are cached and updated on every insertion.
+	"""
+
+	__slots__ = (
+		'data',
+		'key',
+		'_parent',
+		'_next',
+		'_next_tail',
+		'_sibling',
+		'_children_index',
+		'_descendants_count',
+	)
+
+	def __init__(self, data: NodeT | None = None, key: tp.Hashable | None = None) -> None:
 		self.data = data
+		self.key = key
+
+		self._parent: 'Node[NodeT]' | None = None
 
-		self._next = None
+		self._next: 'Node[NodeT]' | None = None
 		self._next_tail: 'Node[NodeT]' | None = None
 
 		self._sibling: 'Node[NodeT]' | None = None
 
-	@property
-	def descendants_count(self) -> int:
-		cnt = 0
+		# key: child node
+		self._children_index: dict[tp.Hashable, 'Node[NodeT]'] = {}
+		self._descendants_count = 0
 
-		for _ in self.descendants():
-			cnt += 1
+	@property
+	def parent(self) -> tp.Optional['Node[NodeT]']:
+		return self._parent
 
-		return cnt
+	@property
+	def descendants_count(self) -> int:
+		return self._descendants_count
 
 	def add_child(self, node: 'Node[NodeT]') -> None:
+		if node._parent:
+			raise ValueError('Node already has a parent')
+
 		if self._next_tail:
 			self._next_tail._sibling = node
 			self._next_tail = self._next_tail._sibling
@@ -32,6 +56,21 @@ class Node(tp.Generic[NodeT]):
 			self._next = node
 			self._next_tail = self._next
 
+		node._parent = self
+
+		if node.key is not None:
+			self._children_index[node.key] = node
+
+		added_count = node._descendants_count + 1
+		ancestor = self
+
+		while ancestor:
+			ancestor._descendants_count += added_count
+			ancestor = ancestor._parent
+
+	def find_child(self, key: tp.Hashable) -> tp.Optional['Node[NodeT]']:
+		return self._children_index.get(key)
+
 	# A type hint written with | causes an error.
 	def find_child_by(self, key: tp.Callable[[NodeT], bool]) -> tp.Optional['Node[NodeT]']:
 		for child in self.children():
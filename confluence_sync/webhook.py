@@ -0,0 +1,309 @@
+import dataclasses as dc
+import hashlib
+import hmac
+import http.server
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import typing as tp
+
+from confluence_sync.confluence import StrDict
+
+_logger = logging.getLogger('confluence-sync')
+
+# Events that change the page itself
+_page_events = {'page_created', 'page_updated', 'page_moved', 'page_restored'}
+# Events that change the attachments of a page
+_attachment_events = {'attachment_created', 'attachment_updated', 'attachment_restored'}
+
+
+class PageSyncSession(tp.Protocol):
+	def run(self) -> None:
+		pass
+
+	def sync_pages(self, page_ids: tp.Iterable[str], attachment_page_ids: tp.Iterable[str] = ()) -> int:
+		pass
+
+
+@dc.dataclass(slots=True)
+class QueuedPage:
+	page_id: str
+	# True if the page itself is changed
+	page: bool
+	# True if the attachments of the page are changed
+	attachments: bool
+	first_event_at: float
+	last_event_at: float
+
+
+class WebhookQueue:
+	"""Thread-safe queue of pages to sync, filled by webhook events.
+
+	Events of the same page are merged into one item, so a burst of edits is synced at once.
+	An item is ready when no events of the page came for the debounce period,
+	or when the max delay has passed since the first event.
+
+	If the path is given, the queue is saved to the file on every change and loaded on creation,
+	so the events aren't lost if the service stops. Taken items are saved until they are done.
+	"""
+
+	def __init__(
+		self,
+		path: str | pathlib.Path | None = None,
+		debounce: float = 10,
+		max_delay: float = 300,
+	) -> None:
+		self._path = pathlib.Path(path) if path else None
+		self._debounce = debounce
+		self._max_delay = max_delay
+
+		# page_id: item
+		self._pending: dict[str, QueuedPage] = {}
+		self._taken: dict[str, QueuedPage] = {}
+		self._changed = threading.Condition()
+
+		if self._path and self._path.exists():
+			self._load()
+
+	def __len__(self) -> int:
+		with self._changed:
+			return len(self._pending) + len(self._taken)
+
+	def add(self, page_id: str, page: bool = False, attachments: bool = False) -> None:
+		now = time.time()
+
+		with self._changed:
+			item = self._pending.get(page_id)
+
+			if item is None:
+				self._pending[page_id] = QueuedPage(page_id, page, attachments, now, now)
+			else:
+				item.page = item.page or page
+				item.attachments = item.attachments or attachments
+				item.last_event_at = now
+
+			self._save()
+			self._changed.notify_all()
+
+	def take_ready(self, timeout: float | None = None) -> list[QueuedPage]:
+		"""Wait until some items are ready and take them.
+
+		:param timeout: maximum seconds to wait, an empty list is returned after it
+		"""
+		deadline = time.monotonic() + timeout if timeout is not None else None
+
+		with self._changed:
+			while True:
+				now = time.time()
+				ready = [item for item in self._pending.values() if self._ready_at(item) <= now]
+
+				if ready:
+					for item in ready:
+						del self._pending[item.page_id]
+						self._taken[item.page_id] = item
+
+					return ready
+
+				wait = min((self._ready_at(item) for item in self._pending.values()), default=now + 60) - now
+
+				if deadline is not None:
+					wait = min(wait, deadline - time.monotonic())
+
+					if wait <= 0:
+						return []
+
+				self._changed.wait(wait)
+
+	def done(self, items: tp.Iterable[QueuedPage]) -> None:
+		with self._changed:
+			for item in items:
+				self._taken.pop(item.page_id, None)
+
+			self._save()
+
+	def retry(self, items: tp.Iterable[QueuedPage]) -> None:
+		"""Return the taken items to the queue, merging them with the events received since.
+
+		The items are ready again after the debounce period.
+		"""
+		now = time.time()
+
+		with self._changed:
+			for item in items:
+				self._taken.pop(item.page_id, None)
+				pending_item = self._pending.get(item.page_id)
+
+				if pending_item is None:
+					self._pending[item.page_id] = QueuedPage(item.page_id, item.page, item.attachments, now, now)
+				else:
+					pending_item.page = pending_item.page or item.page
+					pending_item.attachments = pending_item.attachments or item.attachments
+
+			self._save()
+			self._changed.notify_all()
+
+	def _ready_at(self, item: QueuedPage) -> float:
+		return min(item.last_event_at + self._debounce, item.first_event_at + self._max_delay)
+
+	def _load(self) -> None:
+		with self._path.open(encoding='utf-8') as f:
+			data = json.load(f)
+
+		for item_data in data:
+			item = QueuedPage(**item_data)
+			self._pending[item.page_id] = item
+
+	def _save(self) -> None:
+		if not self._path:
+			return
+
+		# Taken items aren't synced yet, so they are loaded again after restart
+		data = [dc.asdict(item) for item in (*self._taken.values(), *self._pending.values())]
+
+		# The file is replaced at once, so it is never written partially
+		tmp_path = self._path.with_name(self._path.name + '.tmp')
+
+		with tmp_path.open('w', encoding='utf-8') as f:
+			json.dump(data, f)
+
+		os.replace(tmp_path, self._path)
+
+
+class WebhookReceiver:
+	"""Local HTTP service that syncs pages changed according to Confluence webhooks.
+
+	Page and attachment events are put to the queue, and the pages are synced by the session as they get ready.
+	Events of pages outside the hierarchy of the session are skipped while syncing.
+	"""
+
+	def __init__(
+		self,
+		session: PageSyncSession,
+		queue: WebhookQueue,
+		host: str = '127.0.0.1',
+		port: int = 8000,
+		secret: str | None = None,
+	) -> None:
+		"""
+		:param session: session syncing the changed pages
+		:param queue: queue of changed pages
+		:param host: host to listen on
+		:param port: port to listen on
+		:param secret: secret of the webhook, if set, the signatures of the events are checked
+		"""
+		self._session = session
+		self._queue = queue
+		self._secret = secret.encode() if secret else None
+
+		self._server = http.server.ThreadingHTTPServer((host, port), self._create_handler())
+
+	@property
+	def address(self) -> tuple[str, int]:
+		return self._server.server_address[:2]
+
+	def serve(self, stop: threading.Event | None = None) -> None:
+		"""Receive events and sync the changed pages until stopped.
+
+		The hierarchy is copied first, events received meanwhile are synced after that.
+
+		:param stop: event that stops the service
+		"""
+		stop = stop or threading.Event()
+
+		server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+		server_thread.start()
+
+		_logger.info('Receiving webhooks, address: %s:%d', *self.address)
+
+		try:
+			self._session.run()
+
+			while not stop.is_set():
+				items = self._queue.take_ready(timeout=1)
+
+				if items:
+					self._sync(items)
+		finally:
+			self._server.shutdown()
+			self._server.server_close()
+			server_thread.join()
+
+	def handle_event(self, payload: StrDict) -> None:
+		"""Put the page changed by the event to the queue."""
+		event = payload.get('event')
+
+		if event in _page_events:
+			page_id = (payload.get('page') or {}).get('id')
+
+			if page_id is not None:
+				self._queue.add(str(page_id), page=True)
+		elif event in _attachment_events:
+			page_id = self._get_attachment_page_id(payload)
+
+			if page_id is not None:
+				self._queue.add(str(page_id), attachments=True)
+
+	def _sync(self, items: list[QueuedPage]) -> None:
+		try:
+			self._session.sync_pages(
+				(item.page_id for item in items if item.page),
+				(item.page_id for item in items if item.attachments),
+			)
+		except Exception:
+			_logger.exception('Sync pages changed by webhooks')
+			self._queue.retry(items)
+		else:
+			self._queue.done(items)
+
+	def _is_signed(self, body: bytes, signature: str | None) -> bool:
+		if self._secret is None:
+			return True
+
+		if not signature:
+			return False
+
+		expected_signature = 'sha256=' + hmac.new(self._secret, body, hashlib.sha256).hexdigest()
+
+		return hmac.compare_digest(expected_signature, signature)
+
+	@staticmethod
+	def _get_attachment_page_id(payload: StrDict) -> tp.Any:
+		attachment = payload.get('attachment') or {}
+
+		# Different Confluence versions put the page of the attachment to different fields
+		container = attachment.get('container') or attachment.get('containedIn') or payload.get('page') or {}
+
+		return container.get('id')
+
+	def _create_handler(self) -> type[http.server.BaseHTTPRequestHandler]:
+		receiver = self
+
+		class _Handler(http.server.BaseHTTPRequestHandler):
+			def do_POST(self) -> None:
+				body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+				if not receiver._is_signed(body, self.headers.get('X-Hub-Signature')):
+					self.send_response(401)
+					self.end_headers()
+					return
+
+				try:
+					payload = json.loads(body)
+				except ValueError:
+					self.send_response(400)
+					self.end_headers()
+					return
+
+				if isinstance(payload, dict):
+					receiver.handle_event(payload)
+
+				self.send_response(204)
+				self.end_headers()
+
+			def log_message(self, format: str, *args: tp.Any) -> None:
+				_logger.debug('Webhook request, %s', format % args)
+
+		return _Handler
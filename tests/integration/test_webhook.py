@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+import typing as tp
+import urllib.request
+
+import pytest
+from atlassian import confluence
+
+from confluence_sync import sync, webhook
+from tests.integration import case, config
+from tests.integration.test_cli import assert_page_content, setup_and_clean_test_case  # noqa: F401
+
+
+class InitialRunSession:
+	"""Session that reports when its initial run is completed."""
+
+	def __init__(self, session: webhook.PageSyncSession) -> None:
+		self._session = session
+		self.ran = threading.Event()
+
+	def run(self) -> None:
+		self._session.run()
+		self.ran.set()
+
+	def sync_pages(self, page_ids: tp.Iterable[str], attachment_page_ids: tp.Iterable[str] = ()) -> int:
+		return self._session.sync_pages(page_ids, attachment_page_ids)
+
+
+@pytest.fixture
+def test_case() -> case.TestCase:
+	return next(test_case for test_case in case.get_test_cases() if test_case.name == '1_copy_page')
+
+
+def send_webhook(address: tuple[str, int], payload: dict[str, tp.Any]) -> None:
+	"""Send an event like Confluence does."""
+	request = urllib.request.Request(
+		f'http://{address[0]}:{address[1]}/',
+		data=json.dumps(payload).encode(),
+		headers={'Content-Type': 'application/json'},
+	)
+
+	with urllib.request.urlopen(request) as response:
+		assert response.status == 204
+
+
+def wait_for(condition: tp.Callable[[], bool], timeout: float = 60) -> None:
+	deadline = time.monotonic() + timeout
+
+	while not condition():
+		assert time.monotonic() < deadline, 'Condition is not met in time'
+		time.sleep(0.1)
+
+
+def to_sync_config(confluence_config: config.ConfluenceConfig) -> sync.ConfluenceConfig:
+	return sync.ConfluenceConfig(
+		url=str(confluence_config.url),
+		username=confluence_config.username,
+		password=confluence_config.password,
+	)
+
+
+def test_webhook(
+	test_case: case.TestCase,
+	setup_and_clean_test_case: None,
+	src_confluence_config: config.ConfluenceConfig,
+	dst_confluence_config: config.ConfluenceConfig,
+	src_confluence_client: confluence.Confluence,
+	dst_confluence_client: confluence.Confluence,
+	tmp_path,
+):
+	src_space = test_case.src_confluence.spaces[0]
+	dst_space = test_case.dst_orig_confluence.spaces[0]
+	page_title = src_space.pages[0].name
+
+	syncer = sync.ConfluenceSynchronizer(to_sync_config(src_confluence_config), to_sync_config(dst_confluence_config))
+
+	with syncer:
+		session = InitialRunSession(
+			syncer.sync_page_hierarchy(
+				src_space=src_space.key,
+				src_title=page_title,
+				src_id=None,
+				dst_space=dst_space.key,
+				dst_title=None,
+				dst_id=None,
+			)
+		)
+
+		queue = webhook.WebhookQueue(tmp_path / 'queue.json', debounce=0.1)
+		receiver = webhook.WebhookReceiver(session, queue, port=0)
+
+		stop = threading.Event()
+		receiver_thread = threading.Thread(target=receiver.serve, args=(stop,))
+		receiver_thread.start()
+
+		try:
+			assert session.ran.wait(60), 'Initial run is not completed in time'
+
+			src_page = src_confluence_client.get_page_by_title(src_space.key, page_title, expand='body.storage')
+			new_body = src_page['body']['storage']['value'] + '<p>Changed</p>'
+			src_confluence_client.update_page(src_page['id'], page_title, new_body)
+
+			# Several events of the same page are synced once
+			for _ in range(3):
+				send_webhook(receiver.address, {'event': 'page_updated', 'page': {'id': int(src_page['id'])}})
+
+			wait_for(lambda: len(queue) == 0)
+		finally:
+			stop.set()
+			receiver_thread.join()
+
+	dst_page = dst_confluence_client.get_page_by_title(dst_space.key, page_title, expand='body.storage,version')
+	assert_page_content(dst_page['body']['storage']['value'], new_body)
+	assert dst_page['version']['number'] == 2, 'Page is updated more than once'
@@ -0,0 +1,50 @@
+import typing as tp
+
+import pytest
+
+from confluence_sync import sync
+from tests.unit.fakes import FakeConfluence, FakeServer, FakeSite
+
+
+@pytest.fixture
+def server() -> tp.Generator[FakeServer, None, None]:
+	with FakeServer() as server:
+		yield server
+
+
+@pytest.fixture
+def src_site() -> FakeSite:
+	site = FakeSite()
+	root_id = site.add_page('SRC', 'Root', site.add_space('SRC'), '<p>root</p>')
+
+	for i in range(3):
+		child_id = site.add_page('SRC', f'Child {i}', root_id, f'<p>child {i}</p>')
+		site.add_page('SRC', f'Grandchild {i}', child_id, f'<p>grandchild {i}</p>')
+		site.attachments[child_id][f'file{i}.txt'] = f'content {i}'.encode()
+
+	return site
+
+
+@pytest.fixture
+def dst_site() -> FakeSite:
+	site = FakeSite()
+	site.add_space('DST')
+
+	return site
+
+
+@pytest.fixture
+def fake_confluence(monkeypatch: pytest.MonkeyPatch, src_site: FakeSite, dst_site: FakeSite) -> None:
+	"""Make the synchronizer use the fake sites at http://src and http://dst."""
+	sites = {'http://src': src_site, 'http://dst': dst_site}
+	monkeypatch.setattr(sync, 'CustomConfluence', lambda url, **kwargs: FakeConfluence(sites[url]))
+
+
+@pytest.fixture
+def synchronizer(fake_confluence: None) -> tp.Generator[sync.ConfluenceSynchronizer, None, None]:
+	with sync.ConfluenceSynchronizer(
+		sync.ConfluenceConfig('http://src'),
+		sync.ConfluenceConfig('http://dst'),
+		max_workers=4,
+	) as synchronizer:
+		yield synchronizer
@@ -0,0 +1,279 @@
+import datetime as dt
+import http.server
+import itertools
+import json
+import threading
+import time
+import typing as tp
+import urllib.parse
+
+from atlassian import errors
+
+from confluence_sync.confluence import CustomConfluence, StrDict
+
+# Attachments are updated a minute after each other, sites share the clock like real instances do
+_EPOCH = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+_minutes = itertools.count(1)
+
+
+class Response(tp.NamedTuple):
+	status: int = 200
+	body: tp.Any = None
+	headers: dict[str, str] = {}
+
+
+class FakeServer:
+	"""Local HTTP server that answers requests with a handler and records them."""
+
+	def __init__(self) -> None:
+		# Request: path, query params, headers
+		self.requests: list[tuple[str, dict[str, str], dict[str, str]]] = []
+		self.delay = 0.0
+		self.handler: tp.Callable[[str, dict[str, str], dict[str, str]], Response] = (
+			lambda path, params, headers: Response(body={'path': path, 'params': params})
+		)
+
+		server = self
+
+		class _Handler(http.server.BaseHTTPRequestHandler):
+			def do_GET(self) -> None:
+				url = urllib.parse.urlsplit(self.path)
+				params = dict(urllib.parse.parse_qsl(url.query))
+				headers = dict(self.headers.items())
+
+				server.requests.append((url.path, params, headers))
+				time.sleep(server.delay)
+
+				response = server.handler(url.path, params, headers)
+				body = json.dumps(response.body).encode() if response.body is not None else b''
+
+				self.send_response(response.status)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(body)))
+
+				for name, value in response.headers.items():
+					self.send_header(name, value)
+
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args) -> None:
+				pass
+
+		self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+		self.url = f'http://127.0.0.1:{self._server.server_port}'
+
+	def __enter__(self) -> 'FakeServer':
+		threading.Thread(target=self._server.serve_forever, args=(0.01,), daemon=True).start()
+		return self
+
+	def __exit__(self, *args) -> None:
+		self._server.shutdown()
+		self._server.server_close()
+
+
+class FakeSite:
+	"""In-memory Confluence instance."""
+
+	def __init__(self) -> None:
+		self._ids = itertools.count(100)
+		self._lock = threading.RLock()
+
+		# page_id: page with the parent ID and the body
+		self.pages: dict[str, dict[str, tp.Any]] = {}
+		# space: homepage ID
+		self.homepage_ids: dict[str, str] = {}
+		# page_id: {title: content}
+		self.attachments: dict[str, dict[str, bytes]] = {}
+		# (page_id, title): minutes since the epoch of the fakes when the attachment was updated
+		self.attachment_times: dict[tuple[str, str], int] = {}
+
+		# IDs of the pages and of the containers of the attachments changed since the last poll
+		self.modified_page_ids: set[str] = set()
+		self.modified_attachment_page_ids: set[str] = set()
+
+	def add_space(self, space: str) -> str:
+		self.homepage_ids[space] = self.add_page(space, f'{space} Home', None)
+		return self.homepage_ids[space]
+
+	def add_page(self, space: str, title: str, parent_id: str | None, body: str = '') -> str:
+		with self._lock:
+			if self.search_by_title(space, title) is not None:
+				raise ValueError(f'A page with this title already exists, title: {title}')
+
+			page_id = str(next(self._ids))
+			self.pages[page_id] = {
+				'id': page_id,
+				'space': space,
+				'title': title,
+				'parent_id': parent_id,
+				'body': body,
+				'version': 1,
+			}
+			self.attachments[page_id] = {}
+
+			return page_id
+
+	def update_attachment(self, page_id: str, title: str, content: bytes) -> None:
+		self.attachments[page_id][title] = content
+		self.attachment_times[(page_id, title)] = next(_minutes)
+		self.modified_attachment_page_ids.add(page_id)
+
+	def is_descendant(self, page_id: str, ancestor_id: str) -> bool:
+		parent_id = self.pages[page_id]['parent_id']
+
+		while parent_id is not None:
+			if parent_id == ancestor_id:
+				return True
+
+			parent_id = self.pages[parent_id]['parent_id']
+
+		return False
+
+	def search_by_title(self, space: str, title: str) -> str | None:
+		with self._lock:
+			return next(
+				(page['id'] for page in self.pages.values() if page['space'] == space and page['title'] == title),
+				None,
+			)
+
+	def tree(self, page_id: str) -> dict[str, tp.Any]:
+		"""Get the titles of the page hierarchy with their bodies and attachments, children are sorted by title."""
+		page = self.pages[page_id]
+
+		return {
+			'title': page['title'],
+			'body': page['body'],
+			'attachments': self.attachments[page_id],
+			'children': sorted(
+				(self.tree(child_id) for child_id in self.child_ids(page_id)),
+				key=lambda child: child['title'],
+			),
+		}
+
+	def child_ids(self, page_id: str) -> list[str]:
+		with self._lock:
+			return [page['id'] for page in self.pages.values() if page['parent_id'] == page_id]
+
+	def render(self, page_id: str, expand: str | None = None) -> dict[str, tp.Any]:
+		page = self.pages[page_id]
+		expand = expand or ''
+		result = {
+			'id': page_id,
+			'type': 'page',
+			'title': page['title'],
+			'version': {'number': page['version']},
+			'space': {'key': page['space']},
+		}
+
+		if 'body.storage' in expand:
+			result['body'] = {'storage': {'value': page['body'], 'representation': 'storage'}}
+
+		if 'ancestors' in expand:
+			ancestors = []
+			parent_id = page['parent_id']
+
+			while parent_id is not None:
+				ancestors.insert(0, {'id': parent_id, 'type': 'page', 'title': self.pages[parent_id]['title']})
+				parent_id = self.pages[parent_id]['parent_id']
+
+			result['ancestors'] = ancestors
+
+		return result
+
+
+class FakeConfluence(CustomConfluence):
+	"""Client of an in-memory Confluence instance, it serves the requests a session makes."""
+
+	def __init__(self, site: FakeSite) -> None:
+		super().__init__(url='http://fake')
+		self.site = site
+
+	def get_space(self, space_key: str, *args, **kwargs) -> StrDict:
+		return {'key': space_key, 'homepage': {'id': self.site.homepage_ids[space_key]}}
+
+	def get_page_by_id(self, page_id: str, expand: str | None = None, *args, **kwargs) -> StrDict:
+		if page_id not in self.site.pages:
+			raise errors.ApiNotFoundError(f'No page, id: {page_id}')
+
+		return self.site.render(page_id, expand)
+
+	def get_page_by_title(self, space: str, title: str, *args, expand: str | None = None, **kwargs) -> StrDict | None:
+		page_id = self.site.search_by_title(space, title)
+
+		return self.site.render(page_id, expand) if page_id is not None else None
+
+	def get_page_child_by_type(self, page_id: str, *args, expand: str | None = None, **kwargs) -> list[StrDict]:
+		return [self.site.render(child_id, expand) for child_id in self.site.child_ids(page_id)]
+
+	def traverse_child_pages(self, page_id: str, expand: str | None = None, *args, **kwargs) -> tp.Iterator[StrDict]:
+		yield from self.get_page_child_by_type(page_id, expand=expand)
+
+	def create_page(self, space: str, title: str, body: str, parent_id: str | None = None, *args, **kwargs) -> StrDict:
+		return self.site.render(self.site.add_page(space, title, parent_id, body))
+
+	def update_page(
+		self,
+		page_id: str,
+		title: str,
+		body: str | None = None,
+		parent_id: str | None = None,
+		*args,
+		**kwargs,
+	) -> StrDict:
+		page = self.site.pages[page_id]
+		page['title'] = title
+		page['version'] += 1
+
+		if body is not None:
+			page['body'] = body
+		if parent_id is not None:
+			page['parent_id'] = parent_id
+
+		return self.site.render(page_id)
+
+	def move_page(self, space_key: str, page_id: str, target_id: str | None = None, *args, **kwargs) -> None:
+		self.site.pages[page_id]['parent_id'] = target_id
+
+	def get_modified_pages(self, page_id: str, minutes: int, expand: str | None = None) -> list[StrDict]:
+		return [
+			self.site.render(modified_page_id, expand)
+			for modified_page_id in sorted(self.site.modified_page_ids)
+			if modified_page_id == page_id or self.site.is_descendant(modified_page_id, page_id)
+		]
+
+	def get_modified_attachments(self, space: str, minutes: int, expand: str | None = None) -> list[StrDict]:
+		return [
+			{'container': {'id': page_id}}
+			for page_id in sorted(self.site.modified_attachment_page_ids)
+			if self.site.pages[page_id]['space'] == space
+		]
+
+	def traverse_page_attachments(self, page_id: str, *args, filename: str | None = None, **kwargs) -> list[StrDict]:
+		return [
+			{
+				'id': f'att-{page_id}-{title}',
+				'title': title,
+				'version': {'number': self._attachment_version(page_id, title), 'when': self._attachment_when(page_id, title)},
+				'history': {'lastUpdated': {'when': self._attachment_when(page_id, title)}},
+				'metadata': {'comment': None},
+				'extensions': {'fileSize': len(content)},
+				'_links': {'download': f'/download/{page_id}/{title}'},
+			}
+			for title, content in self.site.attachments[page_id].items()
+			if filename is None or title == filename
+		]
+
+	def _attachment_version(self, page_id: str, title: str) -> int:
+		return self.site.attachment_times.get((page_id, title), 0) + 1
+
+	def _attachment_when(self, page_id: str, title: str) -> str:
+		minutes = self.site.attachment_times.get((page_id, title), 0)
+		return (_EPOCH + dt.timedelta(minutes=minutes)).isoformat(timespec='milliseconds')
+
+	def attach_content(self, content: bytes, name: str, *args, page_id: str | None = None, **kwargs) -> None:
+		self.site.update_attachment(page_id, name, content)
+
+	def get(self, path: str, *args, **kwargs) -> bytes:
+		_, _, page_id, title = path.split('/', 3)
+		return self.site.attachments[page_id][title]
@@ -0,0 +1,109 @@
+import pathlib
+import threading
+import time
+
+import pytest
+
+from confluence_sync import bundle, scheduler, sync
+from tests.unit.fakes import FakeConfluence, FakeSite
+
+
+def test_bundle_confluence_builds_ancestors(
+	tmp_path: pathlib.Path,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+) -> None:
+	synchronizer.export_bundle(tmp_path, 'SRC', 'Root', None).run()
+	src_cli = bundle.BundleConfluence(tmp_path)
+
+	grandchild_id = src_site.search_by_title('SRC', 'Grandchild 1')
+	page = src_cli.get_page_by_id(grandchild_id, expand='ancestors,body.storage')
+
+	assert [ancestor['title'] for ancestor in page['ancestors']] == ['SRC Home', 'Root', 'Child 1']
+	assert page['body']['storage']['value'] == '<p>grandchild 1</p>'
+
+
+def test_export_import_resume(
+	tmp_path: pathlib.Path,
+	monkeypatch: pytest.MonkeyPatch,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	bundle_path = tmp_path / 'bundle'
+	journal_path = tmp_path / 'journal'
+	synchronizer.export_bundle(bundle_path, 'SRC', 'Root', None).run()
+
+	create_page = FakeConfluence.create_page
+
+	def _failing_create_page(self: FakeConfluence, space: str, title: str, *args, **kwargs) -> dict:
+		if title == 'Grandchild 2':
+			raise RuntimeError('Destination is unavailable')
+
+		return create_page(self, space, title, *args, **kwargs)
+
+	with monkeypatch.context() as m:
+		m.setattr(FakeConfluence, 'create_page', _failing_create_page)
+
+		with pytest.raises(Exception):
+			synchronizer.import_bundle(bundle_path, 'DST', None, None, journal_path=journal_path).run()
+
+	assert dst_site.search_by_title('DST', 'Grandchild 2') is None
+
+	synchronizer.import_bundle(bundle_path, 'DST', None, None, journal_path=journal_path, resume=True).run()
+
+	src_root_id = src_site.search_by_title('SRC', 'Root')
+	dst_root_id = dst_site.search_by_title('DST', 'Root')
+
+	assert dst_site.tree(dst_root_id) == src_site.tree(src_root_id)
+	assert len(dst_site.pages) == len(src_site.pages)
+
+
+def test_export_bounds_submitted_tasks(
+	tmp_path: pathlib.Path,
+	monkeypatch: pytest.MonkeyPatch,
+	src_site: FakeSite,
+) -> None:
+	root_id = src_site.search_by_title('SRC', 'Root')
+
+	for i in range(60):
+		src_site.add_page('SRC', f'Leaf {i}', root_id, f'<p>leaf {i}</p>')
+
+	export_page = bundle.BundleExporter._export_page
+	lock = threading.Lock()
+	running = []
+	max_running = []
+
+	def _export_page(self: bundle.BundleExporter, *args, **kwargs) -> None:
+		with lock:
+			running.append(1)
+			max_running.append(len(running))
+
+		time.sleep(0.001)
+		export_page(self, *args, **kwargs)
+
+		with lock:
+			running.pop()
+
+	monkeypatch.setattr(bundle.BundleExporter, '_export_page', _export_page)
+	executor = scheduler.PriorityExecutor(8)
+
+	try:
+		bundle.BundleExporter(
+			executor=executor,
+			src_cli=FakeConfluence(src_site),
+			path=tmp_path,
+			src_space='SRC',
+			src_title='Root',
+			max_tasks=2,
+		).run()
+	finally:
+		executor.shutdown()
+
+	src_cli = bundle.BundleConfluence(tmp_path)
+
+	assert max(max_running) <= 2
+	assert len(max_running) == 7 + 60
+	assert [page['title'] for page in src_cli.get_page_child_by_type(root_id)] == (
+		[f'Child {i}' for i in range(3)] + [f'Leaf {i}' for i in range(60)]
+	)
@@ -0,0 +1,38 @@
+from confluence_sync import cache
+
+
+def test_attachment_cache_evicts_empty_listings() -> None:
+	attachment_cache = cache.AttachmentCache(max_count=10)
+
+	for i in range(1000):
+		attachment_cache.add_listing(str(i), [])
+
+	assert len(attachment_cache._listings) == 5
+	assert attachment_cache.get_listing('999') == []
+	assert attachment_cache.get_listing('0') is None
+
+
+def test_attachment_cache_finds_listed_attachments_by_names() -> None:
+	attachment_cache = cache.AttachmentCache()
+	attachment_cache.add_listing('1', [{'title': 'diagram'}, {'title': 'diagram.png'}])
+
+	assert attachment_cache.get_by_names('1', ['diagram', 'other']) == ([{'title': 'diagram'}], [])
+	assert attachment_cache.get_by_names('2', ['diagram']) == ([], ['diagram'])
+
+
+def test_shared_reads_count_consumers() -> None:
+	shared_reads = cache.SharedReads(2)
+	readers = [shared_reads.reader() for _ in range(2)]
+	reads = []
+
+	def _read() -> str:
+		reads.append(1)
+		return 'value'
+
+	assert readers[0].get_or_read('key', _read) == 'value'
+	assert readers[0].get_or_read('key', _read) == 'value'
+	assert len(shared_reads) == 1
+
+	assert readers[1].get_or_read('key', _read) == 'value'
+	assert len(shared_reads) == 0
+	assert len(reads) == 1
@@ -0,0 +1,52 @@
+from concurrent import futures
+
+from confluence_sync import cache
+from confluence_sync.confluence import CustomConfluence
+from tests.unit.fakes import FakeServer
+
+
+def test_single_flight_shares_concurrent_reads(server: FakeServer) -> None:
+	server.delay = 0.2
+	cli = CustomConfluence(url=server.url, single_flight=True)
+
+	with futures.ThreadPoolExecutor(4) as executor:
+		responses = list(executor.map(lambda _: cli.get('rest/api/content/1'), range(4)))
+
+	assert len(server.requests) == 1
+	assert responses == [{'path': '/rest/api/content/1', 'params': {}}] * 4
+	assert cli.single_flight.shared_count == 3
+
+
+def _fan_out_clients(server: FakeServer, shared_reads: cache.SharedReads) -> list[CustomConfluence]:
+	"""Source clients of two destination sessions."""
+	return [
+		CustomConfluence(url=server.url, shared_reads=shared_reads.reader(), single_flight=True)
+		for _ in range(2)
+	]
+
+
+def test_fan_out_releases_shared_reads(server: FakeServer) -> None:
+	server.delay = 0.2
+	shared_reads = cache.SharedReads(2, sizeof=lambda response: len(response.content))
+	clis = _fan_out_clients(server, shared_reads)
+
+	with futures.ThreadPoolExecutor(2) as executor:
+		responses = list(executor.map(lambda cli: cli.get('rest/api/content/1'), clis))
+
+	assert len(server.requests) == 1
+	assert responses[0] == responses[1]
+	assert len(shared_reads) == 0
+
+
+def test_fan_out_keeps_shared_reads_for_other_sessions(server: FakeServer) -> None:
+	shared_reads = cache.SharedReads(2, sizeof=lambda response: len(response.content))
+	clis = _fan_out_clients(server, shared_reads)
+
+	clis[0].get('rest/api/content/1')
+	# A session reading again doesn't take the share of the other session
+	clis[0].get('rest/api/content/1')
+	assert len(shared_reads) == 1
+
+	clis[1].get('rest/api/content/1')
+	assert len(server.requests) == 1
+	assert len(shared_reads) == 0
@@ -0,0 +1,72 @@
+import pytest
+from lxml import etree
+
+from confluence_sync import cache, document
+
+
+def test_shared_trees_are_parsed_once(monkeypatch: pytest.MonkeyPatch) -> None:
+	parsed_bodies = []
+	parse = document._parser.parse
+
+	def _parse(body: str) -> etree._Element:
+		parsed_bodies.append(body)
+		return parse(body)
+
+	monkeypatch.setattr(document._parser, 'parse', _parse)
+
+	shared_trees = cache.SharedReads(2, sizeof=document.shared_tree_size)
+	stores = [document.DocumentStore(shared_trees=shared_trees.reader()) for _ in range(2)]
+	body = '<p>body</p>'
+
+	first_root = stores[0].get_or_create('1', body).root
+
+	assert len(shared_trees) == 1
+
+	second_root = stores[1].get_or_create('1', body).root
+
+	assert parsed_bodies == [body]
+	# Every store gets its own copy, since formatting changes the tree
+	assert first_root is not second_root
+	assert etree.tostring(first_root) == etree.tostring(second_root)
+	# The tree is released once every store has read it
+	assert len(shared_trees) == 0
+
+
+def test_shared_trees_of_changed_bodies() -> None:
+	shared_trees = cache.SharedReads(2, sizeof=document.shared_tree_size)
+	store = document.DocumentStore(shared_trees=shared_trees.reader())
+
+	first_document = store.get_or_create('1', '<p>first</p>')
+	second_document = store.get_or_create('1', '<p>second</p>')
+
+	assert document._parser.to_storage(first_document.root) == '<p>first</p>'
+	assert document._parser.to_storage(second_document.root) == '<p>second</p>'
+
+
+def test_document_store_reuses_kept_document() -> None:
+	store = document.DocumentStore()
+	page_document = store.get_or_create('1', '<p>body</p>')
+	store.keep(page_document)
+
+	assert store.get_or_create('1', '<p>body</p>') is page_document
+	assert store.get_or_create('1', '<p>changed</p>') is not page_document
+
+	store.discard('1')
+
+	assert store.get('1') is None
+
+
+def test_document_store_doesnt_reuse_formatted_document() -> None:
+	store = document.DocumentStore()
+	page_document = store.get_or_create('1', '<p>body</p>')
+	page_document.root.append(etree.Element('p'))
+	page_document.set_formatted()
+	store.keep(page_document)
+
+	new_document = store.get_or_create('1', '<p>body</p>')
+
+	assert new_document is not page_document
+	assert not new_document.formatted
+	assert document._parser.to_storage(new_document.root) == '<p>body</p>'
+	# The formatted document is kept until the new one replaces it
+	assert store.get('1') is page_document
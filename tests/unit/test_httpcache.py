@@ -0,0 +1,198 @@
+import os
+import pathlib
+import typing as tp
+
+import pytest
+
+from confluence_sync import httpcache
+from confluence_sync.confluence import CustomConfluence
+from tests.unit.fakes import FakeServer, Response
+
+
+@pytest.fixture
+def http_cache(tmp_path: pathlib.Path) -> tp.Generator[httpcache.HttpCache, None, None]:
+	http_cache = httpcache.HttpCache(tmp_path / 'cache.sqlite')
+	yield http_cache
+	http_cache.close()
+
+
+@pytest.fixture
+def cli(server: FakeServer, http_cache: httpcache.HttpCache) -> CustomConfluence:
+	return CustomConfluence(url=server.url, http_cache=http_cache)
+
+
+def test_put_and_get(http_cache: httpcache.HttpCache) -> None:
+	response = httpcache.CachedResponse(b'{"a": 1}', 'application/json', etag='"v1"')
+	http_cache.put('key', response)
+
+	assert http_cache.get('key') == response
+	assert http_cache.get('other') is None
+
+	http_cache.use('key')
+
+	assert http_cache.hits == 1
+
+
+def test_responses_are_kept_between_runs(tmp_path: pathlib.Path) -> None:
+	http_cache = httpcache.HttpCache(tmp_path / 'cache.sqlite')
+	http_cache.put('key', httpcache.CachedResponse(b'content', fingerprint='versions'))
+	http_cache.close()
+
+	http_cache = httpcache.HttpCache(tmp_path / 'cache.sqlite')
+
+	assert http_cache.get('key') == httpcache.CachedResponse(b'content', fingerprint='versions')
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path: pathlib.Path) -> None:
+	# Random contents aren't compressed, so 17 responses fit the cache
+	http_cache = httpcache.HttpCache(tmp_path / 'cache.sqlite', max_size=16 * 120)
+
+	for i in range(17):
+		http_cache.put(f'key{i}', httpcache.CachedResponse(os.urandom(100)))
+
+	http_cache.use('key0')
+	http_cache.put('key17', httpcache.CachedResponse(os.urandom(100)))
+
+	assert http_cache.get('key0') is not None
+	assert http_cache.get('key1') is None
+	assert all(http_cache.get(f'key{i}') is not None for i in range(2, 18))
+
+
+def test_large_response_isnt_cached(tmp_path: pathlib.Path) -> None:
+	http_cache = httpcache.HttpCache(tmp_path / 'cache.sqlite', max_size=16 * 120)
+	http_cache.put('key', httpcache.CachedResponse(os.urandom(100)))
+	http_cache.put('key', httpcache.CachedResponse(os.urandom(200)))
+
+	# The older response of the key isn't kept either
+	assert http_cache.get('key') is None
+
+
+def test_etag_revalidation(server: FakeServer, cli: CustomConfluence, http_cache: httpcache.HttpCache) -> None:
+	etag = '"v1"'
+
+	def _handler(path: str, params: dict[str, str], headers: dict[str, str]) -> Response:
+		if headers.get('If-None-Match') == etag:
+			return Response(304, headers={'ETag': etag})
+
+		return Response(body={'etag': etag}, headers={'ETag': etag})
+
+	server.handler = _handler
+
+	assert cli.get('rest/api/space') == {'etag': '"v1"'}
+	assert cli.get('rest/api/space') == {'etag': '"v1"'}
+	assert server.requests[1][2]['If-None-Match'] == '"v1"'
+	assert (http_cache.hits, http_cache.misses) == (1, 1)
+
+	etag = '"v2"'
+
+	assert cli.get('rest/api/space') == {'etag': '"v2"'}
+	assert (http_cache.hits, http_cache.misses) == (1, 2)
+
+
+def test_last_modified_revalidation(server: FakeServer, cli: CustomConfluence, http_cache: httpcache.HttpCache) -> None:
+	last_modified = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+	def _handler(path: str, params: dict[str, str], headers: dict[str, str]) -> Response:
+		if headers.get('If-Modified-Since') == last_modified:
+			return Response(304)
+
+		return Response(body={'a': 1}, headers={'Last-Modified': last_modified})
+
+	server.handler = _handler
+
+	assert cli.get('rest/api/space') == {'a': 1}
+	assert cli.get('rest/api/space') == {'a': 1}
+	assert server.requests[1][2]['If-Modified-Since'] == last_modified
+	assert http_cache.hits == 1
+
+
+def test_response_without_validators_isnt_cached(
+	server: FakeServer,
+	cli: CustomConfluence,
+	http_cache: httpcache.HttpCache,
+) -> None:
+	cli.get('rest/api/space')
+	cli.get('rest/api/space')
+
+	assert len(server.requests) == 2
+	assert 'If-None-Match' not in server.requests[1][2]
+	assert (http_cache.hits, http_cache.misses) == (0, 2)
+
+
+def test_failed_fetch_is_counted_as_miss(
+	server: FakeServer,
+	cli: CustomConfluence,
+	http_cache: httpcache.HttpCache,
+) -> None:
+	server.handler = lambda path, params, headers: Response(404, body={'message': 'Not found'})
+
+	with pytest.raises(Exception):
+		cli.get('rest/api/content/1', params={'expand': 'body.storage'})
+
+	assert (http_cache.hits, http_cache.misses) == (0, 1)
+
+
+def test_content_revalidated_by_versions(
+	server: FakeServer,
+	cli: CustomConfluence,
+	http_cache: httpcache.HttpCache,
+) -> None:
+	version = 1
+
+	def _handler(path: str, params: dict[str, str], headers: dict[str, str]) -> Response:
+		page = {'id': '1', 'version': {'number': version}}
+
+		if 'body.storage' in params['expand'].split(','):
+			page['body'] = {'storage': {'value': f'<p>version {version}</p>'}}
+
+		return Response(body=page)
+
+	server.handler = _handler
+	expand = {'expand': 'body.storage'}
+
+	page = cli.get('rest/api/content/1', params=expand)
+
+	assert page['body']['storage']['value'] == '<p>version 1</p>'
+	# Versions are requested along with the content
+	assert server.requests[0][1] == {'expand': 'body.storage,version'}
+
+	assert cli.get('rest/api/content/1', params=expand) == page
+	# The cached response is checked by a request of its versions only
+	assert server.requests[1][1] == {'expand': 'version'}
+	assert (http_cache.hits, http_cache.misses) == (1, 1)
+
+	version = 2
+	page = cli.get('rest/api/content/1', params=expand)
+
+	assert page['body']['storage']['value'] == '<p>version 2</p>'
+	assert [request[1]['expand'] for request in server.requests[2:]] == ['version', 'body.storage,version']
+	assert (http_cache.hits, http_cache.misses) == (1, 2)
+
+	assert cli.get('rest/api/content/1', params=expand) == page
+	assert http_cache.hits == 2
+
+
+def test_fingerprint() -> None:
+	page = {'id': '1', 'version': {'number': 2}}
+	pages = {'results': [page], 'start': 0, 'size': 1, '_links': {'next': '/rest/api/content?start=1'}}
+
+	assert CustomConfluence._get_fingerprint(page) is not None
+	assert CustomConfluence._get_fingerprint(page) != CustomConfluence._get_fingerprint(
+		{'id': '1', 'version': {'number': 3}}
+	)
+	assert CustomConfluence._get_fingerprint(pages) != CustomConfluence._get_fingerprint({**pages, '_links': {}})
+	# Content without versions can't be checked
+	assert CustomConfluence._get_fingerprint({'id': '1'}) is None
+	assert CustomConfluence._get_fingerprint({'results': [{'id': '1'}]}) is None
+	assert CustomConfluence._get_fingerprint([page]) is None
+
+
+def test_none_params_arent_sent(server: FakeServer, cli: CustomConfluence, http_cache: httpcache.HttpCache) -> None:
+	server.handler = lambda path, params, headers: Response(body=params, headers={'ETag': '"v1"'})
+
+	assert cli.get('rest/api/space', params={'limit': None, 'start': 0}) == {'start': '0'}
+
+	# The request is the same as the one without the parameter set to None
+	cli.get('rest/api/space', params={'start': 0})
+
+	assert server.requests[1][2]['If-None-Match'] == '"v1"'
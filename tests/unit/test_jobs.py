@@ -0,0 +1,130 @@
+import json
+import pathlib
+import typing as tp
+
+import pytest
+
+from confluence_sync import jobs, sync
+
+
+def _write_jobs(tmp_path: pathlib.Path, data: tp.Any) -> pathlib.Path:
+	path = tmp_path / 'jobs.json'
+	path.write_text(json.dumps(data), encoding='utf-8')
+
+	return path
+
+
+def test_load_jobs(tmp_path: pathlib.Path) -> None:
+	path = _write_jobs(
+		tmp_path,
+		{
+			'jobs': [
+				{'source_id': 1, 'dest_space': 'DST', 'dest_title': 'Docs'},
+				{
+					'name': 'fan out',
+					'source_space': 'SRC',
+					'source_title': 'Root',
+					'destinations': [{'url': 'http://dst2', 'basic': 'user:pass:word', 'id': 2}],
+				},
+			],
+		},
+	)
+
+	assert jobs.load_jobs(path) == [
+		sync.SyncJob(src_id='1', dst_space='DST', dst_title='Docs'),
+		sync.SyncJob(
+			src_space='SRC',
+			src_title='Root',
+			destinations=(
+				sync.DestinationConfig(sync.ConfluenceConfig('http://dst2', 'user', 'pass:word'), id='2'),
+			),
+			name='fan out',
+		),
+	]
+
+
+def test_load_jobs_applies_defaults_unless_overridden(tmp_path: pathlib.Path) -> None:
+	path = _write_jobs(
+		tmp_path,
+		[
+			{'source_id': '1', 'dest_id': '2'},
+			{'source_id': '3', 'dest_id': '4', 'sync_out_hierarchy': False, 'start_title_with': 'Job '},
+		],
+	)
+	defaults = {'sync_out_hierarchy': True, 'replace_title_substr': ['old', 'new'], 'start_title_with': 'Copy '}
+
+	first_job, second_job = jobs.load_jobs(path, defaults)
+
+	assert (first_job.sync_out_hierarchy, first_job.start_title_with) == (True, 'Copy ')
+	assert (second_job.sync_out_hierarchy, second_job.start_title_with) == (False, 'Job ')
+	assert first_job.replace_title_substr == second_job.replace_title_substr == ('old', 'new')
+
+
+@pytest.mark.parametrize(
+	('data', 'message'),
+	[
+		({'source': 1}, 'Job file must contain a list of jobs'),
+		(['job'], 'job 1: must be an object'),
+		([{'source_id': '1', 'dest_id': '2', 'dst_id': '3'}], 'job 1: unknown keys dst_id'),
+		([{'dest_id': '2'}], 'job 1: one of source_id or (source_space and source_title) is required'),
+		([{'source_id': '1'}], 'job 1: one of dest_id or (dest_space and dest_title) is required'),
+		(
+			[{'source_id': '1', 'source_space': 'SRC', 'dest_id': '2'}],
+			'job 1: source_id is not allowed with source_space and source_title',
+		),
+		([{'source_space': 'SRC', 'dest_id': '2'}], 'job 1: source_space must be passed with source_title'),
+		([{'source_id': '1', 'dest_id': '2', 'sync_out_hierarchy': 'no'}], 'job 1: sync_out_hierarchy has a wrong type'),
+		([{'source_id': True, 'dest_id': '2'}], 'job 1: source_id has a wrong type'),
+		([{'source_id': '1', 'dest_id': '2', 'source_title': None, 'name': 1}], 'job 1: name has a wrong type'),
+		(
+			[{'source_id': '1', 'dest_id': '2', 'replace_title_substr': ['old']}],
+			'job 1: replace_title_substr must contain the old and the new value',
+		),
+		(
+			[{'source_id': '1', 'dest_id': '2', 'replace_title_substr': 'ab'}],
+			'job 1: replace_title_substr has a wrong type',
+		),
+		([{'source_id': '1', 'destinations': ['http://dst2']}], 'job 1: destinations must be objects with the url'),
+		(
+			[{'source_id': '1', 'destinations': [{'url': 'http://dst2', 'token': 't', 'id': '2', 'key': 1}]}],
+			'job 1: unknown destination keys key',
+		),
+		(
+			[{'source_id': '1', 'destinations': [{'url': 'http://dst2', 'id': '2'}]}],
+			'job 1: one of the destination basic or token is required',
+		),
+		(
+			[{'source_id': '1', 'destinations': [{'url': 'http://dst2', 'token': 't'}]}],
+			'job 1: one of destination_id or (destination_space and destination_title) is required',
+		),
+		(
+			[{'source_id': '1', 'destinations': [{'url': 'http://dst2', 'token': 1, 'id': '2'}]}],
+			'job 1: destination token has a wrong type',
+		),
+		(
+			[{'source_id': '1', 'dest_id': '2'}, {'source_id': '3', 'dest_space': 'DST'}],
+			'job 2: dest_space must be passed with dest_title',
+		),
+	],
+)
+def test_load_jobs_rejects_invalid_jobs(tmp_path: pathlib.Path, data: tp.Any, message: str) -> None:
+	with pytest.raises(ValueError) as exc_info:
+		jobs.load_jobs(_write_jobs(tmp_path, data))
+
+	assert str(exc_info.value) == message
+
+
+def test_load_jobs_rejects_invalid_defaults(tmp_path: pathlib.Path) -> None:
+	path = _write_jobs(tmp_path, [{'source_id': '1', 'dest_id': '2'}])
+
+	with pytest.raises(ValueError, match='job 1: start_title_with has a wrong type'):
+		jobs.load_jobs(path, {'start_title_with': 1})
+
+
+def test_load_yaml_jobs(tmp_path: pathlib.Path) -> None:
+	pytest.importorskip('yaml')
+
+	path = tmp_path / 'jobs.yaml'
+	path.write_text('- source_id: 1\n  dest_id: 2\n', encoding='utf-8')
+
+	assert jobs.load_jobs(path) == [sync.SyncJob(src_id='1', dst_id='2')]
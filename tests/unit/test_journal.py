@@ -0,0 +1,156 @@
+import datetime as dt
+import logging
+import pathlib
+
+import pytest
+
+from confluence_sync import cli, context, journal, sync
+from tests.unit.fakes import FakeSite
+
+
+def _write_journal(path: pathlib.Path) -> None:
+	page_index = context.PageIndex()
+	page_index.add_page(context.Page('1', 'SP', 'Root'))
+	page_index.add_page(context.Page('2', 'SP', 'Страница', src_parent_id='1'))
+
+	run_journal = journal.Journal(path)
+	run_journal.write_header({'src_id': '1'})
+	run_journal.write_index(page_index)
+	run_journal.write_page(context.Page('1', 'SP', 'Root', dst_id='10'), [])
+	run_journal.write_page(context.Page('2', 'SP', 'Страница', dst_id='20', src_parent_id='1'), [('m1', '3', 'diagram')])
+	run_journal.write_links([('OTHER', 'Linked')])
+	run_journal.write_drawio_sources({'3': '30'}, [('2', 'm1', '3', 'diagram')])
+	run_journal.write_drawio_fixed('2')
+	run_journal.close()
+
+
+def test_load(tmp_path: pathlib.Path) -> None:
+	_write_journal(tmp_path / 'journal')
+	state = journal.Journal(tmp_path / 'journal', resume=True).state
+
+	assert state == journal.JournalState(
+		header={'src_id': '1'},
+		index=[('1', 'SP', 'Root', None), ('2', 'SP', 'Страница', '1')],
+		pages={
+			'1': context.Page('1', 'SP', 'Root', dst_id='10'),
+			'2': context.Page('2', 'SP', 'Страница', dst_id='20', src_parent_id='1'),
+		},
+		delayed_pages={'2': [('m1', '3', 'diagram')]},
+		links={('OTHER', 'Linked')},
+		drawio_replacements={'3': '30'},
+		drawio_new_sources=[('2', 'm1', '3', 'diagram')],
+		fixed_drawio_page_ids={'2'},
+	)
+
+
+def test_resume_appends(tmp_path: pathlib.Path) -> None:
+	_write_journal(tmp_path / 'journal')
+
+	run_journal = journal.Journal(tmp_path / 'journal', resume=True)
+	assert run_journal.resumed
+
+	run_journal.write_page(context.Page('4', 'SP', 'New', dst_id='40', src_parent_id='1'), [])
+	run_journal.close()
+
+	state = journal.Journal(tmp_path / 'journal', resume=True).state
+
+	assert set(state.pages) == {'1', '2', '4'}
+
+
+def test_start_over(tmp_path: pathlib.Path) -> None:
+	_write_journal(tmp_path / 'journal')
+
+	run_journal = journal.Journal(tmp_path / 'journal')
+	run_journal.close()
+
+	assert not journal.Journal(tmp_path / 'journal', resume=True).resumed
+
+
+def test_missing_journal_isnt_resumed(tmp_path: pathlib.Path) -> None:
+	run_journal = journal.Journal(tmp_path / 'journal', resume=True)
+
+	assert not run_journal.resumed
+	assert run_journal.state == journal.JournalState()
+
+
+@pytest.mark.parametrize('cut', [1, 10, 40])
+def test_truncated_record(caplog: pytest.LogCaptureFixture, tmp_path: pathlib.Path, cut: int) -> None:
+	path = tmp_path / 'journal'
+	_write_journal(path)
+
+	# The run has died while writing the record of the second page, in the middle of its title
+	data = path.read_bytes()
+	page_record_end = data.index('Страница'.encode(), data.index(b'"type": "page", "page": {"src_id": "2"')) + 3
+	path.write_bytes(data[:page_record_end - cut])
+
+	with caplog.at_level(logging.WARNING, logger='confluence-sync'):
+		run_journal = journal.Journal(path, resume=True)
+
+	assert 'Skip broken journal record' in caplog.messages
+	assert set(run_journal.state.pages) == {'1'}
+
+	# Records of the resumed run aren't joined to the broken one
+	run_journal.write_page(context.Page('2', 'SP', 'Страница', dst_id='20', src_parent_id='1'), [])
+	run_journal.close()
+
+	assert set(journal.Journal(path, resume=True).state.pages) == {'1', '2'}
+
+
+def _sync(synchronizer: sync.ConfluenceSynchronizer, **kwargs) -> sync._ConfluenceSynchronizerSession:
+	return synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None, **kwargs)
+
+
+def test_deadline_and_resume(
+	tmp_path: pathlib.Path,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	journal_path = tmp_path / 'journal'
+
+	with pytest.raises(sync.DeadlineReached):
+		_sync(synchronizer, journal_path=journal_path, deadline=dt.datetime.now(dt.timezone.utc)).run()
+
+	assert len(dst_site.pages) < len(src_site.pages)
+
+	_sync(synchronizer, journal_path=journal_path, resume=True).run()
+
+	src_root_id = src_site.search_by_title('SRC', 'Root')
+	dst_root_id = dst_site.search_by_title('DST', 'Root')
+
+	assert dst_site.tree(dst_root_id) == src_site.tree(src_root_id)
+
+
+def test_resume_other_sync_fails(tmp_path: pathlib.Path, synchronizer: sync.ConfluenceSynchronizer) -> None:
+	journal_path = tmp_path / 'journal'
+	_sync(synchronizer, journal_path=journal_path).run()
+
+	with pytest.raises(ValueError):
+		synchronizer.sync_page_hierarchy(
+			'SRC', 'Child 1', None, 'DST', None, None, journal_path=journal_path, resume=True,
+		).run()
+
+
+def test_cli_deadline_exit_status(
+	capsys: pytest.CaptureFixture,
+	tmp_path: pathlib.Path,
+	fake_confluence: None,
+) -> None:
+	args = cli.parser.parse_args([
+		'--source-url', 'http://src',
+		'--source-token', 'token',
+		'--source-space', 'SRC',
+		'--source-title', 'Root',
+		'--dest-url', 'http://dst',
+		'--dest-token', 'token',
+		'--dest-space', 'DST',
+		'--dest-title', 'DST Home',
+		'--journal', str(tmp_path / 'journal'),
+		'--deadline', '0s',
+	])
+
+	with pytest.raises(SystemExit) as exc_info:
+		args.func(args)
+
+	assert exc_info.value.code == 3
+	assert 'the run can be continued with --resume' in capsys.readouterr().err
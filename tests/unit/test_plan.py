@@ -0,0 +1,75 @@
+import logging
+import pathlib
+
+import pytest
+
+from confluence_sync import plan, sync
+from tests.unit.fakes import FakeConfluence, FakeSite
+
+
+def _sync(synchronizer: sync.ConfluenceSynchronizer, **kwargs) -> sync._ConfluenceSynchronizerSession:
+	return synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None, **kwargs)
+
+
+def test_plan_round_trip(tmp_path: pathlib.Path, synchronizer: sync.ConfluenceSynchronizer) -> None:
+	sync_plan = _sync(synchronizer).make_plan()
+	sync_plan.save(tmp_path / 'plan.json')
+
+	assert plan.Plan.load(tmp_path / 'plan.json') == sync_plan
+	assert sync_plan.cost().creates == 7
+	assert all(page.body_hash is not None for page in sync_plan.pages.values())
+
+
+def test_apply_plan_updates_kept_page_changed_since_plan(
+	caplog: pytest.LogCaptureFixture,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	_sync(synchronizer).run()
+	sync_plan = _sync(synchronizer).make_plan()
+
+	assert sync_plan.cost().unchanged == 7
+
+	src_site.pages[src_site.search_by_title('SRC', 'Child 1')]['body'] = '<p>changed</p>'
+
+	with caplog.at_level(logging.WARNING, logger='confluence-sync'):
+		_sync(synchronizer, sync_plan=sync_plan).run()
+
+	dst_page = dst_site.pages[dst_site.search_by_title('DST', 'Child 1')]
+
+	assert dst_page['body'] == '<p>changed</p>'
+	assert dst_page['version'] == 2
+	assert 'Page is changed since the plan, it is updated, "Child 1"' in caplog.messages
+	assert all(
+		page['version'] == 1 for page in dst_site.pages.values() if page['title'] != 'Child 1'
+	)
+
+
+def test_plan_looks_up_destination_pages_without_bodies(
+	monkeypatch: pytest.MonkeyPatch,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	_sync(synchronizer).run()
+	dst_site.pages[dst_site.search_by_title('DST', 'Child 1')]['body'] = '<p>edited</p>'
+	dst_site.pages[dst_site.search_by_title('DST', 'Child 2')]['parent_id'] = dst_site.search_by_title('DST', 'Child 0')
+
+	get_page_by_title = FakeConfluence.get_page_by_title
+	expands = []
+
+	def _get_page_by_title(self: FakeConfluence, *args, expand: str | None = None, **kwargs) -> dict | None:
+		if self.site is dst_site:
+			expands.append(expand)
+
+		return get_page_by_title(self, *args, expand=expand, **kwargs)
+
+	monkeypatch.setattr(FakeConfluence, 'get_page_by_title', _get_page_by_title)
+	sync_plan = _sync(synchronizer).make_plan()
+	actions = {src_site.pages[page.src_id]['title']: page.action for page in sync_plan.pages.values()}
+
+	assert expands and not any('body' in (expand or '') for expand in expands)
+	assert actions['Child 1'] == plan.UPDATE
+	assert actions['Child 2'] == plan.MOVE
+	assert sync_plan.cost().unchanged == 5
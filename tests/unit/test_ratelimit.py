@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from confluence_sync import ratelimit
+
+
+class FakeClock:
+	"""Clock that moves only when it is slept on or moved."""
+
+	def __init__(self) -> None:
+		self.now = 0.0
+		self.sleeps: list[float] = []
+
+	def __call__(self) -> float:
+		return self.now
+
+	def sleep(self, seconds: float) -> None:
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+	return FakeClock()
+
+
+def test_bucket_starts_full(clock: FakeClock) -> None:
+	bucket = ratelimit.TokenBucket(10, clock=clock)
+
+	assert [bucket.reserve(1) for _ in range(10)] == [0.0] * 10
+	assert bucket.reserve(1) == pytest.approx(0.1)
+
+
+def test_bucket_refill_rate(clock: FakeClock) -> None:
+	bucket = ratelimit.TokenBucket(10, clock=clock)
+	bucket.reserve(10)
+
+	clock.now += 0.5
+
+	assert [bucket.reserve(1) for _ in range(5)] == [0.0] * 5
+	assert bucket.reserve(1) == pytest.approx(0.1)
+
+
+def test_bucket_burst_cap(clock: FakeClock) -> None:
+	bucket = ratelimit.TokenBucket(10, capacity=5, clock=clock)
+
+	# Tokens aren't added over the capacity however long the bucket is idle
+	clock.now += 100
+
+	assert [bucket.reserve(1) for _ in range(5)] == [0.0] * 5
+	assert bucket.reserve(1) == pytest.approx(0.1)
+
+
+def test_bucket_debt(clock: FakeClock) -> None:
+	bucket = ratelimit.TokenBucket(100, clock=clock)
+
+	# A take bigger than the capacity doesn't wait, the next takes wait for the debt
+	assert bucket.reserve(300) == pytest.approx(2.0)
+	assert bucket.reserve(0) == pytest.approx(2.0)
+
+	clock.now += 1.5
+
+	assert bucket.reserve(0) == pytest.approx(0.5)
+
+
+def test_bucket_invalid_rate() -> None:
+	with pytest.raises(ValueError):
+		ratelimit.TokenBucket(0)
+
+
+def test_limiter_waits_for_request_tokens(clock: FakeClock) -> None:
+	limiter = ratelimit.RateLimiter(ratelimit.RateLimit(requests_per_second=2), clock=clock, sleep=clock.sleep)
+
+	for _ in range(6):
+		limiter.acquire()
+
+	# Two requests of the burst are sent at once, the others are sent at the rate
+	assert clock.sleeps == pytest.approx([0.5, 0.5, 0.5, 0.5])
+	assert limiter.stats.waits == 4
+	assert limiter.stats.wait_time == pytest.approx(2.0)
+
+
+def test_limiter_waits_for_bytes(clock: FakeClock) -> None:
+	limiter = ratelimit.RateLimiter(ratelimit.RateLimit(bytes_per_second=1000), clock=clock, sleep=clock.sleep)
+
+	limiter.acquire()
+	limiter.add_bytes(3000)
+	limiter.acquire()
+
+	assert clock.sleeps == pytest.approx([2.0])
+
+	limiter.acquire()
+
+	assert clock.sleeps == pytest.approx([2.0])
+
+
+def test_limiter_without_limits_doesnt_wait(clock: FakeClock) -> None:
+	limiter = ratelimit.RateLimiter(ratelimit.RateLimit(), clock=clock, sleep=clock.sleep)
+
+	for _ in range(100):
+		limiter.acquire()
+		limiter.add_bytes(10 ** 9)
+
+	assert clock.sleeps == []
+	assert not ratelimit.RateLimit()
+	assert ratelimit.RateLimit(bytes_per_second=1)
+
+
+def test_limiter_blocks_acquire() -> None:
+	# The clock is frozen, so the waits don't depend on how fast the threads start
+	limiter = ratelimit.RateLimiter(ratelimit.RateLimit(requests_per_second=20), clock=lambda: 0.0)
+	threads = [threading.Thread(target=limiter.acquire) for _ in range(25)]
+	started_at = time.monotonic()
+
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	# 20 requests of the burst are sent at once, the other 5 wait for 0.05 seconds each in turn
+	assert time.monotonic() - started_at >= 0.25
+	assert limiter.stats.waits == 5
+	assert limiter.stats.wait_time == pytest.approx(0.05 + 0.1 + 0.15 + 0.2 + 0.25)
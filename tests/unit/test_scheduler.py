@@ -0,0 +1,181 @@
+import threading
+import typing as tp
+from concurrent import futures
+
+import pytest
+
+from confluence_sync import scheduler
+
+_TIMEOUT = 5
+
+
+class _Blocker:
+	"""Task that runs until it is released."""
+
+	def __init__(self) -> None:
+		self.started = threading.Event()
+		self._released = threading.Event()
+
+	def __call__(self) -> None:
+		self.started.set()
+		assert self._released.wait(_TIMEOUT)
+
+	def release(self) -> None:
+		self._released.set()
+
+
+@pytest.fixture
+def executor() -> tp.Generator[scheduler.PriorityExecutor, None, None]:
+	executor = scheduler.PriorityExecutor(2)
+	yield executor
+	executor.shutdown(cancel_futures=True)
+
+
+def _start(submit: tp.Callable[..., futures.Future]) -> tuple[_Blocker, futures.Future]:
+	blocker = _Blocker()
+	ft = submit(blocker)
+	assert blocker.started.wait(_TIMEOUT)
+
+	return blocker, ft
+
+
+def test_urgent_work_runs_first() -> None:
+	executor = scheduler.PriorityExecutor(1)
+	order = []
+
+	blocker, _ = _start(executor.submit)
+	executor.submit(order.append, 'normal 1')
+	executor.submit_work(scheduler.URGENT, order.append, 'urgent')
+	executor.submit(order.append, 'normal 2')
+	blocker.release()
+	executor.shutdown()
+
+	assert order == ['urgent', 'normal 1', 'normal 2']
+
+
+def test_work_runs_before_transfers_over_their_share(executor: scheduler.PriorityExecutor) -> None:
+	order = []
+
+	# One of two workers is the share of transfers while there is work waiting
+	transfer_blocker, _ = _start(lambda fn: executor.submit_transfer(1, fn))
+	work_blocker, _ = _start(executor.submit)
+
+	executor.submit_transfer(1, order.append, 'transfer 1')
+	executor.submit_transfer(1, order.append, 'transfer 2')
+	executor.submit(order.append, 'work 1')
+	work_ft = executor.submit(order.append, 'work 2')
+	work_blocker.release()
+	work_ft.result(_TIMEOUT)
+
+	last_ft = executor.submit_transfer(1, order.append, 'transfer 3')
+	transfer_blocker.release()
+	last_ft.result(_TIMEOUT)
+
+	assert order[:2] == ['work 1', 'work 2']
+	# The transfers run on both workers now, so they may be completed in any order
+	assert sorted(order[2:]) == ['transfer 1', 'transfer 2', 'transfer 3']
+
+
+def test_transfers_use_free_workers_without_work(executor: scheduler.PriorityExecutor) -> None:
+	first_blocker, _ = _start(lambda fn: executor.submit_transfer(1, fn))
+	second_blocker, _ = _start(lambda fn: executor.submit_transfer(1, fn))
+
+	first_blocker.release()
+	second_blocker.release()
+
+
+def test_large_transfers_are_capped() -> None:
+	executor = scheduler.PriorityExecutor(4, large_transfer_size=100)
+	large_blocker, _ = _start(lambda fn: executor.submit_transfer(100, fn))
+
+	second_large_blocker = _Blocker()
+	second_large_ft = executor.submit_transfer(1000, second_large_blocker)
+
+	# Small transfers run on the other workers meanwhile
+	executor.submit_transfer(1, lambda: None).result(_TIMEOUT)
+	executor.submit_transfer(99, lambda: None).result(_TIMEOUT)
+
+	assert not second_large_blocker.started.is_set()
+
+	large_blocker.release()
+	second_large_blocker.release()
+	second_large_ft.result(_TIMEOUT)
+	executor.shutdown()
+
+
+def test_large_transfers_run_on_quarter_of_workers() -> None:
+	executor = scheduler.PriorityExecutor(8, large_transfer_size=100)
+	lock = threading.Lock()
+	running = 0
+	max_running = 0
+
+	def _transfer() -> None:
+		nonlocal running, max_running
+
+		with lock:
+			running += 1
+			max_running = max(max_running, running)
+
+		threading.Event().wait(0.01)
+
+		with lock:
+			running -= 1
+
+	fts = [executor.submit_transfer(100, _transfer) for _ in range(20)]
+	futures.wait(fts, _TIMEOUT)
+	executor.shutdown()
+
+	assert all(ft.done() and ft.exception() is None for ft in fts)
+	assert max_running <= 2
+
+
+def test_shutdown_drains_queued_tasks() -> None:
+	executor = scheduler.PriorityExecutor(1)
+	blocker, blocker_ft = _start(executor.submit)
+	fts = [executor.submit(lambda i=i: i) for i in range(3)]
+	fts.append(executor.submit_transfer(1, lambda: 'transfer'))
+
+	threading.Timer(0.05, blocker.release).start()
+	executor.shutdown()
+
+	assert blocker_ft.done()
+	assert [ft.result(0) for ft in fts] == [0, 1, 2, 'transfer']
+
+
+def test_shutdown_cancels_queued_tasks() -> None:
+	executor = scheduler.PriorityExecutor(1)
+	blocker, blocker_ft = _start(executor.submit)
+	fts = [executor.submit(lambda: None), executor.submit_transfer(1, lambda: None)]
+
+	executor.shutdown(wait=False, cancel_futures=True)
+
+	assert all(ft.cancelled() for ft in fts)
+
+	# The running task is completed
+	blocker.release()
+	blocker_ft.result(_TIMEOUT)
+	executor.shutdown()
+
+
+def test_submit_after_shutdown_fails() -> None:
+	executor = scheduler.PriorityExecutor(1)
+	executor.shutdown()
+
+	with pytest.raises(RuntimeError):
+		executor.submit(lambda: None)
+
+	with pytest.raises(RuntimeError):
+		executor.submit_transfer(1, lambda: None)
+
+
+def test_failed_task_sets_exception() -> None:
+	executor = scheduler.PriorityExecutor(1)
+
+	def _fail() -> None:
+		raise ValueError('failed')
+
+	with pytest.raises(ValueError, match='failed'):
+		executor.submit(_fail).result(_TIMEOUT)
+
+	assert executor.submit(lambda: 'next').result(_TIMEOUT) == 'next'
+	executor.shutdown()
@@ -0,0 +1,154 @@
+import pathlib
+import typing as tp
+
+import pytest
+
+from confluence_sync import context, spill
+
+
+@pytest.fixture
+def database(tmp_path: pathlib.Path) -> tp.Generator[spill.SpillDatabase, None, None]:
+	database = spill.SpillDatabase(tmp_path)
+	yield database
+	database.close()
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def page_index(request: pytest.FixtureRequest, database: spill.SpillDatabase) -> context.PageIndex:
+	"""Both indexes must behave the same, so every test runs on both of them."""
+	if request.param == 'memory':
+		return context.PageIndex()
+
+	return database.page_index()
+
+
+def _add_pages(page_index: context.PageIndex) -> None:
+	page_index.add_page(context.Page('1', 'SP', 'Root'))
+	page_index.add_page(context.Page('2', 'SP', 'Child', src_parent_id='1'))
+	page_index.add_page(context.Page('3', 'SP', 'Grandchild', src_parent_id='2'))
+	page_index.add_page(context.Page('4', 'SP', 'Other child', src_parent_id='1'))
+	page_index.add_page(context.Page('5', 'OTHER', 'Child'))
+
+
+def test_add_page(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+
+	assert page_index.count == 5
+	assert [page.src_id for page in page_index.pages()] == ['1', '2', '3', '4', '5']
+	assert page_index.search_by_id('3') == context.Page('3', 'SP', 'Grandchild', src_parent_id='2')
+	assert page_index.search_by_id('6') is None
+
+
+def test_search_by_title(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+
+	assert page_index.search_by_title('SP', 'Child').src_id == '2'
+	assert page_index.search_by_title('OTHER', 'Child').src_id == '5'
+	assert page_index.search_by_title('SP', 'Missing') is None
+	assert page_index.search_by_title('MISSING', 'Child') is None
+
+
+def test_rename_page(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+	page_index.rename_page('2', 'Renamed')
+
+	assert page_index.search_by_title('SP', 'Child') is None
+	assert page_index.search_by_title('SP', 'Renamed').src_id == '2'
+	assert page_index.search_by_id('2').src_title == 'Renamed'
+	assert page_index.search_by_title('OTHER', 'Child').src_id == '5'
+
+
+def test_move_page(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+	page_index.move_page('3', '4')
+
+	assert page_index.search_by_id('3').src_parent_id == '4'
+	assert page_index.is_descendant('3', '4')
+	assert not page_index.is_descendant('3', '2')
+
+
+def test_set_dst_id(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+	page_context = page_index.search_by_id('2')
+	page_index.set_dst_id(page_context, '20')
+
+	assert page_context.dst_id == '20'
+	assert page_index.search_by_id('2').dst_id == '20'
+	assert page_index.search_by_title('SP', 'Child').dst_id == '20'
+
+
+def test_is_descendant(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+
+	assert page_index.is_descendant('3', '1')
+	assert page_index.is_descendant('3', '2')
+	assert page_index.is_descendant('4', '1')
+	assert not page_index.is_descendant('1', '3')
+	assert not page_index.is_descendant('4', '2')
+	assert not page_index.is_descendant('1', '1')
+	assert not page_index.is_descendant('5', '1')
+	assert not page_index.is_descendant('6', '1')
+
+
+def test_pages_skip_pages_added_meanwhile(page_index: context.PageIndex) -> None:
+	_add_pages(page_index)
+	page_ids = []
+
+	for page in page_index.pages():
+		page_ids.append(page.src_id)
+		page_index.add_page(context.Page(page.src_id + '0', 'SP', page.src_title + ' copy'))
+
+	assert page_ids == ['1', '2', '3', '4', '5']
+	assert page_index.count == 10
+
+
+def test_queue_fifo(database: spill.SpillDatabase) -> None:
+	queue = database.queue()
+
+	for i in range(5):
+		queue.append((str(i), {'id': i}))
+
+	assert len(queue) == 5
+	assert [queue.popleft() for _ in range(3)] == [('0', {'id': 0}), ('1', {'id': 1}), ('2', {'id': 2})]
+
+	queue.append(('5', {'id': 5}))
+
+	assert len(queue) == 3
+	assert [queue.popleft() for _ in range(3)] == [('3', {'id': 3}), ('4', {'id': 4}), ('5', {'id': 5})]
+	assert not queue
+
+	with pytest.raises(IndexError):
+		queue.popleft()
+
+
+def test_queue_keeps_items_in_database(database: spill.SpillDatabase) -> None:
+	queue = database.queue()
+	item = {'body': 'x' * 1000}
+	queue.append(item)
+
+	# The item is pickled, so changes made after it is appended aren't kept
+	item['body'] = 'changed'
+
+	assert queue.popleft() == {'body': 'x' * 1000}
+
+
+def test_queues_are_independent(database: spill.SpillDatabase) -> None:
+	first_queue = database.queue()
+	second_queue = database.queue()
+
+	first_queue.append(1)
+	second_queue.append(2)
+
+	assert first_queue.popleft() == 1
+	assert second_queue.popleft() == 2
+
+
+def test_database_file_is_removed(tmp_path: pathlib.Path) -> None:
+	database = spill.SpillDatabase(tmp_path)
+	database.queue().append(1)
+
+	assert list(tmp_path.iterdir())
+
+	database.close()
+
+	assert not list(tmp_path.iterdir())
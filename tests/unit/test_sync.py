@@ -0,0 +1,338 @@
+import datetime as dt
+import itertools
+import logging
+import operator
+import threading
+import time
+import typing as tp
+
+import pytest
+
+from confluence_sync import scheduler, sync
+from tests.unit.fakes import FakeConfluence, FakeSite
+
+
+def _inc_drawio(page_id: str, diagram_name: str) -> str:
+	return (
+		f'<ac:structured-macro ac:name="inc-drawio" ac:macro-id="inc-{diagram_name}">'
+		'<ac:parameter ac:name="includedDiagram">1</ac:parameter>'
+		f'<ac:parameter ac:name="pageId">{page_id}</ac:parameter>'
+		f'<ac:parameter ac:name="diagramName">{diagram_name}</ac:parameter>'
+		'</ac:structured-macro>'
+	)
+
+
+def test_page_including_own_diagram_isnt_postponed(
+	caplog: pytest.LogCaptureFixture,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	page_id = src_site.search_by_title('SRC', 'Child 1')
+	src_site.pages[page_id]['body'] = '<p>child 1</p>' + _inc_drawio(page_id, 'diagram')
+	src_site.attachments[page_id]['diagram'] = b'<mxfile/>'
+
+	with caplog.at_level(logging.INFO, logger='confluence-sync'):
+		synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None).run()
+
+	assert not any('reference each other' in message for message in caplog.messages)
+	assert dst_site.search_by_title('DST', 'Child 1') is not None
+
+
+def test_stopped_run_discards_prefetched_attachments(
+	monkeypatch: pytest.MonkeyPatch,
+	synchronizer: sync.ConfluenceSynchronizer,
+	dst_site: FakeSite,
+) -> None:
+	session = synchronizer.sync_page_hierarchy(
+		'SRC', 'Root', None, 'DST', None, None, deadline=dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=1),
+	)
+	# The deadline is reached once the root page and one of its children are copied
+	monkeypatch.setattr(session, '_is_deadline_reached', lambda: len(dst_site.pages) >= 3)
+
+	with pytest.raises(sync.DeadlineReached):
+		session.run()
+
+	assert not session._prefetched_attachments
+
+
+def test_failed_run_discards_prefetched_attachments(
+	monkeypatch: pytest.MonkeyPatch,
+	synchronizer: sync.ConfluenceSynchronizer,
+) -> None:
+	create_page = FakeConfluence.create_page
+
+	def _failing_create_page(self: FakeConfluence, space: str, title: str, *args, **kwargs) -> dict:
+		if title == 'Child 1':
+			raise RuntimeError('Destination is unavailable')
+
+		return create_page(self, space, title, *args, **kwargs)
+
+	monkeypatch.setattr(FakeConfluence, 'create_page', _failing_create_page)
+	session = synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None)
+
+	with pytest.raises(RuntimeError):
+		session.run()
+
+	assert not session._prefetched_attachments
+
+
+def test_key_locks_dont_block_other_keys() -> None:
+	locks = sync._KeyLocks()
+	held = threading.Event()
+	release = threading.Event()
+
+	def _hold() -> None:
+		with locks.hold('1'):
+			held.set()
+			release.wait()
+
+	thread = threading.Thread(target=_hold)
+	thread.start()
+	held.wait()
+
+	with locks.hold('2'):
+		assert len(locks) == 2
+
+	release.set()
+	thread.join()
+
+	assert len(locks) == 0
+
+
+def test_uploads_to_different_pages_run_concurrently(
+	monkeypatch: pytest.MonkeyPatch,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	attach_content = FakeConfluence.attach_content
+	upload_numbers = itertools.count()
+	# The first upload waits until another page's upload starts
+	other_upload_started = threading.Event()
+	overlapped = []
+
+	def _attach_content(self: FakeConfluence, *args, **kwargs) -> None:
+		if next(upload_numbers) == 0:
+			overlapped.append(other_upload_started.wait(5))
+		else:
+			other_upload_started.set()
+
+		attach_content(self, *args, **kwargs)
+
+	monkeypatch.setattr(FakeConfluence, 'attach_content', _attach_content)
+	synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None).run()
+
+	assert overlapped == [True]
+	assert dst_site.tree(dst_site.search_by_title('DST', 'Root')) == src_site.tree(src_site.search_by_title('SRC', 'Root'))
+
+
+def test_only_attachment_listings_of_pages_with_diagrams_are_cached(
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+) -> None:
+	page_id = src_site.search_by_title('SRC', 'Child 1')
+	src_site.attachments[page_id]['diagram'] = b'<mxfile/>'
+	src_site.attachments[page_id]['diagram.png'] = b'png'
+	session = synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None)
+
+	session.run()
+
+	assert session._attachment_cache.get_listing(page_id) is not None
+	assert session._attachment_cache.get_listing(src_site.search_by_title('SRC', 'Child 0')) is None
+	assert session._attachment_cache.get_listing(src_site.search_by_title('SRC', 'Root')) is None
+
+
+def _run_watched_session(synchronizer: sync.ConfluenceSynchronizer) -> sync._ConfluenceSynchronizerSession:
+	session = synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None)
+	session.run()
+
+	return session
+
+
+def _assert_synced(src_site: FakeSite, dst_site: FakeSite) -> None:
+	assert dst_site.tree(dst_site.search_by_title('DST', 'Root')) == src_site.tree(src_site.search_by_title('SRC', 'Root'))
+
+
+def test_sync_changes_updates_edited_page(
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	session = _run_watched_session(synchronizer)
+	page_id = src_site.search_by_title('SRC', 'Child 1')
+	src_site.pages[page_id]['body'] = '<p>edited</p>'
+	src_site.modified_page_ids.add(page_id)
+
+	assert session.sync_changes(60) == 1
+
+	_assert_synced(src_site, dst_site)
+	assert dst_site.pages[dst_site.search_by_title('DST', 'Child 1')]['version'] == 2
+	assert session._total_page_count == session._synced_paged_count == 8
+
+
+def test_sync_changes_renames_page(
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	session = _run_watched_session(synchronizer)
+	page_id = src_site.search_by_title('SRC', 'Child 1')
+	src_site.pages[page_id]['title'] = 'Renamed child'
+	src_site.modified_page_ids.add(page_id)
+
+	assert session.sync_changes(60) == 1
+
+	_assert_synced(src_site, dst_site)
+	assert dst_site.search_by_title('DST', 'Child 1') is None
+	assert session._page_index.search_by_title('SRC', 'Renamed child').src_id == page_id
+	assert session._total_page_count == session._synced_paged_count == 8
+
+
+def test_sync_changes_moves_page_under_another_parent(
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	session = _run_watched_session(synchronizer)
+	page_id = src_site.search_by_title('SRC', 'Child 2')
+	src_site.pages[page_id]['parent_id'] = src_site.search_by_title('SRC', 'Child 0')
+	src_site.modified_page_ids.add(page_id)
+
+	assert session.sync_changes(60) == 1
+
+	_assert_synced(src_site, dst_site)
+	assert session._page_index.search_by_id(page_id).src_parent_id == src_site.search_by_title('SRC', 'Child 0')
+	assert session._total_page_count == session._synced_paged_count == 8
+
+
+def test_sync_changes_copies_new_subtree(
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	session = _run_watched_session(synchronizer)
+	new_page_id = src_site.add_page('SRC', 'New child', src_site.search_by_title('SRC', 'Child 0'), '<p>new</p>')
+	new_grandchild_id = src_site.add_page('SRC', 'New grandchild', new_page_id, '<p>new grandchild</p>')
+	src_site.modified_page_ids.update((new_page_id, new_grandchild_id))
+
+	assert session.sync_changes(60) == 2
+
+	_assert_synced(src_site, dst_site)
+	assert session._page_index.count == 9
+	assert session._total_page_count == session._synced_paged_count == 9
+
+
+def test_sync_changes_copies_changed_attachments_only(
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	session = _run_watched_session(synchronizer)
+	page_id = src_site.search_by_title('SRC', 'Child 1')
+	src_site.update_attachment(page_id, 'file1.txt', b'changed content')
+
+	assert session.sync_changes(60) == 1
+
+	_assert_synced(src_site, dst_site)
+	assert all(page['version'] == 1 for page in dst_site.pages.values())
+	assert session._total_page_count == session._synced_paged_count == 7
+
+
+@pytest.fixture
+def bounded_tasks() -> tp.Generator[sync._BoundedTasks, None, None]:
+	executors = [scheduler.PriorityExecutor(2) for _ in range(3)]
+	yield sync._BoundedTasks(*executors, max_tasks=1, max_transfers=1)
+
+	for executor in executors:
+		executor.shutdown(cancel_futures=True)
+
+
+def _run_in_thread() -> threading.Thread:
+	return threading.current_thread()
+
+
+def test_bounded_tasks_run_task_inline_when_full(bounded_tasks: sync._BoundedTasks) -> None:
+	released = threading.Event()
+	blocked_ft = bounded_tasks.submit(released.wait, 5)
+
+	inline_ft = bounded_tasks.submit(_run_in_thread)
+	# Reads and transfers have their own limits
+	read_ft = bounded_tasks.submit_read(_run_in_thread)
+	transfer_ft = bounded_tasks.submit_transfer(1, _run_in_thread)
+
+	assert inline_ft.done() and inline_ft.result() is threading.current_thread()
+	assert read_ft.result(5) is not threading.current_thread()
+	assert transfer_ft.result(5) is not threading.current_thread()
+
+	released.set()
+	bounded_tasks.wait()
+
+	assert blocked_ft.result() is True
+
+
+def test_bounded_tasks_raise_error_of_inline_task(bounded_tasks: sync._BoundedTasks) -> None:
+	released = threading.Event()
+	bounded_tasks.submit(released.wait, 5)
+
+	ft = bounded_tasks.submit(operator.truediv, 1, 0)
+
+	assert isinstance(ft.exception(), ZeroDivisionError)
+
+	with pytest.raises(ZeroDivisionError):
+		bounded_tasks.raise_error()
+
+	# The error is raised once
+	bounded_tasks.raise_error()
+	released.set()
+	bounded_tasks.wait()
+
+
+def test_bounded_tasks_wait_raises_error_and_releases_place(bounded_tasks: sync._BoundedTasks) -> None:
+	bounded_tasks.submit(operator.truediv, 1, 0)
+
+	with pytest.raises(ZeroDivisionError):
+		bounded_tasks.wait()
+
+	# The failed task doesn't keep its place
+	ft = bounded_tasks.submit(_run_in_thread)
+
+	assert ft.result(5) is not threading.current_thread()
+
+	bounded_tasks.wait()
+
+
+def test_bounded_tasks_wait_for_tasks_submitted_meanwhile(bounded_tasks: sync._BoundedTasks) -> None:
+	results = []
+
+	def _submit_next() -> None:
+		time.sleep(0.05)
+		bounded_tasks.submit_read(results.append, 'read')
+		results.append('work')
+
+	bounded_tasks.submit(_submit_next)
+	bounded_tasks.wait()
+
+	assert sorted(results) == ['read', 'work']
+
+
+def test_page_waits_for_page_of_included_diagram(
+	caplog: pytest.LogCaptureFixture,
+	synchronizer: sync.ConfluenceSynchronizer,
+	src_site: FakeSite,
+	dst_site: FakeSite,
+) -> None:
+	page_id = src_site.search_by_title('SRC', 'Child 0')
+	ref_page_id = src_site.search_by_title('SRC', 'Grandchild 2')
+	src_site.pages[page_id]['body'] = '<p>child 0</p>' + _inc_drawio(ref_page_id, 'diagram')
+	src_site.attachments[ref_page_id]['diagram'] = b'<mxfile/>'
+
+	with caplog.at_level(logging.INFO, logger='confluence-sync'):
+		synchronizer.sync_page_hierarchy('SRC', 'Root', None, 'DST', None, None).run()
+
+	dst_page = dst_site.pages[dst_site.search_by_title('DST', 'Child 0')]
+
+	assert not any('reference each other' in message for message in caplog.messages)
+	# The page is written once, with the ID of the copied page
+	assert dst_page['version'] == 1
+	assert f'<ac:parameter ac:name="pageId">{dst_site.search_by_title("DST", "Grandchild 2")}</ac:parameter>' in dst_page['body']
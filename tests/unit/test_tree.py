@@ -0,0 +1,51 @@
+import pytest
+
+from confluence_sync import tree
+
+
+def _subtree(name: str, child_count: int) -> tree.Node[str]:
+	node = tree.Node(name, name)
+
+	for i in range(child_count):
+		child = tree.Node(f'{name}.{i}', f'{name}.{i}')
+		child.add_child(tree.Node(f'{name}.{i}.0', f'{name}.{i}.0'))
+		node.add_child(child)
+
+	return node
+
+
+def test_add_child_with_children_updates_counts_of_ancestors() -> None:
+	root = tree.Node()
+	parent = _subtree('a', 1)
+	root.add_child(parent)
+
+	parent.find_child('a.0').add_child(_subtree('b', 2))
+
+	assert root.descendants_count == 1 + 2 + 1 + 2 * 2
+	assert parent.descendants_count == 2 + 1 + 2 * 2
+	assert parent.find_child('a.0').descendants_count == 1 + 1 + 2 * 2
+	assert [node.data for node in root.descendants()] == [
+		'a', 'a.0', 'a.0.0', 'b', 'b.0', 'b.1', 'b.0.0', 'b.1.0',
+	]
+
+
+def test_add_child_with_children_keeps_their_index() -> None:
+	root = tree.Node()
+	subtree = _subtree('a', 2)
+	root.add_child(subtree)
+
+	assert root.find_child('a') is subtree
+	assert subtree.find_child('a.1').parent is subtree
+	assert subtree.find_child('a.1').find_child('a.1.0').data == 'a.1.0'
+	assert root.find_child('a.1') is None
+
+
+def test_add_child_rejects_node_with_parent() -> None:
+	root = tree.Node()
+	subtree = _subtree('a', 1)
+	root.add_child(subtree)
+
+	with pytest.raises(ValueError):
+		tree.Node().add_child(subtree.find_child('a.0'))
+
+	assert root.descendants_count == 3